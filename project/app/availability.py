@@ -0,0 +1,43 @@
+"""Slot occupancy of one clinic on one day of the week.
+
+``get_clinic_day_occupancy`` reads the clinic's active slots and, with a
+single join over the ``DoctorSchedule.clinic_slot`` through table, which of
+them an active schedule of a live doctor already holds. Two queries answer
+any number of slots.
+"""
+from app.models import ClinicSlot, DoctorSchedule
+
+
+class ClinicDayOccupancy:
+    def __init__(self, slots, owners):
+        self.slots = slots
+        self.owners = owners  # slot id -> doctor name
+
+    def to_json(self):
+        return [
+            slot.to_json(is_available=slot.id not in self.owners, doctor_name=self.owners.get(slot.id))
+            for slot in self.slots
+        ]
+
+
+def get_clinic_day_occupancy(branch, clinic_id, day_of_week_id):
+    """Return the ``ClinicDayOccupancy`` of a clinic on a day of the week, in two queries."""
+    slots = list(
+        ClinicSlot.objects.filter(clinic_id=clinic_id, clinic__branch=branch, is_active=True)
+        .select_related("clinic")
+        .order_by("start_time", "id")
+    )
+    links = DoctorSchedule.clinic_slot.through.objects.filter(
+        clinicslot__clinic_id=clinic_id,
+        doctorschedule__branch=branch,
+        doctorschedule__day_of_week_id=day_of_week_id,
+        doctorschedule__is_active=True,
+        doctorschedule__deleted_date__isnull=True,
+        doctorschedule__doctor__deleted_date__isnull=True,
+    )
+    owners = {}
+    for slot_id, doctor_name in links.order_by("doctorschedule_id").values_list(
+        "clinicslot_id", "doctorschedule__doctor__full_name",
+    ):
+        owners.setdefault(slot_id, doctor_name)
+    return ClinicDayOccupancy(slots, owners)
@@ -0,0 +1,183 @@
+"""Capacity-aware appointment booking.
+
+Each live appointment that is not cancelled holds a place in the clinic slot
+containing its time, counted in a ``SlotBooking`` row per (doctor, slot, day)
+that also carries the slot's ``capacity``. ``book_appointment`` takes a place
+with one conditional UPDATE::
+
+    UPDATE app_slotbooking SET booked = booked + 1
+    WHERE doctor_id = %s AND slot_id = %s AND date = %s
+      AND (capacity IS NULL OR booked < capacity)
+
+so the unique (doctor, slot, date) row is the only thing concurrent bookings
+contend on, and a full slot raises ``SlotFull`` instead of over-booking.
+``rebook_appointment`` does the same for an edit that moves an appointment
+into another slot or reopens a cancelled one. Receivers in ``app.signals``
+give places back on edits, cancellations and deletions with ``F()``
+updates. A missing row is seeded from the appointments already in the slot
+when a booking first needs it.
+
+Appointments outside every clinic slot (walk-ins) are not counted.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from app.models import Appointment, ClinicSlot, SlotBooking
+
+# Appointments in these statuses give their place back.
+RELEASING_STATUSES = ("CANCELLED",)
+
+BOOKING_FIELDS = ("doctor_id", "clinic_id", "date", "time", "deleted_date", "status__name")
+
+
+class SlotFull(Exception):
+    def __init__(self, slot):
+        self.slot = slot
+        super().__init__(f"Slot {slot.start_time:%H:%M}-{slot.end_time:%H:%M} is full")
+
+
+def find_slot(clinic_id, time, slots=None):
+    """Return the active ClinicSlot of ``clinic_id`` containing ``time``, or None.
+
+    ``slots`` optionally memoizes the lookups across calls.
+    """
+    if slots is not None and (clinic_id, time) in slots:
+        return slots[clinic_id, time]
+    slot = (
+        ClinicSlot.objects.filter(clinic_id=clinic_id, is_active=True, start_time__lte=time)
+        # A slot ending at or before its start runs to midnight.
+        .filter(Q(end_time__gt=time) | Q(end_time__lte=F("start_time")))
+        .order_by("-start_time")
+        .first()
+    )
+    if slots is not None:
+        slots[clinic_id, time] = slot
+    return slot
+
+
+def slot_containing(slots, time):
+    """In-memory ``find_slot``: the slot of ``slots`` (one clinic) containing ``time``, or None."""
+    found = None
+    for slot in slots:
+        if slot.start_time <= time and (time < slot.end_time or slot.end_time <= slot.start_time):
+            if found is None or slot.start_time > found.start_time:
+                found = slot
+    return found
+
+
+def get_booking_key(values, slots=None):
+    """Return ``(doctor_id, slot, date)`` for appointment ``values`` (``BOOKING_FIELDS``), or None."""
+    if values["deleted_date"] is not None or values["status__name"] in RELEASING_STATUSES:
+        return None
+    if None in (values["doctor_id"], values["clinic_id"], values["date"], values["time"]):
+        return None
+    slot = find_slot(values["clinic_id"], values["time"], slots)
+    if slot is None:
+        return None
+    return values["doctor_id"], slot, values["date"]
+
+
+def booking_state(values):
+    """The parts of ``values`` (``BOOKING_FIELDS``) its booking key depends on, without the slot lookup.
+
+    Equal states give equal keys, so callers compare states before paying for ``find_slot``.
+    """
+    return (
+        values["doctor_id"], values["clinic_id"], values["date"], values["time"],
+        values["deleted_date"] is None, values["status__name"] in RELEASING_STATUSES,
+    )
+
+
+def get_instance_booking_values(appointment):
+    """``BOOKING_FIELDS`` of an Appointment instance."""
+    values = {field: getattr(appointment, field) for field in BOOKING_FIELDS if "__" not in field}
+    values["status__name"] = appointment.status.name if appointment.status_id else None
+    return values
+
+
+def get_instance_booking_key(appointment):
+    """``get_booking_key`` for an Appointment instance."""
+    return get_booking_key(get_instance_booking_values(appointment))
+
+
+def _seed_booked(doctor_id, slot, date):
+    appointments = Appointment.objects.filter(
+        doctor_id=doctor_id, clinic_id=slot.clinic_id, date=date, time__gte=slot.start_time,
+    ).exclude(status__name__in=RELEASING_STATUSES)
+    if slot.end_time > slot.start_time:
+        appointments = appointments.filter(time__lt=slot.end_time)
+    return appointments.aggregate(count=Count("id"))["count"]
+
+
+def _counter(key):
+    doctor_id, slot, date = key
+    return SlotBooking.objects.filter(doctor_id=doctor_id, slot_id=slot.id, date=date)
+
+
+def _create_counter(key):
+    doctor_id, slot, date = key
+    SlotBooking.objects.get_or_create(
+        doctor_id=doctor_id, slot_id=slot.id, date=date,
+        defaults={"booked": _seed_booked(doctor_id, slot, date), "capacity": slot.capacity},
+    )
+
+
+def reserve(key):
+    """Take one place in the slot of ``key`` or raise ``SlotFull``."""
+    free = Q(capacity__isnull=True) | Q(booked__lt=F("capacity"))
+    if _counter(key).filter(free).update(booked=F("booked") + 1):
+        return
+    if not _counter(key).exists():
+        _create_counter(key)
+        if _counter(key).filter(free).update(booked=F("booked") + 1):
+            return
+    raise SlotFull(key[1])
+
+
+def adjust(key, delta):
+    """Add ``delta`` places to the counter of ``key`` without a capacity check.
+
+    A counter that does not exist yet is left alone: ``reserve`` seeds it from
+    the appointments as they are when it is first needed.
+    """
+    if key is None or not delta:
+        return
+    counter = _counter(key)
+    if delta < 0:
+        counter = counter.filter(booked__gte=-delta)
+    counter.update(booked=F("booked") + delta)
+
+
+def book_appointment(**values):
+    """Create an appointment after taking its place in the slot; raises ``SlotFull``."""
+    appointment = Appointment(**values)
+    # Resolved before the transaction so its first statement is the UPDATE (SQLite
+    # then takes the write lock up front instead of failing to upgrade a read lock).
+    key = get_instance_booking_key(appointment)
+    with transaction.atomic():
+        if key is not None:
+            reserve(key)
+        # Tells the post_save receiver the place is already taken.
+        appointment._reserved_booking = key
+        appointment.save()
+    return appointment
+
+
+def rebook_appointment(appointment):
+    """Save an edited ``appointment``, first taking a place in the slot it moves into; raises ``SlotFull``.
+
+    The place it held before is given back by the post_save receiver.
+    """
+    held = Appointment.all_objects.filter(pk=appointment.pk).values(*BOOKING_FIELDS).first()
+    values = get_instance_booking_values(appointment)
+    key = None
+    if held is None or booking_state(held) != booking_state(values):
+        key = get_booking_key(values)
+        if key is not None and held is not None and get_booking_key(held) == key:
+            key = None
+    with transaction.atomic():
+        if key is not None:
+            reserve(key)
+            appointment._reserved_booking = key
+        appointment.save()
+    return appointment
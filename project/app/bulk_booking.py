@@ -0,0 +1,312 @@
+"""Batch appointment booking for call-center series and rebookings.
+
+``expand_items`` turns a request body into a list of appointment items,
+either given one by one (``appointments``) or generated from a recurrence
+rule (``template`` + ``recurrence``). ``book_batch`` then books them with a
+fixed number of queries, however many items there are:
+
+- patients, doctors, clinics and statuses are resolved with one ``IN`` query
+  each;
+- items are checked in memory against the cached schedule board (the doctor
+  must be scheduled in that clinic at that time), against the patient's
+  other appointments with the same doctor that day, and against slot
+  capacity (``app.booking``);
+- the accepted items take their places with one conditional UPDATE per
+  (doctor, slot, day) and are inserted with one ``bulk_create``, all in one
+  transaction.
+
+Each item gets its own result, so one bad row does not reject the batch.
+"""
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from app.booking import RELEASING_STATUSES, slot_containing
+from app.helpers import get_local_now, parse_time
+from app.models import Appointment, Clinic, ClinicSlot, DaysOfWeek, Doctor, Patient, SlotBooking, Status
+from app.schedule_board import DAY_NAMES_AR, DAY_NAMES_EN
+from app.schedule_cache import entries_valid_on, get_week_board
+from app.stats import StatsDelta, get_contribution
+from app.templatetags.helpers import get_id_hashed_of_object
+
+ERROR_MESSAGES = {
+    "invalid": "بيانات الموعد غير صحيحة",
+    "patient_not_found": "المريض غير موجود",
+    "doctor_not_found": "الطبيب غير موجود",
+    "clinic_not_found": "العيادة غير موجودة",
+    "outside_schedule": "الطبيب غير متاح في هذه العيادة في هذا الوقت",
+    "duplicate": "هذا المريض لديه موعد مع نفس الطبيب في نفس التاريخ",
+    "slot_full": "هذه الفترة ممتلئة لهذا الطبيب",
+}
+
+
+class BatchRequestError(ValueError):
+    """The request body itself is malformed (as opposed to one of its items)."""
+
+
+def _max_items():
+    return getattr(settings, "BULK_APPOINTMENTS_MAX", 200)
+
+
+def _parse_date(value):
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def expand_items(payload):
+    """Return the appointment items of a batch request body."""
+    if not isinstance(payload, dict):
+        raise BatchRequestError("Expected a JSON object")
+    if "recurrence" in payload:
+        template, rule = payload.get("template"), payload["recurrence"]
+        if not isinstance(template, dict) or not isinstance(rule, dict):
+            raise BatchRequestError("recurrence needs a template object and a rule object")
+        try:
+            start = _parse_date(rule["start_date"])
+            interval = int(rule.get("interval_days", 7))
+            count = int(rule.get("count", 0))
+            until = _parse_date(rule["until"]) if rule.get("until") else None
+        except (KeyError, TypeError, ValueError):
+            raise BatchRequestError("recurrence needs start_date (YYYY-MM-DD), count and optional interval_days/until")
+        if interval < 1 or (count < 1 and until is None):
+            raise BatchRequestError("recurrence needs interval_days >= 1 and a count or an until date")
+        limit = count if count > 0 else _max_items() + 1
+        items = []
+        date = start
+        while len(items) < limit and (until is None or date <= until):
+            items.append({**template, "date": date.isoformat()})
+            date += timedelta(days=interval)
+    else:
+        items = payload.get("appointments")
+        if not isinstance(items, list):
+            raise BatchRequestError("Expected an appointments list or a recurrence rule")
+    if not items:
+        raise BatchRequestError("No appointments to book")
+    if len(items) > _max_items():
+        raise BatchRequestError(f"At most {_max_items()} appointments per request")
+    return items
+
+
+def _parse_item(item):
+    """Return the parsed fields of one item, or None if it is malformed."""
+    if not isinstance(item, dict):
+        return None
+    try:
+        parsed = {
+            "patient_id": int(item["patient_id"]),
+            "doctor_id": int(item["doctor_id"]),
+            "clinic_id": int(item["clinic_id"]) if item.get("clinic_id") not in (None, "") else None,
+            "clinic_name": item.get("clinic"),
+            "date": _parse_date(item["date"]),
+            "time": parse_time(item.get("time")),
+            "status": item.get("status") or "OPEN",
+            "service_type": item.get("service_type") or "consultation",
+            "service_price": Decimal(str(item.get("service_price") or 0)),
+            "notes": item.get("notes", ""),
+        }
+    except (KeyError, TypeError, ValueError, InvalidOperation):
+        return None
+    if parsed["time"] is None or (parsed["clinic_id"] is None and not parsed["clinic_name"]):
+        return None
+    return parsed
+
+
+def _in_schedule(entries, doctor_id, clinic_id, time):
+    for entry in entries:
+        if entry["doctor_id"] != doctor_id or entry["clinic_id"] != clinic_id:
+            continue
+        if not entry["is_active"] or entry["doctor_deleted"]:
+            continue
+        for start_time, end_time in entry["merged_ranges"]:
+            if start_time <= time and (time < end_time or end_time <= start_time):
+                return True
+    return False
+
+
+def _load_counters(keys):
+    """Return ``{key: [booked, capacity]}`` for booking keys, creating missing SlotBooking rows."""
+    if not keys:
+        return {}
+    doctor_ids = {doctor_id for doctor_id, _, _ in keys}
+    slot_ids = {slot.id for _, slot, _ in keys}
+    dates = {date for _, _, date in keys}
+    counters = {}
+    rows = SlotBooking.objects.filter(doctor_id__in=doctor_ids, slot_id__in=slot_ids, date__in=dates)
+    existing = {(row.doctor_id, row.slot_id, row.date): row for row in rows}
+    missing = []
+    for key in keys:
+        doctor_id, slot, date = key
+        row = existing.get((doctor_id, slot.id, date))
+        if row is not None:
+            counters[key] = [row.booked, row.capacity]
+        else:
+            missing.append(key)
+    if missing:
+        # Seed the new counters from the appointments already booked, in one grouped query.
+        booked = Counter()
+        slots_by_clinic = defaultdict(list)
+        for _, slot, _ in missing:
+            slots_by_clinic[slot.clinic_id].append(slot)
+        appointments = (
+            Appointment.objects.filter(
+                doctor_id__in={doctor_id for doctor_id, _, _ in missing},
+                clinic_id__in=slots_by_clinic,
+                date__in={date for _, _, date in missing},
+            )
+            .exclude(status__name__in=RELEASING_STATUSES)
+            .values("doctor_id", "clinic_id", "date", "time")
+            .annotate(count=Count("id"))
+            .order_by()
+        )
+        for row in appointments:
+            slot = slot_containing(slots_by_clinic[row["clinic_id"]], row["time"])
+            if slot is not None:
+                booked[row["doctor_id"], slot.id, row["date"]] += row["count"]
+        for doctor_id, slot, date in missing:
+            counters[doctor_id, slot, date] = [booked[doctor_id, slot.id, date], slot.capacity]
+        SlotBooking.objects.bulk_create(
+            [
+                SlotBooking(doctor_id=doctor_id, slot=slot, date=date, booked=booked[doctor_id, slot.id, date],
+                            capacity=slot.capacity)
+                for doctor_id, slot, date in missing
+            ],
+            ignore_conflicts=True,
+        )
+    return counters
+
+
+def book_batch(user, items):
+    """Book ``items`` (see ``expand_items``) for ``user``'s branch; return one result dict per item."""
+    branch = user.branch
+    results = [None] * len(items)
+    parsed = {}
+    for index, item in enumerate(items):
+        values = _parse_item(item)
+        if values is None:
+            results[index] = _error(index, "invalid")
+        else:
+            parsed[index] = values
+
+    patients = Patient.objects.in_bulk({values["patient_id"] for values in parsed.values()})
+    doctors = Doctor.objects.in_bulk({values["doctor_id"] for values in parsed.values()})
+    clinic_ids = {values["clinic_id"] for values in parsed.values() if values["clinic_id"]}
+    clinic_names = {values["clinic_name"] for values in parsed.values() if not values["clinic_id"]}
+    clinics = list(Clinic.objects.filter(Q(id__in=clinic_ids) | Q(name__in=clinic_names), branch=branch))
+    clinics_by_id = {clinic.id: clinic for clinic in clinics}
+    clinics_by_name = {clinic.name: clinic for clinic in clinics}
+    status_names = {values["status"] for values in parsed.values()}
+    statuses = {status.name: status for status in Status.objects.filter(name__in=status_names)}
+    for name in status_names - set(statuses):
+        statuses[name], _ = Status.objects.get_or_create(name=name)
+
+    days = {}
+    for day in DaysOfWeek.objects.all():
+        for weekday in range(7):
+            if day.name in (DAY_NAMES_AR[weekday], DAY_NAMES_EN[weekday]):
+                days[weekday] = day.id
+    boards = get_week_board(branch, set(days.values())) if days else {}
+    slots = defaultdict(list)
+    for slot in ClinicSlot.objects.filter(clinic_id__in=[clinic.id for clinic in clinics], is_active=True):
+        slots[slot.clinic_id].append(slot)
+
+    taken = set(
+        Appointment.objects.filter(
+            branch=branch,
+            patient_id__in={values["patient_id"] for values in parsed.values()},
+            date__in={values["date"] for values in parsed.values()},
+        ).values_list("patient_id", "doctor_id", "date")
+    )
+
+    accepted = {}
+    for index, values in parsed.items():
+        patient = patients.get(values["patient_id"])
+        doctor = doctors.get(values["doctor_id"])
+        if values["clinic_id"]:
+            clinic = clinics_by_id.get(values["clinic_id"])
+        else:
+            clinic = clinics_by_name.get(values["clinic_name"])
+        if patient is None or patient.branch_id != branch.id:
+            results[index] = _error(index, "patient_not_found")
+        elif doctor is None:
+            results[index] = _error(index, "doctor_not_found")
+        elif clinic is None:
+            results[index] = _error(index, "clinic_not_found")
+        elif not _in_schedule(
+            entries_valid_on(boards.get(days.get(values["date"].weekday()), []), values["date"]),
+            doctor.id, clinic.id, values["time"],
+        ):
+            results[index] = _error(index, "outside_schedule")
+        elif (patient.id, doctor.id, values["date"]) in taken:
+            results[index] = _error(index, "duplicate")
+        else:
+            taken.add((patient.id, doctor.id, values["date"]))
+            slot = None
+            if statuses[values["status"]].name not in RELEASING_STATUSES:
+                slot = slot_containing(slots[clinic.id], values["time"])
+            accepted[index] = (values, patient, doctor, clinic, (doctor.id, slot, values["date"]) if slot else None)
+
+    counters = _load_counters({key for *_, key in accepted.values() if key is not None})
+    wanted = defaultdict(list)
+    for index, (*_, key) in list(accepted.items()):
+        if key is None:
+            continue
+        booked, capacity = counters[key]
+        if capacity is not None and booked + len(wanted[key]) >= capacity:
+            results[index] = _error(index, "slot_full")
+            del accepted[index]
+        else:
+            wanted[key].append(index)
+
+    now = get_local_now()
+    with transaction.atomic():
+        for key, indexes in wanted.items():
+            doctor_id, slot, date = key
+            count = len(indexes)
+            reserved = SlotBooking.objects.filter(doctor_id=doctor_id, slot_id=slot.id, date=date).filter(
+                Q(capacity__isnull=True) | Q(booked__lte=F("capacity") - count),
+            ).update(booked=F("booked") + count)
+            if not reserved:
+                # Filled by concurrent bookings since the counters were read.
+                for index in indexes:
+                    results[index] = _error(index, "slot_full")
+                    del accepted[index]
+
+        order = sorted(accepted)
+        appointments = Appointment.objects.bulk_create([
+            Appointment(
+                patient=patient, doctor=doctor, clinic=clinic, status=statuses[values["status"]],
+                service_type=values["service_type"], service_price=values["service_price"],
+                date=values["date"], time=values["time"], notes=values["notes"], branch=branch,
+                added_by=user, added_date=now, updated_by=user, updated_date=now,
+            )
+            for values, patient, doctor, clinic, _ in (accepted[index] for index in order)
+        ])
+
+        # bulk_create bypasses the post_save receivers that keep the stats tables.
+        delta = StatsDelta()
+        schedule_days = {}
+        for appointment in appointments:
+            delta.add(get_contribution({
+                "branch_id": branch.id, "doctor_id": appointment.doctor_id, "clinic_id": appointment.clinic_id,
+                "date": appointment.date, "time": appointment.time, "service_price": appointment.service_price,
+                "deleted_date": None, "status__name": appointment.status.name,
+            }, schedule_days))
+        delta.apply()
+
+    for index, appointment in zip(order, appointments):
+        results[index] = {
+            "index": index,
+            "success": True,
+            "id": appointment.id,
+            "hash_id": get_id_hashed_of_object(appointment.id),
+            "date": appointment.date.isoformat(),
+            "time": appointment.time.strftime("%H:%M"),
+        }
+    return results
+
+
+def _error(index, code):
+    return {"index": index, "success": False, "error": code, "message": ERROR_MESSAGES[code]}
@@ -1,11 +1,17 @@
 from datetime import datetime
+from django.db import transaction
 from django.utils import timezone
 from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render
-from app.templatetags.helpers import get_id_of_object, merge_continuous_slots
-from app.helpers import apply_doctor_branch_pricing, get_local_now, parse_time
-from app.models import Appointment, Clinic, ClinicSlot, DailyStats, Doctor, DoctorSchedule, Patient, PrintJob, ScheduleStats, Status, User ,Specialization , DaysOfWeek
-from django.db.models import Q, Sum, Count
+from app.templatetags.helpers import get_id_hashed_of_object, get_id_of_object
+from app.helpers import apply_doctor_branch_pricing_bulk, get_local_now, parse_time
+from app.schedule_board import build_schedule_board, get_board_rows, get_day_of_week
+from app.schedule_cache import entries_valid_on, get_day_board, get_week_board
+from app.stats import PAID_STATUSES, get_daily_stats, get_schedule_stats
+from app.tickets import assign_ticket_number, ticket_group
+from app.booking import SlotFull, book_appointment, rebook_appointment
+from app.bulk_booking import book_batch, expand_items
+from app.models import Appointment, Clinic, ClinicSlot, Doctor, DoctorSchedule, Patient, PrintJob, Status, User ,Specialization , DaysOfWeek
 import json
 
 from django.shortcuts import render, redirect
@@ -15,6 +21,8 @@ from datetime import datetime
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_POST
 
+SLOT_FULL_MESSAGE = "هذه الفترة ممتلئة لهذا الطبيب، يرجى اختيار وقت آخر"
+
 @login_required
 def list_of_appointments(request):
     days_of_week = DaysOfWeek.objects.filter(deleted_date__isnull=True)
@@ -54,87 +62,30 @@ def today_appointments(request):
 
     appointments = base_queryset
 
-    day_name_map_ar = [
-        "الاثنين",
-        "الثلاثاء",
-        "الاربعاء",
-        "الخميس",
-        "الجمعة",
-        "السبت",
-        "الاحد",
-    ]
-    day_name_map_en = [
-        "Monday",
-        "Tuesday",
-        "Wednesday",
-        "Thursday",
-        "Friday",
-        "Saturday",
-        "Sunday",
-    ]
-    weekday_index = today.weekday()
-    day_name_candidates = [
-        day_name_map_ar[weekday_index],
-        day_name_map_en[weekday_index],
-    ]
-    day_obj = DaysOfWeek.objects.filter(name__in=day_name_candidates).first()
-
-    schedules = DoctorSchedule.objects.filter(
-        branch=request.user.branch,
-        deleted_date__isnull=True,
-        is_active=True,
-    )
-    if day_obj:
-        schedules = schedules.filter(day_of_week=day_obj)
-    if selected_specialization_id:
-        schedules = schedules.filter(doctor__specialization_id=selected_specialization_id)
+    day_obj = get_day_of_week(today)
 
-    doctors = Doctor.objects.filter(deleted_date__isnull=True)
-    for doctor in doctors:
-        apply_doctor_branch_pricing(doctor, request.user.branch)
+    doctors = apply_doctor_branch_pricing_bulk(
+        Doctor.objects.filter(deleted_date__isnull=True),
+        request.user.branch,
+    )
     clinics = Clinic.objects.filter(branch=request.user.branch, deleted_date__isnull=True)
 
-    now_time = local_now.time()
-    now_minutes = now_time.hour * 60 + now_time.minute
-    is_current_day = today == local_now.date()
-    is_past_day = today < local_now.date()
-    is_future_day = today > local_now.date()
-    schedule_slots = []
-    for schedule in schedules.select_related("doctor", "clinic", "day_of_week"):
-        apply_doctor_branch_pricing(schedule.doctor, request.user.branch)
-        slots = schedule.clinic_slot.all().order_by("start_time")
-        merged_slots = merge_continuous_slots(slots)
-        for start_time, end_time in merged_slots:
-            start_minutes = start_time.hour * 60 + start_time.minute
-            end_minutes = end_time.hour * 60 + end_time.minute
-            if is_current_day:
-                is_active_now = start_minutes <= now_minutes <= end_minutes
-                is_past = now_minutes > end_minutes
-                is_upcoming = now_minutes < start_minutes
-            elif is_past_day:
-                is_active_now = False
-                is_past = True
-                is_upcoming = False
-            else:
-                is_active_now = False
-                is_past = False
-                is_upcoming = True
-            schedule_slots.append(
-                {
-                    "doctor_id": schedule.doctor_id,
-                    "clinic_id": schedule.clinic_id,
-                    "doctor_name": schedule.doctor.full_name,
-                    "specialization_name": schedule.doctor.specialization.name if schedule.doctor.specialization else "",
-                    "clinic_name": schedule.clinic.name,
-                    "consultation_price": schedule.doctor.consultation_price,
-                    "examination_price": schedule.doctor.examination_price,
-                    "start_time": start_time,
-                    "end_time": end_time,
-                    "is_active": is_active_now,
-                    "is_past": is_past,
-                    "is_upcoming": is_upcoming,
-                }
-            )
+    if day_obj:
+        board_entries = [
+            entry for entry in get_day_board(request.user.branch, day_obj.id)
+            if entry["is_active"]
+            and (not selected_specialization_id or str(entry["specialization_id"]) == str(selected_specialization_id))
+        ]
+        schedule_slots = get_board_rows(board_entries, today, local_now)
+    else:
+        schedules = DoctorSchedule.objects.filter(
+            branch=request.user.branch,
+            deleted_date__isnull=True,
+            is_active=True,
+        )
+        if selected_specialization_id:
+            schedules = schedules.filter(doctor__specialization_id=selected_specialization_id)
+        schedule_slots = build_schedule_board(schedules, request.user.branch, today, local_now)
 
     selected_start_time = parse_time(selected_start)
     selected_end_time = parse_time(selected_end)
@@ -153,63 +104,23 @@ def today_appointments(request):
 
     appointments = appointments.select_related("patient", "doctor", "clinic", "status").order_by("time")
 
-    paid_statuses = ["ARRIVED", "COMPLETED"]
-    day_agg = appointments.filter(status__name__in=paid_statuses).aggregate(
-        total=Sum("service_price"),
-        patients=Count("id"),
-    )
-    day_total_revenue = day_agg["total"] or 0
-    day_total_patients = day_agg["patients"] or 0
-
-    daily_stats, _ = DailyStats.objects.get_or_create(
-        branch=request.user.branch,
-        date=today,
-        defaults={
-            "total_revenue": day_total_revenue,
-            "total_patients": day_total_patients,
-        },
-    )
-    if daily_stats.total_revenue != day_total_revenue or daily_stats.total_patients != day_total_patients:
-        daily_stats.total_revenue = day_total_revenue
-        daily_stats.total_patients = day_total_patients
-        daily_stats.save()
+    daily_stats = get_daily_stats(request.user.branch, today)
+    day_total_revenue = daily_stats.total_revenue
+    day_total_patients = daily_stats.total_patients
 
     schedule_revenue = None
     schedule_patients_count = None
     if selected_start_time and selected_end_time and selected_doctor_id and selected_clinic_id:
-        schedule_qs = Appointment.objects.filter(
-            branch=request.user.branch,
-            deleted_date__isnull=True,
-            date=today,
-            doctor_id=selected_doctor_id,
-            time__gte=selected_start_time,
-            time__lt=selected_end_time,
-            status__name__in=paid_statuses,
+        schedule_stats = get_schedule_stats(
+            request.user.branch,
+            selected_doctor_id,
+            selected_clinic_id,
+            today,
+            selected_start_time,
+            selected_end_time,
         )
-        schedule_qs = schedule_qs.filter(clinic_id=selected_clinic_id)
-        schedule_agg = schedule_qs.aggregate(
-            total=Sum("service_price"),
-            patients=Count("id"),
-        )
-        schedule_revenue = schedule_agg["total"] or 0
-        schedule_patients_count = schedule_agg["patients"] or 0
-
-        schedule_stats, _ = ScheduleStats.objects.get_or_create(
-            branch=request.user.branch,
-            doctor_id=selected_doctor_id,
-            clinic_id=selected_clinic_id,
-            date=today,
-            start_time=selected_start_time,
-            end_time=selected_end_time,
-            defaults={
-                "total_revenue": schedule_revenue,
-                "total_patients": schedule_patients_count,
-            },
-        )
-        if schedule_stats.total_revenue != schedule_revenue or schedule_stats.total_patients != schedule_patients_count:
-            schedule_stats.total_revenue = schedule_revenue
-            schedule_stats.total_patients = schedule_patients_count
-            schedule_stats.save()
+        schedule_revenue = schedule_stats.total_revenue
+        schedule_patients_count = schedule_stats.total_patients
     context = {
         "appointments": appointments,
         "today": today,
@@ -223,7 +134,7 @@ def today_appointments(request):
         "selected_end": selected_end,
         "selected_specialization_id": selected_specialization_id,
         "specializations": Specialization.objects.filter(deleted_date__isnull=True),
-        "arrived_statuses": {"ARRIVED", "COMPLETED"},
+        "arrived_statuses": set(PAID_STATUSES),
         "day_total_revenue": day_total_revenue,
         "day_total_patients": day_total_patients,
         "schedule_revenue": schedule_revenue,
@@ -305,6 +216,7 @@ def update_today_appointment(request):
         messages.error(request, "بيانات الطبيب أو العيادة غير صحيحة")
         return redirect(f"/appointments/today?date={return_date}")
 
+    numbered_group = ticket_group(appointment) if appointment.ticket_number is not None else None
     appointment.patient = patient
     appointment.doctor = doctor
     appointment.clinic = clinic
@@ -316,7 +228,18 @@ def update_today_appointment(request):
     appointment.notes = notes
     appointment.updated_by = request.user
     appointment.updated_date = get_local_now()
-    appointment.save()
+    # A ticket number is only unique within its doctor, clinic and day.
+    moved_ticket = numbered_group is not None and ticket_group(appointment) != numbered_group
+    try:
+        with transaction.atomic():
+            if moved_ticket:
+                appointment.ticket_number = None
+            rebook_appointment(appointment)
+            if moved_ticket:
+                assign_ticket_number(appointment)
+    except SlotFull:
+        messages.error(request, SLOT_FULL_MESSAGE)
+        return redirect(f"/appointments/today?date={return_date}")
 
     messages.success(request, "تم تعديل الموعد بنجاح")
     return redirect(f"/appointments/today?date={return_date}")
@@ -368,23 +291,8 @@ def check_in_appointment(request):
     appointment.status = arrived_status
     appointment.updated_by = request.user
     appointment.updated_date = get_local_now()
-    # Assign per-doctor-per-day ticket number if not already assigned
-    from django.db import transaction
-    if appointment.ticket_number is None:
-        with transaction.atomic():
-            # lock relevant rows to avoid race
-            _ = Appointment.objects.select_for_update().filter(
-                branch=appointment.branch,
-                date=appointment.date,
-                doctor=appointment.doctor,
-            )
-            existing_count = Appointment.objects.filter(
-                branch=appointment.branch,
-                date=appointment.date,
-                doctor=appointment.doctor,
-                ticket_number__isnull=False,
-            ).count()
-            appointment.ticket_number = existing_count + 1
+    # Assign per-doctor-per-clinic-per-day ticket number if not already assigned
+    assign_ticket_number(appointment)
     appointment.save()
 
     # Queue a print job instead of printing directly
@@ -418,22 +326,7 @@ def reprint_ticket(request):
         return redirect("appointments-today")
 
     # Ensure ticket number exists for consistent printing
-    from django.db import transaction
-    if appointment.ticket_number is None:
-        with transaction.atomic():
-            _ = Appointment.objects.select_for_update().filter(
-                branch=appointment.branch,
-                date=appointment.date,
-                doctor=appointment.doctor,
-            )
-            existing_count = Appointment.objects.filter(
-                branch=appointment.branch,
-                date=appointment.date,
-                doctor=appointment.doctor,
-                ticket_number__isnull=False,
-            ).count()
-            appointment.ticket_number = existing_count + 1
-            appointment.save()
+    assign_ticket_number(appointment)
 
     PrintJob.objects.create(
         appointment=appointment,
@@ -516,22 +409,26 @@ def quick_create_appointment(request):
     except ValueError:
         service_price_value = 0
 
-    Appointment.objects.create(
-        patient=patient,
-        doctor=doctor,
-        clinic=clinic,
-        status=status_obj,
-        service_type=service_type,
-        service_price=service_price_value,
-        date=date,
-        time=time_value,
-        notes=notes,
-        branch=request.user.branch,
-        added_by=request.user,
-        added_date=get_local_now(),
-        updated_by=request.user,
-        updated_date=get_local_now(),
-    )
+    try:
+        book_appointment(
+            patient=patient,
+            doctor=doctor,
+            clinic=clinic,
+            status=status_obj,
+            service_type=service_type,
+            service_price=service_price_value,
+            date=date,
+            time=time_value,
+            notes=notes,
+            branch=request.user.branch,
+            added_by=request.user,
+            added_date=get_local_now(),
+            updated_by=request.user,
+            updated_date=get_local_now(),
+        )
+    except SlotFull:
+        messages.error(request, SLOT_FULL_MESSAGE)
+        return redirect("appointments-today")
 
     messages.success(request, "تم إنشاء موعد جديد")
     return redirect("appointments-today")
@@ -549,26 +446,29 @@ def get_clinic_time_slots(request,clinic_id):
     })
 @login_required
 def get_clinic_schedule(request,clinic_id):
-    clinic_schedules = DoctorSchedule.objects.filter(
-    branch=request.user.branch,
-    clinic_id=clinic_id,
-    deleted_date__isnull=True
-)
+    boards = get_week_board(request.user.branch)
 
     schedule_data = []  
 
-    for schedule in clinic_schedules:
-        if schedule.doctor.deleted_date is None:
-            print(f"Schedule ID: {schedule.id}, Doctor: {schedule.doctor.full_name}")
-
-        for slot in schedule.clinic_slot.filter(clinic__branch=request.user.branch, deleted_date__isnull=True):
-            schedule_data.append({
-                **schedule.to_json(),
-                "start_time": slot.start_time,
-                "end_time": slot.end_time
-            })
-
-            print("Added schedule:", schedule_data[-1])  
+    for day_id in sorted(boards):
+        for entry in boards[day_id]:
+            if entry["clinic_id"] != clinic_id:
+                continue
+            for start_time, end_time in entry["slots"]:
+                schedule_data.append({
+                    'id'                  : entry["schedule_id"],
+                    'hash_id'             : get_id_hashed_of_object(entry["schedule_id"]),
+                    'clinic'              : entry["clinic_name"],
+                    'doctor'              : entry["doctor_name"],
+                    'specialization'      : entry["specialization_id"],
+                    'specialization_name' : entry["specialization_name"],
+                    'day_of_week'         : entry["day_name"],
+                    'valid_from'          : entry["valid_from"],
+                    'valid_to'            : entry["valid_to"],
+                    'is_active'           : entry["is_active"],
+                    "start_time": start_time,
+                    "end_time": end_time
+                })
 
     return JsonResponse({
         'success': True,
@@ -589,9 +489,10 @@ def new_appointment(request):
         data_to_insert = None
 
     # Load needed data for form
-    doctors = Doctor.objects.filter(deleted_date__isnull=True)
-    for doctor in doctors:
-        apply_doctor_branch_pricing(doctor, request.user.branch)
+    doctors = apply_doctor_branch_pricing_bulk(
+        Doctor.objects.filter(deleted_date__isnull=True),
+        request.user.branch,
+    )
     clinics = Clinic.objects.filter(branch=request.user.branch, deleted_date__isnull=True)
     all_specializations = Specialization.objects.filter(deleted_date__isnull=True)
 
@@ -632,6 +533,7 @@ def new_appointment(request):
         if typeOfReq == 'edit':
             appointment = Appointment.objects.filter(branch=request.user.branch, id=idOfObject).first()
             if appointment:
+                numbered_group = ticket_group(appointment) if appointment.ticket_number is not None else None
                 appointment.patient = patient_obj
                 appointment.doctor = doctor_obj
                 appointment.clinic = clinic_obj
@@ -642,23 +544,37 @@ def new_appointment(request):
                 appointment.branch = request.user.branch
                 appointment.updated_by = updated_by
                 appointment.updated_date = updated_date
-                appointment.save()
+                moved_ticket = numbered_group is not None and ticket_group(appointment) != numbered_group
+                try:
+                    with transaction.atomic():
+                        if moved_ticket:
+                            appointment.ticket_number = None
+                        rebook_appointment(appointment)
+                        if moved_ticket:
+                            assign_ticket_number(appointment)
+                except SlotFull:
+                    messages.error(request, SLOT_FULL_MESSAGE)
+                    return redirect(request.get_full_path())
 
         else:  # new
-            Appointment.objects.create(
-                patient=patient_obj,
-                doctor=doctor_obj,
-                clinic=clinic_obj,
-                status=status_obj,
-                date=date,
-                time=time,
-                notes=notes,
-                branch=request.user.branch,
-                added_by=added_by,
-                added_date=added_date,
-                updated_by=updated_by,
-                updated_date=updated_date
-            )
+            try:
+                book_appointment(
+                    patient=patient_obj,
+                    doctor=doctor_obj,
+                    clinic=clinic_obj,
+                    status=status_obj,
+                    date=date,
+                    time=time,
+                    notes=notes,
+                    branch=request.user.branch,
+                    added_by=added_by,
+                    added_date=added_date,
+                    updated_by=updated_by,
+                    updated_date=updated_date
+                )
+            except SlotFull:
+                messages.error(request, SLOT_FULL_MESSAGE)
+                return redirect(request.get_full_path())
 
         return HttpResponseRedirect('/')
 
@@ -709,7 +625,7 @@ def new_appointment_api(request):
 
             try : 
 
-                Appointment.objects.create(
+                book_appointment(
                     patient=patient_obj,
                     doctor=doctor_obj,
                     clinic=clinic_obj,
@@ -725,6 +641,8 @@ def new_appointment_api(request):
                     updated_by=cur_user,
                     updated_date=cur_date
                 )
+            except SlotFull:
+                return JsonResponse({"success": False, "slot_full": True, "message": SLOT_FULL_MESSAGE}, status=409)
             except Exception as e:
                 print("Error occurred while fetching related objects:           222222", e)
                 return JsonResponse({"success": False, "message": "خطأ في البيانات"}, status=400)
@@ -735,19 +653,36 @@ def new_appointment_api(request):
 
     return JsonResponse({"success": False, "message": "Invalid request"}, status=400)
 
+@login_required
+@require_POST
+def bulk_appointments_api(request):
+    try:
+        items = expand_items(json.loads(request.body.decode('utf-8')))
+    except ValueError as e:
+        return JsonResponse({"success": False, "message": str(e)}, status=400)
+
+    results = book_batch(request.user, items)
+    booked = sum(1 for result in results if result["success"])
+    return JsonResponse({
+        "success": booked == len(results),
+        "booked": booked,
+        "failed": len(results) - booked,
+        "results": results,
+    })
+
 @login_required
 def api_get_doctors_by_specialization(request):
     specialization_id = request.GET.get('specialization')
     print(f"-----------------{specialization_id}-----------------")
 
-    doctors = Doctor.objects.filter(
-        specialization__id=specialization_id,
-        deleted_date__isnull=True
+    doctors = apply_doctor_branch_pricing_bulk(
+        Doctor.objects.filter(
+            specialization__id=specialization_id,
+            deleted_date__isnull=True
+        ),
+        request.user.branch,
     )
 
-    for doctor in doctors:
-        apply_doctor_branch_pricing(doctor, request.user.branch)
-
     return JsonResponse({
         "success": True,
         "doctors": [
@@ -770,37 +705,28 @@ def get_doctor_schedule(request):
     today = get_local_now().date()
     print(f"Fetching schedule for doctor ID: {doctor_id} on {today} {today.weekday()}")
 
-    schedules = DoctorSchedule.objects.filter(
-        branch=request.user.branch,
-        doctor_id=doctor_id,
-        is_active=True,
-        valid_from__lte=today,
-        deleted_date__isnull=True
-    ).filter(
-        Q(valid_to__isnull=True) | Q(valid_to__gte=today)
-    ).order_by("day_of_week__id")
+    boards = get_week_board(request.user.branch)
 
     data = []
-    for sch in schedules:
-        # Get all clinic slots for this schedule
-        slots = sch.clinic_slot.all().order_by("start_time")
-        merged_slots = merge_continuous_slots(slots)
-
-        # Add merged slot ranges to response
-        slot_data = [
-            {
-                "start_time": start.strftime("%I:%M %p"),
-                "end_time": end.strftime("%I:%M %p"),
-            }
-            for start, end in merged_slots
-        ]
-
-        data.append({
-            "id": sch.id,
-            "clinic": sch.clinic.name,
-            "day": sch.day_of_week.name,
-            "day_id": sch.day_of_week.id,
-            "slots": slot_data,
-        })
+    for day_id in sorted(boards):
+        for entry in entries_valid_on(boards[day_id], today):
+            if str(entry["doctor_id"]) != str(doctor_id) or not entry["is_active"]:
+                continue
+            # Add merged slot ranges to response
+            slot_data = [
+                {
+                    "start_time": start.strftime("%I:%M %p"),
+                    "end_time": end.strftime("%I:%M %p"),
+                }
+                for start, end in entry["merged_ranges"]
+            ]
+
+            data.append({
+                "id": entry["schedule_id"],
+                "clinic": entry["clinic_name"],
+                "day": entry["day_name"],
+                "day_id": entry["day_id"],
+                "slots": slot_data,
+            })
 
     return JsonResponse({"success": True, "schedules": data})
\ No newline at end of file
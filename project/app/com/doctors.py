@@ -7,12 +7,18 @@ from datetime import datetime
 from django.contrib import messages
 from django.http import HttpResponseRedirect, JsonResponse
 from django.shortcuts import redirect, render
-from app.templatetags.helpers import check_if_post_input_valid, check_valid_text, get_id_hashed_of_object, get_id_of_object , delete, merge_continuous_slots
-from django.db.models import Q ,  Count, Sum
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from app.templatetags.helpers import check_if_post_input_valid, check_valid_text, get_id_hashed_of_object, get_id_of_object
+from django.db.models import Count, Sum
 from project.settings import CHAR_100, CHAR_50
 from django.contrib.auth.decorators import login_required
+from django.utils.dateparse import parse_date
 from app.helpers import apply_doctor_branch_pricing, get_local_now
+from app.schedule_cache import load_schedules_with_cached_ranges
+from app.datatables import datatables_response, total_cache_key
+from app.search import search_queryset
+from app.serializers import APPOINTMENT_JSON, serialize_page
+from app.availability import get_clinic_day_occupancy
+from app.schedule_conflicts import ScheduleConflictIndex, describe_conflict, format_minutes
 
 @login_required
 def list_of_doctors(request):
@@ -20,56 +26,15 @@ def list_of_doctors(request):
 
 @login_required
 def get_list_of_doctors(request):
-    try:
-        draw            = int(request.GET.get('draw', 1))
-        start           = int(request.GET.get('start', 0))
-        length          = int(request.GET.get('length', 10))
-        search_value    = request.GET.get('search[value]', '').strip()
-
-        page_number = (start // length) + 1
-
-        # Add ordering to avoid pagination warning
-        queryset = Doctor.objects.filter( deleted_date__isnull=True).order_by('id')
-        
-        if search_value:
-            queryset = queryset.filter(
-                Q(full_name__icontains=search_value) |
-                Q(phone_number__icontains=search_value) |
-                Q(id__icontains=search_value)
-            )
-
-        paginator = Paginator(queryset, length)
-        
-        try:
-            page_obj = paginator.page(page_number)
-        except (PageNotAnInteger, EmptyPage):
-            page_obj = paginator.page(1)
-
-        # Try-catch around to_json() in case that's where the Fernet error occurs
-        data = []
-        for doctor in page_obj:
-            try:
-                data.append(doctor.to_json())
-            except Exception as e:
-                print(f"Error serializing doctor {doctor.id}: {str(e)}")
-                continue
-
-        return JsonResponse({
-            "draw": draw,
-            "recordsTotal": queryset.count(),
-            "recordsFiltered": queryset.count(),
-            "data": data
-        })
-
-    except Exception as e:
-        print(f"Error in get_list_of_doctors: {str(e)}", exc_info=True)
-        return JsonResponse({
-            "draw": draw if 'draw' in locals() else 0,
-            "recordsTotal": 0,
-            "recordsFiltered": 0,
-            "data": [],
-            "error": str(e)  # Include error message for debugging
-        }, status=500)
+    queryset = Doctor.objects.filter(deleted_date__isnull=True)
+    return datatables_response(
+        request,
+        queryset,
+        lambda doctor: doctor.to_json(),
+        search=search_queryset,
+        order_columns={'full_name': 'full_name', 'id': 'pk'},
+        total_key=total_cache_key(Doctor),
+    )
 
 @login_required
 def add_new_doctor(request):
@@ -86,18 +51,16 @@ def add_new_doctor(request):
         data_to_insert   = Doctor.objects.filter(id=idOfObject, deleted_date__isnull=True).first()
         if data_to_insert:
             apply_doctor_branch_pricing(data_to_insert, request.user.branch)
-        doctor_schedules = DoctorSchedule.objects.filter(
+        doctor_schedules = load_schedules_with_cached_ranges(DoctorSchedule.objects.filter(
             branch=request.user.branch,
             doctor_id=idOfObject, 
             deleted_date__isnull=True
-        )
+        ), request.user.branch)
         days_of_week = DaysOfWeek.objects.all()
         for s in doctor_schedules:
-            slots = s.clinic_slot.all().order_by('start_time')
-            merged = merge_continuous_slots(slots)
             s.merged_slots = [
                 {"start": m[0].strftime("%I:%M %p"), "end": m[1].strftime("%I:%M %p")}
-                for m in merged
+                for m in s.merged_ranges
             ]
     elif typeOfReq == 'new':
         data_to_insert      = None
@@ -213,7 +176,7 @@ def add_new_doctor(request):
 def delete_doctor(request):
     doctor_id      = request.POST['id']
 
-    delete(request, Doctor, Q(branch=request.user.branch, id = doctor_id))
+    Doctor.objects.filter(branch=request.user.branch, id=doctor_id).soft_delete(request.user)
 
     allJson             = {"Result": "Fail"}
     allJson['Result']   = "Success"
@@ -272,6 +235,29 @@ def doctor_schedule(request, schedule_id=None):
                 deleted_date__isnull=True,
             ).order_by('start_time')
 
+            if doctor and clinic:
+                conflicts = ScheduleConflictIndex.for_branch(request.user.branch).proposed_conflicts(
+                    doctor, clinic, day_of_week.id, clinic_slots,
+                    parse_date(valid_from) if valid_from else None, parse_date(valid_to) if valid_to else None,
+                    schedule_id=schedule_id,
+                )
+                if conflicts:
+                    return JsonResponse({
+                        "success": False,
+                        "message": "; ".join(dict.fromkeys(describe_conflict(conflict) for conflict in conflicts)),
+                        "conflicts": [
+                            {
+                                "kind": conflict.kind,
+                                "schedule_id": conflict.other.schedule_id,
+                                "doctor": conflict.other.doctor_name,
+                                "clinic": conflict.other.clinic_name,
+                                "start": format_minutes(conflict.other.start),
+                                "end": format_minutes(conflict.other.end),
+                            }
+                            for conflict in conflicts
+                        ],
+                    }, status=409)
+
             if schedule_id is not None:
                 schedule = DoctorSchedule.objects.filter(branch=request.user.branch, id=schedule_id).first()
                 if not schedule:
@@ -327,11 +313,11 @@ def doctor_details(request):
     if doctor:
         apply_doctor_branch_pricing(doctor, request.user.branch)
 
-    doctor_schedules = DoctorSchedule.objects.filter(
+    doctor_schedules = load_schedules_with_cached_ranges(DoctorSchedule.objects.filter(
         branch=request.user.branch,
         doctor=doctor, 
         deleted_date__isnull=True
-    )
+    ), request.user.branch)
 
     doctor_appointments = Appointment.objects.filter(
         branch=request.user.branch,
@@ -356,11 +342,9 @@ def doctor_details(request):
 
     days_of_week = DaysOfWeek.objects.all()
     for s in doctor_schedules:
-        slots = s.clinic_slot.all().order_by('start_time')
-        merged = merge_continuous_slots(slots)
         s.merged_slots = [
             {"start": m[0].strftime("%I:%M %p"), "end": m[1].strftime("%I:%M %p")}
-            for m in merged
+            for m in s.merged_ranges
         ]
     context = {
         "doctor": doctor,
@@ -378,7 +362,7 @@ def doctor_details(request):
 @login_required
 def delete_doctor_schedule(request,schedule_id):
     try:
-        delete(request, DoctorSchedule, Q(branch=request.user.branch, id=schedule_id))
+        DoctorSchedule.objects.filter(branch=request.user.branch, id=schedule_id).soft_delete(request.user)
         return JsonResponse({
             'success' : True, 
         })
@@ -393,52 +377,26 @@ def api_get_slots(request):
     clinic_id       = request.GET.get('clinic_id')
     day_of_week_id  = request.GET.get('day_of_week_id')
 
-    clinic_slots = ClinicSlot.objects.filter(
-        clinic_id=clinic_id,
-        clinic__branch=request.user.branch,
-        is_active=True,
-        deleted_date__isnull=True
-    )
+    occupancy = get_clinic_day_occupancy(request.user.branch, clinic_id, day_of_week_id)
 
-    slots_data = []
-    for slot in clinic_slots:
-        # Check if slot is occupied by any doctor
-        doctor_schedule = DoctorSchedule.objects.filter(
-            branch=request.user.branch,
-            clinic_slot=slot,
-            day_of_week_id = day_of_week_id,
-            is_active=True,
-            deleted_date__isnull=True
-        ).first()
-        
-        slot_json = slot.to_json()
-        if doctor_schedule and doctor_schedule.doctor.deleted_date is None:
-            slot_json['is_available'] = False
-            slot_json['doctor_name'] = doctor_schedule.doctor.full_name 
-        else:
-            slot_json['is_available'] = True
-            slot_json['doctor_name'] = None
-        
-        slots_data.append(slot_json)
-    
     return JsonResponse({
         "success": True,
-        "slots": slots_data
+        "slots": occupancy.to_json()
     })
 
 @login_required
 def get_latest_appointments(request, doctor_id):
     try:
-        doctor = Doctor.objects.filter(id=doctor_id, deleted_date__isnull=True).first()
+        doctor = Doctor.objects.get(id=doctor_id)
         latest_appointments = Appointment.objects.filter(
             branch=request.user.branch,
             doctor=doctor,
-            deleted_date__isnull=True
-        ).order_by('-date')
-        appointment_data = [appt.tojson()for appt in latest_appointments]
+        )
+        appointment_data, cursor = serialize_page(request, latest_appointments, APPOINTMENT_JSON)
         return JsonResponse({
             'success': True,
-            'appointments': appointment_data
+            'appointments': appointment_data,
+            'cursor': cursor,
         })
     except Doctor.DoesNotExist:
         return JsonResponse({
@@ -0,0 +1,90 @@
+import hmac
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.db.models import Avg, Count, Max
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden
+from django.shortcuts import render
+from django.views.decorators.http import require_GET
+
+from app.metrics import CONTENT_TYPE, render_metrics
+from app.profiling import get_capture, list_captures
+from app.models import SlowQuery, User
+
+def _may_scrape(request):
+    # Without a token nobody may scrape: behind a reverse proxy every request looks local.
+    token = getattr(settings, "METRICS_TOKEN", None)
+    return bool(token) and hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}")
+
+
+@require_GET
+def metrics(request):
+    """Prometheus scrape target, guarded by the ``METRICS_TOKEN`` bearer token (disabled when unset)."""
+    if not _may_scrape(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE)
+
+
+def manager_required(view):
+    """Like ``login_required``, and answer 403 to users who are not managers."""
+    @login_required
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.user.user_type != User.UserType.MANAGER:
+            return HttpResponseForbidden()
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def superuser_required(view):
+    """Like ``login_required``, and answer 403 to users who are not superusers."""
+    @login_required
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_superuser:
+            return HttpResponseForbidden()
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+# Captures are not tied to a branch, so only superusers see them.
+@superuser_required
+def slow_queries(request):
+    """Latest slow query captures, and the slowest statements among them (see ``app.slow_queries``)."""
+    captures = list(SlowQuery.objects.all()[:200])
+    for capture in captures:
+        capture.plan_text = json.dumps(json.loads(capture.plan), indent=2) if capture.plan else ""
+
+    statements = list(
+        SlowQuery.objects.values("digest")
+        .annotate(captures=Count("id"), max_ms=Max("duration_ms"), avg_ms=Avg("duration_ms"), last_seen=Max("captured_at"))
+        .order_by("-max_ms")[:20]
+    )
+    latest = {}
+    for capture in SlowQuery.objects.filter(digest__in=[row["digest"] for row in statements]).order_by("-id"):
+        latest.setdefault(capture.digest, capture)
+    for row in statements:
+        row["sample"] = latest[row["digest"]]
+
+    return render(request, 'monitoring/slow_queries.html', {
+        "captures": captures,
+        "statements": statements,
+        "threshold_ms": getattr(settings, "SLOW_QUERY_THRESHOLD_MS", None),
+    })
+
+
+@manager_required
+def profiles(request):
+    """Saved request profiles (see ``app.profiling``), newest first."""
+    return render(request, 'monitoring/profiles.html', {"captures": list_captures()})
+
+
+@manager_required
+def download_profile(request, name):
+    capture = get_capture(name)
+    if capture is None:
+        raise Http404
+    meta, path = capture
+    return FileResponse(open(path, "rb"), as_attachment=True, filename=meta["file"])
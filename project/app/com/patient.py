@@ -2,14 +2,15 @@ from datetime import datetime
 from django.contrib import messages
 from django.http import HttpResponseRedirect, JsonResponse
 from django.shortcuts import redirect, render
-from app.templatetags.helpers import check_if_post_input_valid, check_valid_text, get_id_of_object , delete
+from app.templatetags.helpers import check_if_post_input_valid, check_valid_text, get_id_of_object
 from app.models import Doctor, Patient, Specialization, Appointment
-from django.db.models import Q
 from django.utils import timezone
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from project.settings import CHAR_100
 from django.contrib.auth.decorators import login_required
-from app.helpers import apply_doctor_branch_pricing, get_local_now
+from app.helpers import apply_doctor_branch_pricing_bulk, get_local_now
+from app.datatables import datatables_response, total_cache_key
+from app.search import search_queryset
+from app.serializers import APPOINTMENT_JSON, serialize_page
 ####################  Patient  #################
 
 @login_required
@@ -23,56 +24,15 @@ def list_of_patient(request):
 
 @login_required
 def get_list_of_patients(request):
-    try:
-        draw = int(request.GET.get('draw', 1))
-        start = int(request.GET.get('start', 0))
-        length = int(request.GET.get('length', 10))
-        search_value = request.GET.get('search[value]', '').strip()
-
-        page_number = (start // length) + 1
-
-        # Add ordering to avoid pagination warning
-        queryset = Patient.objects.filter(branch=request.user.branch, deleted_date__isnull=True).order_by('id')
-        
-        if search_value:
-            queryset = queryset.filter(
-                Q(name__icontains=search_value) |
-                Q(phone_number__icontains=search_value) |
-                Q(id__icontains=search_value)
-            )
-
-        paginator = Paginator(queryset, length)
-        
-        try:
-            page_obj = paginator.page(page_number)
-        except (PageNotAnInteger, EmptyPage):
-            page_obj = paginator.page(1)
-
-        # Try-catch around to_json() in case that's where the Fernet error occurs
-        data = []
-        for patient in page_obj:
-            try:
-                data.append(patient.to_json())
-            except Exception as e:
-                print(f"Error serializing patient {patient.id}: {str(e)}")
-                continue
-
-        return JsonResponse({
-            "draw": draw,
-            "recordsTotal": queryset.count(),
-            "recordsFiltered": queryset.count(),
-            "data": data
-        })
-
-    except Exception as e:
-        print(f"Error in get_list_of_patients: {str(e)}", exc_info=True)
-        return JsonResponse({
-            "draw": draw if 'draw' in locals() else 0,
-            "recordsTotal": 0,
-            "recordsFiltered": 0,
-            "data": [],
-            "error": str(e)  # Include error message for debugging
-        }, status=500)
+    queryset = Patient.objects.filter(branch=request.user.branch, deleted_date__isnull=True)
+    return datatables_response(
+        request,
+        queryset,
+        lambda patient: patient.to_json(),
+        search=search_queryset,
+        order_columns={'name': 'name', 'id': 'pk'},
+        total_key=total_cache_key(Patient, request.user.branch_id),
+    )
     
 @login_required
 def add_new_patient(request):
@@ -90,10 +50,10 @@ def add_new_patient(request):
         data_to_insert = None
 
     all_specializations = Specialization.objects.filter(deleted_date__isnull=True)
-    all_doctors         = Doctor.objects.filter(deleted_date__isnull=True)
-
-    for doctor in all_doctors:
-        apply_doctor_branch_pricing(doctor, request.user.branch)
+    all_doctors         = apply_doctor_branch_pricing_bulk(
+        Doctor.objects.filter(deleted_date__isnull=True),
+        request.user.branch,
+    )
 
     context = {
         'all_specializations'   : all_specializations , 
@@ -172,9 +132,8 @@ def patient_details(request):
 @login_required
 def delete_patient(request):
     patient_id      = request.POST['id']
-    delete(request, Patient, Q(branch=request.user.branch, id = patient_id))
-    appointments = Appointment.objects.filter(branch=request.user.branch, patient_id=patient_id, deleted_date__isnull=True)
-    delete(request, Appointment, Q(id__in = appointments.values_list('id', flat=True)))
+    Patient.objects.filter(branch=request.user.branch, id=patient_id).soft_delete(request.user)
+    Appointment.objects.filter(branch=request.user.branch, patient_id=patient_id).soft_delete(request.user)
     allJson             = {"Result": "Fail"}
     allJson['Result']   = "Success"
 
@@ -264,10 +223,10 @@ def get_latest_appointments(request, patient_id):
     except Patient.DoesNotExist:
         return JsonResponse({'error': 'Patient not found'}, status=404)
 
-    appointments = Appointment.objects.filter(branch=request.user.branch, patient=patient).order_by('-date')
-    data = [appointment.tojson() for appointment in appointments]
-    print(data)
+    appointments = Appointment.objects.filter(branch=request.user.branch, patient=patient)
+    data, cursor = serialize_page(request, appointments, APPOINTMENT_JSON)
     return JsonResponse({
         'success': True,
-        'appointments': data
+        'appointments': data,
+        'cursor': cursor,
         })
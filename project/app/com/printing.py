@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.shortcuts import render
 from django.http import JsonResponse
 from django.views.decorators.http import require_GET, require_POST
@@ -5,42 +6,136 @@ from django.views.decorators.csrf import csrf_exempt
 import json
 
 from app.models import PrintJob  # the model you'll add
+from app.print_queue import acknowledge_print_jobs, claim_print_jobs, wait_for_print_jobs
 
 
 def print_display(request):
     return render(request, 'printing/print_display.html')
 
 
+def print_job_to_json(job):
+    appointment = job.appointment
+
+    display_number = appointment.ticket_number if getattr(appointment, 'ticket_number', None) else job.id
+
+    return {
+        "id": job.id,
+        "appointment_id": appointment.id,
+        "display_number": display_number,
+        "ticket_number": appointment.ticket_number,
+        "clinic_name": appointment.clinic.name if appointment.clinic else None,
+        "doctor_name": appointment.doctor.full_name if appointment.doctor else None,
+        "appointment_date": appointment.date.strftime('%Y-%m-%d') if appointment.date else None,
+        "appointment_time": appointment.time.strftime('%H:%M') if appointment.time else "",
+        "patient_name": appointment.patient.name if appointment.patient else None,
+        "patient_phone": appointment.patient.phone_number if appointment.patient else None,
+        "service_price": str(appointment.service_price),
+        "created_at": job.created_at.isoformat(),
+    }
+
+
+def _read_payload(request):
+    try:
+        return json.loads(request.body.decode('utf-8') or '{}') if request.body else {}
+    except Exception:
+        return {}
+
+
+def _worker_name(request, payload=None):
+    """Lease owner: the `worker` param sent by the agent, else the client address."""
+    payload = payload or {}
+    return (
+        payload.get('worker')
+        or request.POST.get('worker')
+        or request.GET.get('worker')
+        or 'display@%s' % request.META.get('REMOTE_ADDR', 'unknown')
+    )[:100]
+
+
+def _parse_limit(value, default):
+    max_limit = getattr(settings, 'PRINT_JOBS_BATCH_LIMIT', 50)
+    return min(max(int(value if value is not None else default), 1), max_limit)
+
+
 @require_GET
 def print_jobs_pending(request):
-    # return the oldest pending print job (or null)
-    job = PrintJob.objects.filter(status='pending').order_by('created_at').first()
+    # lease and return the oldest ready print job (or null)
+    jobs = claim_print_jobs(_worker_name(request), 1)
 
-    if not job:
+    if not jobs:
         return JsonResponse({"job": None})
 
-    appointment = job.appointment
+    return JsonResponse({"job": print_job_to_json(jobs[0])})
 
-    display_number = appointment.ticket_number if getattr(appointment, 'ticket_number', None) else job.id
 
+@require_GET
+def print_jobs_wait(request):
+    """Long-poll: hold the request until jobs are queued, then lease and return all of them.
+
+    Query params: `timeout` (seconds, capped by PRINT_JOBS_WAIT_TIMEOUT),
+    `limit` (max jobs per batch, capped by PRINT_JOBS_BATCH_LIMIT) and
+    `worker` (lease owner name).
+    """
+    max_timeout = getattr(settings, 'PRINT_JOBS_WAIT_TIMEOUT', 25)
+    try:
+        timeout = min(max(float(request.GET.get('timeout', max_timeout)), 0), max_timeout)
+        limit = _parse_limit(request.GET.get('limit'), getattr(settings, 'PRINT_JOBS_BATCH_LIMIT', 50))
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'invalid timeout or limit'}, status=400)
+
+    jobs = wait_for_print_jobs(_worker_name(request), limit, timeout)
+    return JsonResponse({"jobs": [print_job_to_json(job) for job in jobs]})
+
+
+@csrf_exempt
+@require_POST
+def claim_print_jobs_view(request):
+    """Lease up to `limit` ready jobs to `worker` for `lease_seconds`
+    (capped by PRINT_JOBS_MAX_LEASE_SECONDS).
+
+    Leased jobs are hidden from other workers until acknowledged or until the
+    lease expires, after which they are handed out again.
+    """
+    payload = _read_payload(request)
+    try:
+        limit = _parse_limit(payload.get('limit') or request.POST.get('limit'), 10)
+        lease_seconds = payload.get('lease_seconds') or request.POST.get('lease_seconds')
+        max_lease = getattr(settings, 'PRINT_JOBS_MAX_LEASE_SECONDS', 3600)
+        lease_seconds = min(max(int(lease_seconds), 1), max_lease) if lease_seconds else None
+    except (TypeError, ValueError):
+        return JsonResponse({'success': False, 'error': 'invalid limit or lease_seconds'}, status=400)
+
+    worker = _worker_name(request, payload)
+    jobs = claim_print_jobs(worker, limit, lease_seconds)
     return JsonResponse({
-        "job": {
-            "id": job.id,
-            "appointment_id": appointment.id,
-            "display_number": display_number,
-            "ticket_number": appointment.ticket_number,
-            "clinic_name": appointment.clinic.name if appointment.clinic else None,
-            "doctor_name": appointment.doctor.full_name if appointment.doctor else None,
-            "appointment_date": appointment.date.strftime('%Y-%m-%d') if appointment.date else None,
-            "appointment_time": appointment.time.strftime('%H:%M') if appointment.time else "",
-            "patient_name": appointment.patient.name if appointment.patient else None,
-            "patient_phone": appointment.patient.phone_number if appointment.patient else None,
-            "service_price": str(appointment.service_price),
-            "created_at": job.created_at.isoformat(),
-        }
+        'success': True,
+        'worker': worker,
+        'lease_expires_at': jobs[0].lease_expires_at.isoformat() if jobs else None,
+        'jobs': [print_job_to_json(job) for job in jobs],
     })
 
 
+@csrf_exempt
+@require_POST
+def acknowledge_print_jobs_view(request):
+    """Mark a batch of jobs done in one UPDATE. JSON: `{"job_ids": [...], "worker": "..."}`.
+
+    When `worker` is given, jobs whose lease was re-issued to another worker
+    are left alone.
+    """
+    payload = _read_payload(request)
+    job_ids = payload.get('job_ids') or request.POST.getlist('job_ids')
+    if not job_ids:
+        return JsonResponse({'success': False, 'error': 'job_ids required'}, status=400)
+    try:
+        job_ids = [int(job_id) for job_id in job_ids]
+    except (TypeError, ValueError):
+        return JsonResponse({'success': False, 'error': 'invalid job_ids'}, status=400)
+
+    updated = acknowledge_print_jobs(job_ids, payload.get('worker') or request.POST.get('worker'))
+    return JsonResponse({'success': True, 'updated': updated})
+
+
 @csrf_exempt
 @require_POST
 def mark_print_job_done(request, job_id=None):
@@ -49,21 +144,15 @@ def mark_print_job_done(request, job_id=None):
     This endpoint is CSRF-exempt for local agent convenience.
     """
     # job_id may be provided via the URL path or in the POST body (form/json)
-    try:
-        payload = json.loads(request.body.decode('utf-8') or '{}') if request.body else {}
-    except Exception:
-        payload = {}
+    payload = _read_payload(request)
 
     body_job_id = request.POST.get('job_id') or request.POST.get('id') or payload.get('job_id') or payload.get('id')
     job_id = job_id or body_job_id
     if not job_id:
         return JsonResponse({'success': False, 'error': 'job_id required'}, status=400)
 
-    try:
-        job = PrintJob.objects.get(id=job_id)
-    except PrintJob.DoesNotExist:
+    updated = PrintJob.objects.filter(id=job_id).update(status=PrintJob.Status.DONE, lease_expires_at=None)
+    if not updated:
         return JsonResponse({'success': False, 'error': 'job not found'}, status=404)
 
-    job.status = 'done'
-    job.save()
     return JsonResponse({'success': True})
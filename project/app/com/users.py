@@ -4,77 +4,40 @@ from app.models import User
 from django.contrib import messages
 from django.http import HttpResponseRedirect, JsonResponse
 from django.shortcuts import redirect, render
-from app.templatetags.helpers import check_if_post_input_valid, check_valid_text, get_id_hashed_of_object, get_id_of_object, delete
-from django.db.models import Q
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from app.templatetags.helpers import check_if_post_input_valid, check_valid_text, get_id_hashed_of_object, get_id_of_object
 from project.settings import CHAR_100, CHAR_50
 from django.contrib.auth.hashers import make_password
 from django.contrib.auth.decorators import login_required
+from app.datatables import datatables_response, total_cache_key
+from app.search import search_queryset
 
 @login_required
 def list_of_users(request):
     return render(request, 'users/list.html')
 
+def user_to_json(user):
+    return {
+        'id': user.id,
+        'hash_id': get_id_hashed_of_object(user.id),
+        'fullname': user.fullname or user.username,
+        'username': user.username,
+        'user_type': user.user_type,
+        'phone_number': user.phone_number or '',
+        'is_active': user.is_active
+    }
+
 @login_required
 def get_list_of_users(request):
-    try:
-        draw            = int(request.GET.get('draw', 1))
-        start           = int(request.GET.get('start', 0))
-        length          = int(request.GET.get('length', 10))
-        search_value    = request.GET.get('search[value]', '').strip()
-
-        page_number = (start // length) + 1
-
-        # Filter active users only (not deleted)
-        queryset = User.objects.filter(branch=request.user.branch, is_active=True).order_by('id')
-        
-        if search_value:
-            queryset = queryset.filter(
-                Q(fullname__icontains=search_value) |
-                Q(username__icontains=search_value) |
-                Q(phone_number__icontains=search_value) |
-                Q(id__icontains=search_value)
-            )
-
-        paginator = Paginator(queryset, length)
-        
-        try:
-            page_obj = paginator.page(page_number)
-        except (PageNotAnInteger, EmptyPage):
-            page_obj = paginator.page(1)
-
-        data = []
-        for user in page_obj:
-            try:
-                data.append({
-                    'id': user.id,
-                    'hash_id': get_id_hashed_of_object(user.id),
-                    'fullname': user.fullname or user.username,
-                    'username': user.username,
-                    'user_type': user.user_type,
-                    'phone_number': user.phone_number or '',
-                    'is_active': user.is_active
-                })
-            except Exception as e:
-                print(f"Error serializing user {user.id}: {str(e)}")
-                continue
-
-        return JsonResponse({
-            "draw": draw,
-            "recordsTotal": queryset.count(),
-            "recordsFiltered": queryset.count(),
-            "data": data
-        })
-
-    except Exception as e:
-        print(f"Error in get_list_of_users: {str(e)}", exc_info=True)
-        return JsonResponse({
-            "draw": draw if 'draw' in locals() else 0,
-            "recordsTotal": 0,
-            "recordsFiltered": 0,
-            "data": [],
-            "error": str(e)
-        }, status=500)
+    # Filter active users only (not deleted)
+    queryset = User.objects.filter(branch=request.user.branch, is_active=True)
+    return datatables_response(
+        request,
+        queryset,
+        user_to_json,
+        search=search_queryset,
+        order_columns={'username': 'username', 'id': 'pk'},
+        total_key=total_cache_key(User, request.user.branch_id),
+    )
 
 @login_required
 def add_new_user(request):
@@ -0,0 +1,56 @@
+"""Atomic "next number" counters backed by one row per key.
+
+``bump_counter`` increments ``last_number`` on the row of ``model`` matching
+``key`` (by one, or by ``amount`` to reserve a block of numbers) and returns
+the new value. On PostgreSQL and SQLite this is a single
+``INSERT ... ON CONFLICT DO UPDATE ... RETURNING`` statement, so it costs one
+round trip and only contends on that one row; elsewhere it falls back to a
+locked ``get_or_create`` plus an ``F()`` update. ``key`` must match a unique
+constraint of ``model`` and none of its values may be ``None``: NULL never
+conflicts in a unique index, so concurrent first bumps of a NULL key would
+each create their own counter row and hand out the same numbers. Call it inside the transaction that stores the
+number, so a rollback also gives the number back.
+"""
+from django.db import connection, transaction
+from django.db.models import F
+
+UPSERT_VENDORS = ("postgresql", "sqlite")
+
+
+def _upsert(model, key, amount):
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    columns = [quote(model._meta.get_field(name).column) for name in key]
+    column_list = ", ".join(columns)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} ({column_list}, last_number)
+            VALUES ({", ".join(["%s"] * len(columns))}, %s)
+            ON CONFLICT ({column_list})
+            DO UPDATE SET last_number = {table}.last_number + %s
+            RETURNING last_number
+            """,
+            [*key.values(), amount, amount],
+        )
+        return cursor.fetchone()[0]
+
+
+def _update(model, key, amount):
+    with transaction.atomic():
+        counter, _ = model.objects.select_for_update().get_or_create(**key)
+        model.objects.filter(pk=counter.pk).update(last_number=F("last_number") + amount)
+        return model.objects.values_list("last_number", flat=True).get(pk=counter.pk)
+
+
+def bump_counter(model, amount=1, **key):
+    """Add ``amount`` to the counter of ``model`` identified by ``key`` and return its new value.
+
+    The numbers reserved are ``new value - amount + 1`` to ``new value``.
+    """
+    missing = [name for name, value in key.items() if value is None]
+    if missing:
+        raise ValueError(f"{model.__name__} counter key has no value for: {', '.join(missing)}")
+    if connection.vendor in UPSERT_VENDORS:
+        return _upsert(model, key, amount)
+    return _update(model, key, amount)
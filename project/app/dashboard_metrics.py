@@ -0,0 +1,172 @@
+"""Dashboard metrics computed with conditional aggregation and cached per branch.
+
+``compute_dashboard_metrics`` needs three queries, one per table: patient and
+active doctor counts (anchored on the branch row), appointment counts, and
+invoice income. ``get_dashboard_metrics`` serves them from a snapshot cached
+for ``DASHBOARD_METRICS_CACHE_TIMEOUT`` seconds. The snapshot is dropped early
+by ``invalidate_dashboard_metrics`` when the incremental stats tables or
+invoices change (see ``app.stats`` and ``app.signals``).
+"""
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Sum
+from django.utils import timezone
+
+from app.helpers import get_local_date
+from app.metrics import count_cache
+from app.models import Appointment, Branch, DoctorBranch, Invoice
+
+CACHE_PREFIX = "dashboard-metrics"
+
+
+def _cache():
+    return caches[getattr(settings, "DASHBOARD_METRICS_CACHE_ALIAS", "default")]
+
+
+def _timeout():
+    return getattr(settings, "DASHBOARD_METRICS_CACHE_TIMEOUT", 60)
+
+
+def _cache_key(branch_id, today):
+    return f"{CACHE_PREFIX}:{branch_id}:{today.isoformat()}"
+
+
+def _start_of_day(date):
+    return timezone.make_aware(datetime.combine(date, time.min))
+
+
+def _growth_rate(current, previous):
+    if previous > 0:
+        return round(((current - previous) / previous) * 100, 2)
+    return 0
+
+
+def get_periods(today):
+    """Return the month and week boundaries the dashboard compares."""
+    start_of_current_month = today.replace(day=1)
+    start_of_previous_month = (start_of_current_month - timedelta(days=1)).replace(day=1)
+    start_of_week = today - timedelta(days=today.weekday())  # Monday as start
+    return {
+        "start_of_current_month": start_of_current_month,
+        "start_of_previous_month": start_of_previous_month,
+        "start_of_week": start_of_week,
+        "end_of_week": start_of_week + timedelta(days=6),
+        "start_of_last_week": start_of_week - timedelta(days=7),
+        "end_of_last_week": start_of_week - timedelta(days=1),
+    }
+
+
+def compute_dashboard_metrics(branch, today=None):
+    """Compute the dashboard context values for ``branch`` in three queries."""
+    today = today or get_local_date()
+    periods = get_periods(today)
+    this_month = _start_of_day(periods["start_of_current_month"])
+    last_month = _start_of_day(periods["start_of_previous_month"])
+    tomorrow = _start_of_day(today + timedelta(days=1))
+
+    live_patient = Q(patient__deleted_date__isnull=True)
+    active_doctors = (
+        DoctorBranch.objects.filter(
+            branch=OuterRef("pk"),
+            deleted_date__isnull=True,
+            is_active=True,
+            doctor__deleted_date__isnull=True,
+            doctor__is_active=True,
+        )
+        .order_by()
+        .values("branch")
+        .annotate(count=Count("id"))
+        .values("count")
+    )
+    branch_row = (
+        Branch.objects.filter(pk=branch.pk)
+        .annotate(
+            total_patients_count=Count("patient", filter=live_patient),
+            patients_this_month=Count(
+                "patient", filter=live_patient & Q(patient__added_date__gte=this_month, patient__added_date__lt=tomorrow),
+            ),
+            patients_last_month=Count(
+                "patient", filter=live_patient & Q(patient__added_date__gte=last_month, patient__added_date__lt=this_month),
+            ),
+            active_doctors_count=Subquery(active_doctors, output_field=IntegerField()),
+        )
+        .values("total_patients_count", "patients_this_month", "patients_last_month", "active_doctors_count")
+        .first()
+    )
+
+    appointments = Appointment.objects.filter(
+        branch=branch,
+        deleted_date__isnull=True,
+        date__gte=periods["start_of_week"],
+        date__lte=periods["end_of_week"],
+    ).aggregate(
+        appointments_this_week=Count("id"),
+        appointments_today=Count("id", filter=Q(date=today)),
+    )
+
+    income = Invoice.objects.filter(
+        appointment__branch=branch,
+        deleted_date__isnull=True,
+    ).aggregate(
+        total_income=Sum("total_price"),
+        income_this_week=Sum(
+            "total_price",
+            filter=Q(invoice_date__gte=periods["start_of_week"], invoice_date__lte=periods["end_of_week"]),
+        ),
+        income_last_week=Sum(
+            "total_price",
+            filter=Q(invoice_date__gte=periods["start_of_last_week"], invoice_date__lte=periods["end_of_last_week"]),
+        ),
+    )
+    income = {key: value or 0 for key, value in income.items()}
+
+    metrics = {
+        "total_patients_count": branch_row["total_patients_count"],
+        "patients_this_month": branch_row["patients_this_month"],
+        "patients_last_month": branch_row["patients_last_month"],
+        "patients_growth_rate": _growth_rate(branch_row["patients_this_month"], branch_row["patients_last_month"]),
+        "appointments_this_week": appointments["appointments_this_week"],
+        "appointments_today": appointments["appointments_today"],
+        "active_doctors_count": branch_row["active_doctors_count"] or 0,
+        "income_growth_rate": _growth_rate(income["income_this_week"], income["income_last_week"]),
+    }
+    metrics.update(income)
+    return metrics
+
+
+def empty_dashboard_metrics():
+    """The metrics of a user without a branch, e.g. a ``createsuperuser`` account."""
+    return {
+        "total_patients_count": 0,
+        "patients_this_month": 0,
+        "patients_last_month": 0,
+        "patients_growth_rate": 0,
+        "appointments_this_week": 0,
+        "appointments_today": 0,
+        "active_doctors_count": 0,
+        "income_growth_rate": 0,
+        "total_income": 0,
+        "income_this_week": 0,
+        "income_last_week": 0,
+    }
+
+
+def get_dashboard_metrics(branch, today=None):
+    """Return the cached metrics snapshot of ``branch``, computing it on a miss."""
+    if branch is None:
+        return empty_dashboard_metrics()
+    today = today or get_local_date()
+    key = _cache_key(branch.pk, today)
+    metrics = _cache().get(key)
+    count_cache("dashboard_metrics", hits=metrics is not None, misses=metrics is None)
+    if metrics is None:
+        metrics = compute_dashboard_metrics(branch, today)
+        _cache().set(key, metrics, _timeout())
+    return metrics
+
+
+def invalidate_dashboard_metrics(branch_id):
+    """Drop today's snapshot of one branch so the next dashboard view recomputes it."""
+    _cache().delete(_cache_key(branch_id, get_local_date()))
@@ -0,0 +1,186 @@
+"""Server-side backend for the DataTables list endpoints.
+
+``datatables_response`` reads the standard DataTables parameters (``draw``,
+``start``, ``length``, ``search[value]``, ``order[0][...]``) and pages the
+queryset with keyset (seek) pagination: rows are ordered by
+``(sort column, pk)`` and each response carries a ``cursor`` for the last row.
+When the client sends that cursor back for the next page, the page is read
+with ``WHERE (sort, pk) > cursor LIMIT length`` instead of ``OFFSET``, so deep
+pages cost the same as the first. Requests without a matching cursor (jumping
+to an arbitrary page) fall back to ``OFFSET``.
+
+Each request runs at most one ``COUNT``. The unfiltered total comes from a
+cache (``DATATABLES_TOTAL_CACHE_TIMEOUT``) that is dropped when rows are
+added or deleted (see ``app.signals``). On PostgreSQL, totals whose planner
+estimate exceeds ``DATATABLES_ESTIMATE_THRESHOLD`` rows use the estimate
+instead of an exact count.
+"""
+import base64
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+from django.http import JsonResponse
+
+from app.metrics import count_cache
+
+CACHE_PREFIX = "datatables-total"
+DEFAULT_LENGTH = 10
+
+
+def _cache():
+    return caches[getattr(settings, "DATATABLES_CACHE_ALIAS", "default")]
+
+
+def _max_length():
+    return getattr(settings, "DATATABLES_MAX_LENGTH", 500)
+
+
+def total_cache_key(model, scope=None):
+    return f"{CACHE_PREFIX}:{model._meta.label_lower}:{scope}"
+
+
+def invalidate_total(model, scope=None):
+    """Drop the cached totals of ``model`` for ``scope`` (usually a branch id) and the unscoped list."""
+    _cache().delete_many([total_cache_key(model, scope), total_cache_key(model)])
+
+
+def estimate_count(queryset):
+    """Return the planner's row estimate for ``queryset`` on PostgreSQL, else None."""
+    if connections[queryset.db].vendor != "postgresql" or queryset.query.is_empty():
+        return None
+    plan = json.loads(queryset.order_by().explain(format="json"))
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def count_total(queryset, cache_key=None):
+    """Count ``queryset``, using the cache and (for very large results) the planner estimate."""
+    if cache_key:
+        total = _cache().get(cache_key)
+        count_cache("list_totals", hits=total is not None, misses=total is None)
+        if total is not None:
+            return total
+    estimate = estimate_count(queryset)
+    if estimate is not None and estimate >= getattr(settings, "DATATABLES_ESTIMATE_THRESHOLD", 100000):
+        total = estimate
+    else:
+        total = queryset.count()
+    if cache_key:
+        _cache().set(cache_key, total, getattr(settings, "DATATABLES_TOTAL_CACHE_TIMEOUT", 5 * 60))
+    return total
+
+
+def encode_cursor(sort_value, pk):
+    raw = json.dumps([sort_value, pk], cls=DjangoJSONEncoder).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor):
+    """Return ``(sort_value, pk)`` from ``encode_cursor``, or None if malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort_value, pk = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    return sort_value, pk
+
+
+def seek(queryset, field, descending, cursor):
+    """Keep the rows after ``cursor`` in ``(field, pk)`` order."""
+    sort_value, pk = cursor
+    after = "lt" if descending else "gt"
+    if field == "pk":
+        return queryset.filter(**{f"pk__{after}": pk})
+    return queryset.filter(Q(**{f"{field}__{after}": sort_value}) | Q(**{field: sort_value, f"pk__{after}": pk}))
+
+
+def _int_param(params, name, default):
+    try:
+        return int(params.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _ordering(params, order_columns):
+    """Return ``(field, descending)`` from ``order[0]``, defaulting to the primary key."""
+    column = params.get("order[0][column]")
+    name = params.get(f"columns[{column}][data]") if column is not None else None
+    field = order_columns.get(name, "pk") if name else "pk"
+    return field, params.get("order[0][dir]") == "desc"
+
+
+def datatables_response(request, queryset, row_to_json, search_fields=(), order_columns=None, total_key=None,
+                        search=None):
+    """Answer a DataTables server-side request for ``queryset``.
+
+    ``row_to_json`` turns one object into a row dict. ``search[value]`` is
+    applied with ``search(queryset, value)`` when given (see ``app.search``),
+    else matched with ``icontains`` against ``search_fields``. ``order_columns``
+    maps DataTables column ``data`` names to sortable (indexed) fields and
+    ``total_key`` is the cache key of the unfiltered total (see
+    ``total_cache_key``).
+    """
+    params = request.GET
+    draw = _int_param(params, "draw", 0)
+    try:
+        start = max(_int_param(params, "start", 0), 0)
+        length = _int_param(params, "length", DEFAULT_LENGTH)
+        if length < 1:
+            length = DEFAULT_LENGTH
+        length = min(length, _max_length())
+        search_value = params.get("search[value]", "").strip()
+        field, descending = _ordering(params, order_columns or {})
+
+        records_total = count_total(queryset, total_key)
+        filtered = queryset
+        if search_value and search is not None:
+            filtered = search(queryset, search_value)
+            records_filtered = filtered.count()
+        elif search_value and search_fields:
+            condition = Q()
+            for search_field in search_fields:
+                condition |= Q(**{f"{search_field}__icontains": search_value})
+            filtered = queryset.filter(condition)
+            records_filtered = filtered.count()
+        else:
+            records_filtered = records_total
+
+        prefix = "-" if descending else ""
+        ordered = filtered.order_by(f"{prefix}{field}", f"{prefix}pk") if field != "pk" else filtered.order_by(f"{prefix}pk")
+        cursor = decode_cursor(params["cursor"]) if params.get("cursor") else None
+        if cursor is not None and (field == "pk" or cursor[0] is not None):
+            page = list(seek(ordered, field, descending, cursor)[:length])
+        else:
+            page = list(ordered[start:start + length])
+
+        data = []
+        for obj in page:
+            try:
+                data.append(row_to_json(obj))
+            except Exception as e:
+                print(f"Error serializing {obj.__class__.__name__} {obj.pk}: {str(e)}")
+        next_cursor = None
+        if page:
+            last = page[-1]
+            next_cursor = encode_cursor(getattr(last, field) if field != "pk" else last.pk, last.pk)
+
+        return JsonResponse({
+            "draw": draw,
+            "recordsTotal": records_total,
+            "recordsFiltered": records_filtered,
+            "data": data,
+            "cursor": next_cursor,
+        }, encoder=DjangoJSONEncoder)
+
+    except Exception as e:
+        print(f"Error in DataTables list for {queryset.model.__name__}: {str(e)}")
+        return JsonResponse({
+            "draw": draw,
+            "recordsTotal": 0,
+            "recordsFiltered": 0,
+            "data": [],
+            "error": str(e),
+        }, status=500)
@@ -38,16 +38,46 @@ def get_doctor_branch_profile(doctor, branch):
 	).first()
 
 
-def apply_doctor_branch_pricing(doctor, branch):
-	profile = get_doctor_branch_profile(doctor, branch)
+def get_doctor_branch_profiles(doctors, branch):
+	"""Return {doctor_id: DoctorBranch} for every doctor in one query."""
+	if not branch:
+		return {}
+	doctor_ids = [doctor.id for doctor in doctors if doctor]
+	if not doctor_ids:
+		return {}
+	from app.models import DoctorBranch
+	profiles = DoctorBranch.objects.filter(
+		doctor_id__in=doctor_ids,
+		branch=branch,
+		deleted_date__isnull=True,
+		is_active=True,
+	)
+	return {profile.doctor_id: profile for profile in profiles}
+
+
+def _attach_branch_pricing(doctor, profile):
+	doctor.global_consultation_price = getattr(doctor, 'consultation_price', None)
+	doctor.global_examination_price = getattr(doctor, 'examination_price', None)
 	if profile:
-		doctor.global_consultation_price = getattr(doctor, 'consultation_price', None)
-		doctor.global_examination_price = getattr(doctor, 'examination_price', None)
 		doctor.consultation_price = profile.consultation_price
 		doctor.examination_price = profile.examination_price
-		doctor.branch_profile = profile
-	else:
-		doctor.global_consultation_price = getattr(doctor, 'consultation_price', None)
-		doctor.global_examination_price = getattr(doctor, 'examination_price', None)
-		doctor.branch_profile = None
+	doctor.branch_profile = profile
 	return doctor
+
+
+def apply_doctor_branch_pricing(doctor, branch):
+	profile = get_doctor_branch_profile(doctor, branch)
+	return _attach_branch_pricing(doctor, profile)
+
+
+def apply_doctor_branch_pricing_bulk(doctors, branch):
+	"""Attach branch prices to a doctor queryset/list using a single query.
+
+	Returns the doctors as a list so callers can keep using the priced
+	instances (a queryset would be re-fetched and lose the attributes).
+	"""
+	doctors = list(doctors)
+	profiles = get_doctor_branch_profiles(doctors, branch)
+	for doctor in doctors:
+		_attach_branch_pricing(doctor, profiles.get(doctor.id))
+	return doctors
@@ -0,0 +1,295 @@
+"""Seeded load benchmark for the front-desk views.
+
+``seed_dataset`` fills throwaway branches (``LOADBENCH_BRANCH_PREFIX``) with
+clinics, their ``ClinicSlot``s, doctors with non-overlapping weekly
+``DoctorSchedule``s, patients and any number of appointments, all with bulk
+inserts so millions of appointments take minutes rather than hours. Each
+branch gets a manager user to log in with.
+
+``run_benchmarks`` requests the busiest views of one branch through the
+Django test client and reports, per view, the p50/p95 latency, the queries
+per request and the time spent in the database, as a JSON-ready dict that
+can be diffed between commits. See the ``seed_benchmark_data`` and
+``run_benchmarks`` management commands.
+
+Running the benchmark changes the branch: ``check_in_appointment`` marks
+today's appointments as arrived and ``print_jobs_pending`` leases the print
+jobs it queues.
+"""
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from django.db import connection, transaction
+from django.test import Client
+from django.urls import reverse
+
+from app.helpers import get_local_date
+from app.models import (
+    Appointment, Branch, Clinic, ClinicSlot, DailyStats, DaysOfWeek, Doctor, DoctorBranch, DoctorSchedule, Invoice,
+    Patient, PrintJob, ScheduleStats, SlotBooking, Specialization, Status, TicketCounter, User,
+)
+from app.query_monitor import QueryRecorder
+from app.schedule_board import DAY_NAMES_EN, get_day_of_week
+from app.search import update_search_fields
+from app.slots import sync_clinic_slots
+
+LOADBENCH_BRANCH_PREFIX = "Load benchmark branch"
+
+# Appointments are spread over the past ``days`` and this many days ahead.
+FUTURE_DAYS = 14
+# Outcome of past appointments; today and later ones are OPEN.
+PAST_STATUSES = (("COMPLETED", 80), ("CANCELLED", 10), ("OPEN", 10))
+SPECIALIZATIONS = ("Cardiology", "Dermatology", "Pediatrics", "Orthopedics")
+
+VIEWS = (
+    "today_appointments", "dashboard", "get_list_of_patients", "check_in_appointment", "print_jobs_pending",
+    "api_get_slots",
+)
+
+
+def benchmark_branches():
+    return Branch.objects.filter(address__startswith=LOADBENCH_BRANCH_PREFIX).order_by("id")
+
+
+def _days_of_week():
+    """Return the DaysOfWeek row of each weekday (Monday first), creating missing ones."""
+    today = get_local_date()
+    monday = today - timedelta(days=today.weekday())
+    days = []
+    for weekday in range(7):
+        day = get_day_of_week(monday + timedelta(days=weekday))
+        if day is None:
+            day = DaysOfWeek.objects.create(name=DAY_NAMES_EN[weekday])
+        days.append(day)
+    return days
+
+
+def seed_dataset(branches=1, clinics=8, doctors=20, patients=10000, appointments=100000, days=365, batch_size=5000,
+                 seed=42, log=None):
+    """Seed ``branches`` benchmark branches; return the row counts and the seconds it took.
+
+    ``clinics``, ``doctors`` and ``patients`` are per branch, ``appointments``
+    is the total, split evenly. ``log`` receives a progress line per batch.
+    """
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    today = get_local_date()
+    week = _days_of_week()
+    specializations = [Specialization.objects.get_or_create(name=name)[0] for name in SPECIALIZATIONS]
+    statuses = {name: Status.objects.get_or_create(name=name)[0].id for name in ("OPEN", "COMPLETED", "CANCELLED")}
+    past_names, past_weights = zip(*PAST_STATUSES)
+    counts = {"branches": 0, "clinics": 0, "slots": 0, "doctors": 0, "schedules": 0, "patients": 0,
+              "appointments": 0, "invoices": 0}
+    offset = benchmark_branches().count()
+
+    for index in range(branches):
+        number = offset + index + 1
+        branch = Branch.objects.create(address=f"{LOADBENCH_BRANCH_PREFIX} {number}")
+        manager = User(username=f"loadbench{branch.id}", fullname=f"Load benchmark {number}", branch=branch,
+                       user_type=User.UserType.MANAGER)
+        manager.set_unusable_password()
+        manager.save()
+
+        branch_clinics = Clinic.objects.bulk_create(
+            Clinic(name=f"Clinic {i + 1}", branch=branch) for i in range(clinics)
+        )
+        for clinic in branch_clinics:
+            sync_clinic_slots(clinic)
+        slots_by_clinic = {clinic.id: [] for clinic in branch_clinics}
+        for slot in ClinicSlot.objects.filter(clinic__in=branch_clinics).order_by("start_time", "id"):
+            slots_by_clinic[slot.clinic_id].append(slot)
+
+        branch_doctors = []
+        for i in range(doctors):
+            doctor = Doctor(full_name=f"Doctor {number}-{i + 1}", specialization=specializations[i % len(specializations)],
+                            phone_number=f"01{number:03d}{i:06d}", branch=branch, examination_price=150,
+                            consultation_price=100)
+            update_search_fields(doctor)
+            branch_doctors.append(doctor)
+        Doctor.objects.bulk_create(branch_doctors)
+        DoctorBranch.objects.bulk_create(DoctorBranch(doctor=doctor, branch=branch) for doctor in branch_doctors)
+
+        # Doctors share their clinic's slots round-robin, every day, so schedules never overlap.
+        sessions = []  # (doctor, clinic_id, slot) an appointment can be booked in
+        schedules = []
+        schedule_slots = []
+        for i, doctor in enumerate(branch_doctors):
+            clinic = branch_clinics[i % clinics]
+            sharing = len(range(i % clinics, doctors, clinics))
+            own_slots = slots_by_clinic[clinic.id][i // clinics::sharing]
+            sessions.extend((doctor, clinic.id, slot) for slot in own_slots)
+            for day in week:
+                schedules.append(DoctorSchedule(doctor=doctor, clinic=clinic, day_of_week=day, branch=branch,
+                                                valid_from=today - timedelta(days=days)))
+                schedule_slots.append(own_slots)
+        DoctorSchedule.objects.bulk_create(schedules)
+        DoctorSchedule.clinic_slot.through.objects.bulk_create(
+            DoctorSchedule.clinic_slot.through(doctorschedule_id=schedule.id, clinicslot_id=slot.id)
+            for schedule, own_slots in zip(schedules, schedule_slots) for slot in own_slots
+        )
+
+        patient_ids = []
+        for start in range(0, patients, batch_size):
+            batch = []
+            for i in range(start, min(start + batch_size, patients)):
+                patient = Patient(name=f"Patient {number}-{i + 1}", phone_number=f"09{number:03d}{i:07d}",
+                                  age=rng.randint(1, 90), gender=rng.choice(("MALE", "FEMALE")), branch=branch)
+                update_search_fields(patient)
+                batch.append(patient)
+            patient_ids.extend(patient.id for patient in Patient.objects.bulk_create(batch))
+
+        share = appointments // branches + (1 if index < appointments % branches else 0)
+        if share and not (sessions and patient_ids):
+            raise ValueError("Appointments need at least one clinic slot, doctor and patient")
+        for start in range(0, share, batch_size):
+            batch = []
+            for _ in range(min(batch_size, share - start)):
+                doctor, clinic_id, slot = rng.choice(sessions)
+                date = today + timedelta(days=rng.randint(-days, FUTURE_DAYS))
+                status = rng.choices(past_names, past_weights)[0] if date < today else "OPEN"
+                minute = rng.choice((0, 15, 30, 45))
+                batch.append(Appointment(
+                    patient_id=rng.choice(patient_ids), doctor_id=doctor.id, clinic_id=clinic_id,
+                    status_id=statuses[status], service_type="consultation", service_price=doctor.consultation_price,
+                    date=date, time=(datetime.combine(date, slot.start_time) + timedelta(minutes=minute)).time(),
+                    branch=branch,
+                ))
+            Appointment.objects.bulk_create(batch)
+            with transaction.atomic():
+                # Numbered through the daily counter, so real checkouts on these days never clash with them.
+                invoices = Invoice.objects.bulk_create(Invoice.number_in_bulk([
+                    Invoice(appointment=appointment, total_price=appointment.service_price,
+                            status_id=statuses["COMPLETED"], invoice_date=appointment.date)
+                    for appointment in batch if appointment.status_id == statuses["COMPLETED"]
+                ]))
+            counts["appointments"] += len(batch)
+            counts["invoices"] += len(invoices)
+            if log:
+                log(f"{branch.address}: {start + len(batch)}/{share} appointments")
+
+        counts["branches"] += 1
+        counts["clinics"] += len(branch_clinics)
+        counts["slots"] += sum(len(slots) for slots in slots_by_clinic.values())
+        counts["doctors"] += len(branch_doctors)
+        counts["schedules"] += len(schedules)
+        counts["patients"] += len(patient_ids)
+
+    counts["seconds"] = round(time.perf_counter() - started, 2)
+    return counts
+
+
+def delete_dataset():
+    """Delete every benchmark branch and its rows; return how many branches were removed."""
+    branch_ids = list(benchmark_branches().values_list("id", flat=True))
+    if not branch_ids:
+        return 0
+    quote = connection.ops.quote_name
+    in_branches = f"IN ({', '.join(['%s'] * len(branch_ids))})"
+    appointments = f"SELECT id FROM {quote(Appointment._meta.db_table)} WHERE branch_id {in_branches}"
+    clinics = f"SELECT id FROM {quote(Clinic._meta.db_table)} WHERE branch_id {in_branches}"
+    slots = f"SELECT id FROM {quote(ClinicSlot._meta.db_table)} WHERE clinic_id IN ({clinics})"
+    schedules = f"SELECT id FROM {quote(DoctorSchedule._meta.db_table)} WHERE branch_id {in_branches}"
+    # Raw deletes: per-row delete signals would take far longer than the seeding.
+    statements = (
+        (PrintJob, f"appointment_id IN ({appointments})"),
+        (Invoice, f"appointment_id IN ({appointments})"),
+        (SlotBooking, f"slot_id IN ({slots})"),
+        (TicketCounter, f"branch_id {in_branches}"),
+        (DailyStats, f"branch_id {in_branches}"),
+        (ScheduleStats, f"branch_id {in_branches}"),
+        (Appointment, f"branch_id {in_branches}"),
+        (DoctorSchedule.clinic_slot.through, f"doctorschedule_id IN ({schedules})"),
+        (DoctorSchedule, f"branch_id {in_branches}"),
+        (ClinicSlot, f"clinic_id IN ({clinics})"),
+        (Clinic, f"branch_id {in_branches}"),
+        (DoctorBranch, f"branch_id {in_branches}"),
+        (Doctor, f"branch_id {in_branches}"),
+        (Patient, f"branch_id {in_branches}"),
+        (User, f"branch_id {in_branches}"),
+        (Branch, f"id {in_branches}"),
+    )
+    with connection.cursor() as cursor:
+        for model, where in statements:
+            cursor.execute(f"DELETE FROM {quote(model._meta.db_table)} WHERE {where}", branch_ids)
+    return len(branch_ids)
+
+
+def _view_requests(branch, calls):
+    """Return ``{view name: request(client, i)}`` for the benchmarked views of ``branch``."""
+    today = get_local_date()
+    day = get_day_of_week(today)
+    clinic_id = ClinicSlot.objects.filter(clinic__branch=branch, is_active=True).values_list("clinic_id", flat=True).first()
+    # One not yet arrived appointment per check-in, as at a real front desk.
+    check_ins = list(
+        Appointment.objects.filter(branch=branch, date=today, status__name="OPEN").order_by("time", "id")
+        .values_list("id", flat=True)[:calls]
+    ) or [0]
+    return {
+        "today_appointments": lambda client, i: client.get(reverse("appointments-today"), secure=True),
+        "dashboard": lambda client, i: client.get(reverse("dashboard"), secure=True),
+        "get_list_of_patients": lambda client, i: client.get(reverse("get-list-of-patients"), {
+            "draw": i + 1, "start": 0, "length": 25, "order[0][column]": 0, "order[0][dir]": "asc",
+            "columns[0][data]": "name",
+        }, secure=True),
+        "check_in_appointment": lambda client, i: client.post(
+            reverse("appointments-check-in"), {"id": check_ins[i % len(check_ins)]}, secure=True,
+        ),
+        "print_jobs_pending": lambda client, i: client.get(
+            reverse("print_jobs_pending"), {"worker": "loadbench"}, secure=True,
+        ),
+        "api_get_slots": lambda client, i: client.get(reverse("api-get-slots"), {
+            "clinic_id": clinic_id, "day_of_week_id": day.id if day else "",
+        }, secure=True),
+    }
+
+
+def _percentile(values, percent):
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[percent - 1]
+
+
+def run_benchmarks(branch, repeat=50, warmup=3, views=VIEWS):
+    """Request each of ``views`` ``warmup + repeat`` times as the manager of ``branch``.
+
+    Returns ``{view: {...}}`` with latency and database time in milliseconds
+    over the ``repeat`` measured requests; warm-up requests fill the caches
+    and are not counted.
+    """
+    manager = User.objects.filter(branch=branch, user_type=User.UserType.MANAGER, is_active=True).order_by("id").first()
+    if manager is None:
+        raise ValueError(f"Branch {branch.id} has no active manager to log in as")
+    client = Client()
+    client.force_login(manager)
+    requests = _view_requests(branch, warmup + repeat)
+
+    results = {}
+    for name in views:
+        request = requests[name]
+        latencies, db_times, queries, status_codes = [], [], [], set()
+        for i in range(warmup + repeat):
+            timer = QueryRecorder()
+            with connection.execute_wrapper(timer):
+                started = time.perf_counter()
+                response = request(client, i)
+                elapsed = time.perf_counter() - started
+            if i < warmup:
+                continue
+            latencies.append(elapsed * 1e3)
+            db_times.append(timer.seconds * 1e3)
+            queries.append(timer.count)
+            status_codes.add(response.status_code)
+        results[name] = {
+            "requests": repeat,
+            "p50_ms": round(_percentile(latencies, 50), 3),
+            "p95_ms": round(_percentile(latencies, 95), 3),
+            "max_ms": round(max(latencies), 3),
+            "queries": round(statistics.mean(queries), 2),
+            "max_queries": max(queries),
+            "db_p50_ms": round(_percentile(db_times, 50), 3),
+            "db_p95_ms": round(_percentile(db_times, 95), 3),
+            "status_codes": sorted(status_codes),
+        }
+    return results
@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
-from datetime import datetime, timedelta
-from app.models import Clinic, ClinicSlot, Branch
+from datetime import datetime
+from app.models import Clinic, Branch
+from app.slots import sync_clinic_slots
 
 
 class Command(BaseCommand):
@@ -15,6 +16,12 @@ class Command(BaseCommand):
 
         self.stdout.write(self.style.SUCCESS(f"✅ Found Branch: {branch.address}"))
 
+        # Morning slots 09:00-13:00 plus the late 23:00-00:00 slot.
+        windows = [
+            (datetime.strptime("09:00", "%H:%M").time(), datetime.strptime("13:00", "%H:%M").time()),
+            (datetime.strptime("23:00", "%H:%M").time(), datetime.strptime("00:00", "%H:%M").time()),
+        ]
+
         # Create/Update clinics عيادة 1 to عيادة 8
         clinic_names = [f"عيادة {i}" for i in range(1, 9)]
         
@@ -38,51 +45,9 @@ class Command(BaseCommand):
             if not created:
                 self.stdout.write(self.style.WARNING(f"⚠️  {clinic_name} already exists, adding missing morning slots..."))
             
-            # Generate 1-hour slots from 09:00 to 13:00 (morning slots)
-            open_time = datetime.combine(datetime.today(), datetime.strptime("09:00", "%H:%M").time())
-            close_time = datetime.combine(datetime.today(), datetime.strptime("13:00", "%H:%M").time())
-            slot_duration = timedelta(hours=1)
-            
-            created_slots = 0
-            while open_time + slot_duration <= close_time:
-                # Check if slot already exists
-                if not ClinicSlot.objects.filter(
-                    clinic=clinic,
-                    start_time=open_time.time(),
-                    end_time=(open_time + slot_duration).time()
-                ).exists():
-                    ClinicSlot.objects.create(
-                        clinic=clinic,
-                        start_time=open_time.time(),
-                        end_time=(open_time + slot_duration).time(),
-                        is_active=True,
-                        added_by=None,
-                        added_date=None,
-                        updated_by=None,
-                        updated_date=None,
-                    )
-                    created_slots += 1
-                open_time += slot_duration
-
-            # Add late slot from 23:00 to 00:00
-            late_start = datetime.strptime("23:00", "%H:%M").time()
-            late_end = datetime.strptime("00:00", "%H:%M").time()
-            if not ClinicSlot.objects.filter(
-                clinic=clinic,
-                start_time=late_start,
-                end_time=late_end,
-            ).exists():
-                ClinicSlot.objects.create(
-                    clinic=clinic,
-                    start_time=late_start,
-                    end_time=late_end,
-                    is_active=True,
-                    added_by=None,
-                    added_date=None,
-                    updated_by=None,
-                    updated_date=None,
-                )
-                created_slots += 1
+            # Only add what is missing; existing slots and their schedule links stay.
+            changes = sync_clinic_slots(clinic, windows=windows, remove_extra=False)
+            created_slots = changes["created"] + changes["revived"]
             
             status = "✅ Updated" if not created else "✅ Created"
             self.stdout.write(self.style.SUCCESS(f"{status} {clinic_name}, added {created_slots} morning slots (09:00-13:00)"))
@@ -0,0 +1,85 @@
+"""
+Concurrent booking stress test for slot capacity.
+"""
+import datetime
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from app.booking import SlotFull, book_appointment
+from app.models import Appointment, Clinic, ClinicSlot, Doctor, Patient, SlotBooking, Specialization, Status
+
+# Appointments are booked on a day no real appointment uses, so the run can be cleaned up.
+BENCHMARK_DATE = datetime.date(2000, 1, 1)
+
+
+class Command(BaseCommand):
+    help = "Book one slot from several threads and check it never takes more than its capacity"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--attempts", type=int, default=20, help="Booking attempts per thread")
+        parser.add_argument("--capacity", type=int, default=50)
+
+    def handle(self, *args, **options):
+        threads, attempts, capacity = options["threads"], options["attempts"], options["capacity"]
+        if Appointment.all_objects.filter(date=BENCHMARK_DATE).exists():
+            raise CommandError(f"Appointments dated {BENCHMARK_DATE} already exist; refusing to run")
+
+        specialization = Specialization.objects.create(name=f"benchmark-{time.time_ns()}")
+        doctor = Doctor.objects.create(full_name="Benchmark", specialization=specialization, phone_number="0")
+        clinic = Clinic.objects.create(name="Benchmark")
+        slot = ClinicSlot.objects.create(
+            clinic=clinic, start_time=datetime.time(9, 0), end_time=datetime.time(10, 0), capacity=capacity,
+        )
+        patient = Patient.objects.create(name="Benchmark", phone_number="0")
+        status, _ = Status.objects.get_or_create(name="OPEN")
+        try:
+            booked, full, errors = [], [], []
+
+            def book():
+                try:
+                    for _ in range(attempts):
+                        try:
+                            book_appointment(
+                                patient=patient, doctor=doctor, clinic=clinic, status=status,
+                                service_type="consultation", date=BENCHMARK_DATE, time=datetime.time(9, 30),
+                            )
+                            booked.append(1)
+                        except SlotFull:
+                            full.append(1)
+                except Exception as exc:
+                    errors.append(exc)
+                finally:
+                    connection.close()
+
+            workers = [threading.Thread(target=book) for _ in range(threads)]
+            started = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - started
+
+            stored = Appointment.objects.filter(date=BENCHMARK_DATE, doctor=doctor).count()
+            counter = SlotBooking.objects.filter(doctor=doctor, slot=slot, date=BENCHMARK_DATE).first()
+            self.stdout.write(
+                f"{len(booked) + len(full)} attempts from {threads} threads in {elapsed * 1e3:.1f} ms: "
+                f"{len(booked)} booked, {len(full)} rejected as full"
+            )
+            if errors:
+                raise CommandError(f"{len(errors)} thread(s) failed: {errors[0]!r}")
+            expected = min(capacity, threads * attempts)
+            if not (len(booked) == stored == expected and counter is not None and counter.booked == expected):
+                raise CommandError(
+                    f"Expected {expected} bookings, got {len(booked)} booked, {stored} stored, "
+                    f"counter {counter.booked if counter else None}"
+                )
+            self.stdout.write(self.style.SUCCESS("Capacity held under concurrent booking"))
+        finally:
+            # Deleting the doctor cascades to the benchmark appointments and counters.
+            doctor.delete()
+            for row in (patient, clinic, specialization):
+                row.delete()
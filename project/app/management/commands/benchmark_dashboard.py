@@ -0,0 +1,138 @@
+"""
+Latency of the dashboard metrics: the previous per-metric queries against
+``compute_dashboard_metrics`` and the cached snapshot.
+"""
+import datetime
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.test.utils import CaptureQueriesContext
+
+from app.dashboard_metrics import compute_dashboard_metrics, get_dashboard_metrics, invalidate_dashboard_metrics
+from app.helpers import get_local_date
+from app.models import Appointment, Branch, Clinic, Doctor, DoctorBranch, Invoice, Patient, Specialization, Status
+
+
+def legacy_metrics(branch, today):
+    """The dashboard queries as they were before conditional aggregation."""
+    start_of_current_month = today.replace(day=1)
+    start_of_previous_month = (start_of_current_month - timedelta(days=1)).replace(day=1)
+    end_of_previous_month = start_of_current_month - timedelta(days=1)
+    start_of_week = today - timedelta(days=today.weekday())
+    end_of_week = start_of_week + timedelta(days=6)
+    patients = Patient.objects.filter(branch=branch, deleted_date__isnull=True)
+    appointments = Appointment.objects.filter(branch=branch, deleted_date__isnull=True)
+    invoices = Invoice.objects.filter(appointment__branch=branch, deleted_date__isnull=True)
+    return [
+        patients.count(),
+        patients.filter(added_date__gte=start_of_current_month, added_date__lte=today).count(),
+        patients.filter(added_date__gte=start_of_previous_month, added_date__lte=end_of_previous_month).count(),
+        appointments.filter(date__gte=start_of_week, date__lte=end_of_week).count(),
+        appointments.filter(date=today).count(),
+        DoctorBranch.objects.filter(
+            branch=branch, deleted_date__isnull=True, is_active=True,
+            doctor__deleted_date__isnull=True, doctor__is_active=True,
+        ).count(),
+        invoices.aggregate(Sum("total_price"))["total_price__sum"],
+        invoices.filter(created_at__date__gte=start_of_week, created_at__date__lte=end_of_week).aggregate(Sum("total_price")),
+        invoices.filter(
+            created_at__date__gte=start_of_week - timedelta(days=7), created_at__date__lte=start_of_week - timedelta(days=1),
+        ).aggregate(Sum("total_price")),
+    ]
+
+
+class Command(BaseCommand):
+    help = "Compare dashboard metrics latency: legacy queries, conditional aggregation and the cached snapshot"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--branch", type=int, help="Measure an existing branch id")
+        parser.add_argument("--seed", type=int, default=0, help="Seed a throwaway branch with this many appointments")
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--keep", action="store_true", help="Keep the seeded branch for later runs")
+
+    def handle(self, *args, **options):
+        if options["seed"]:
+            branch = self.seed(options["seed"])
+        elif options["branch"] is not None:
+            branch = Branch.objects.filter(id=options["branch"]).first()
+            if branch is None:
+                raise CommandError(f"Branch {options['branch']} does not exist")
+        else:
+            raise CommandError("Pass --branch or --seed")
+
+        try:
+            today = get_local_date()
+            self.report("legacy queries", lambda: legacy_metrics(branch, today), options["repeat"])
+            self.report("conditional aggregation", lambda: compute_dashboard_metrics(branch, today), options["repeat"])
+            invalidate_dashboard_metrics(branch.id)
+            get_dashboard_metrics(branch, today)
+            self.report("cached snapshot", lambda: get_dashboard_metrics(branch, today), options["repeat"])
+        finally:
+            if options["seed"] and not options["keep"]:
+                self.cleanup(branch)
+
+    def report(self, label, compute, repeat):
+        timings = []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                compute()
+                timings.append(time.perf_counter() - started)
+        self.stdout.write(
+            f"{label:<24} median {statistics.median(timings) * 1e3:9.2f} ms  "
+            f"max {max(timings) * 1e3:9.2f} ms  {len(queries)} queries"
+        )
+
+    def seed(self, count):
+        rng = random.Random(42)
+        branch = Branch.objects.create(address="Benchmark branch")
+        specialization, _ = Specialization.objects.get_or_create(name="Benchmark")
+        status, _ = Status.objects.get_or_create(name="COMPLETED")
+        doctors = Doctor.objects.bulk_create(
+            Doctor(full_name=f"Benchmark doctor {i}", specialization=specialization, phone_number=f"0{i:09d}")
+            for i in range(50)
+        )
+        DoctorBranch.objects.bulk_create(DoctorBranch(doctor=doctor, branch=branch) for doctor in doctors)
+        clinics = Clinic.objects.bulk_create(Clinic(name=f"Benchmark {i}", branch=branch) for i in range(10))
+        patients = Patient.objects.bulk_create(
+            (Patient(name=f"Benchmark {i}", phone_number=f"1{i:09d}", branch=branch) for i in range(max(count // 20, 1))),
+            batch_size=5000,
+        )
+        today = get_local_date()
+        started = time.perf_counter()
+        for offset in range(0, count, 5000):
+            appointments = Appointment.objects.bulk_create(
+                Appointment(
+                    patient=rng.choice(patients), doctor=rng.choice(doctors), clinic=rng.choice(clinics),
+                    status=status, service_type="consultation", service_price=100, branch=branch,
+                    date=today - timedelta(days=rng.randint(0, 3 * 365)), time=datetime.time(rng.randint(9, 22), 0),
+                )
+                for _ in range(min(5000, count - offset))
+            )
+            with transaction.atomic():
+                # Numbered through the daily counter, so real checkouts never get the same number.
+                Invoice.objects.bulk_create(Invoice.number_in_bulk([
+                    Invoice(appointment=appointment, total_price=100, status=status, invoice_date=appointment.date)
+                    for appointment in appointments
+                ]))
+        self.stdout.write(f"Seeded {count} appointments and invoices in {time.perf_counter() - started:.1f} s")
+        return branch
+
+    def cleanup(self, branch):
+        # Raw deletes: per-row delete signals would take far longer than the benchmark.
+        with connection.cursor() as cursor:
+            for model, column in ((Invoice, "appointment_id"), (Appointment, "branch_id")):
+                where = (
+                    f"{column} IN (SELECT id FROM {Appointment._meta.db_table} WHERE branch_id = %s)"
+                    if model is Invoice else f"{column} = %s"
+                )
+                cursor.execute(f"DELETE FROM {model._meta.db_table} WHERE {where}", [branch.id])
+        Patient.objects.filter(branch=branch).delete()
+        Doctor.objects.filter(branch_profiles__branch=branch).delete()
+        Clinic.objects.filter(branch=branch).delete()
+        branch.delete()
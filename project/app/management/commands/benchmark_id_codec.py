@@ -0,0 +1,59 @@
+"""
+Micro-benchmark for the hashed-id codecs on a DataTables-sized page.
+"""
+import random
+import time
+from functools import lru_cache
+
+from cryptography.fernet import Fernet
+from django.core.management.base import BaseCommand
+
+from app.id_codec import ID_CODECS
+from project.settings import key_hashing
+
+
+class Command(BaseCommand):
+    help = "Measure per-row cost of hash-id encoding for a page of Appointment.tojson rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10000)
+        parser.add_argument("--doctors", type=int, default=50)
+        parser.add_argument("--patients", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        rows = options["rows"]
+        rng = random.Random(42)
+        # Appointment.tojson hashes the appointment, patient, doctor and specialization ids.
+        page = [
+            (
+                appointment_id,
+                rng.randint(1, options["patients"]),
+                rng.randint(1, options["doctors"]),
+                rng.randint(1, 10),
+            )
+            for appointment_id in range(1, rows + 1)
+        ]
+
+        # Baseline: a new Fernet instance per call, as get_id_hashed_of_object used to do.
+        self.report("fernet (per-call)", lambda object_id: Fernet(key_hashing).encrypt(str(object_id).encode()), page)
+        for name, codec_class in ID_CODECS.items():
+            codec = codec_class()
+            self.report(f"{name} (uncached)", codec.encode, page)
+            self.report(f"{name} (memoized)", lru_cache(maxsize=65536)(codec.encode), page)
+
+            tokens = [codec.encode(ids[0]) for ids in page]
+            started = time.perf_counter()
+            for token in tokens:
+                codec.decode(token)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"{name + ' decode':<22} {elapsed * 1e6 / rows:8.2f} us/token")
+
+    def report(self, label, encode, page):
+        started = time.perf_counter()
+        for ids in page:
+            for object_id in ids:
+                encode(object_id)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"{label:<22} {elapsed * 1e6 / len(page):8.2f} us/row  {elapsed * 1e3:9.1f} ms/page of {len(page)} rows"
+        )
@@ -0,0 +1,80 @@
+"""
+Throughput benchmark for daily invoice numbering under concurrent checkout.
+"""
+import datetime
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from app.models import Appointment, Clinic, Doctor, Invoice, InvoiceCounter, Patient, Specialization, Status
+
+# Invoices are filed under a day no real invoice uses, so the run can be cleaned up.
+BENCHMARK_DATE = datetime.date(2000, 1, 1)
+
+
+class Command(BaseCommand):
+    help = "Create invoices from several threads and check their daily numbers are unique and gap-free"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--invoices", type=int, default=50, help="Invoices per thread")
+
+    def handle(self, *args, **options):
+        threads, per_thread = options["threads"], options["invoices"]
+        total = threads * per_thread
+        if Invoice.objects.filter(invoice_date=BENCHMARK_DATE).exists():
+            raise CommandError(f"Invoices dated {BENCHMARK_DATE} already exist; refusing to run")
+
+        specialization = Specialization.objects.create(name=f"benchmark-{time.time_ns()}")
+        doctor = Doctor.objects.create(full_name="Benchmark", specialization=specialization, phone_number="0")
+        clinic = Clinic.objects.create(name="Benchmark")
+        patient = Patient.objects.create(name="Benchmark", phone_number="0")
+        status, _ = Status.objects.get_or_create(name="PAID")
+        try:
+            appointments = Appointment.objects.bulk_create(
+                Appointment(
+                    patient=patient, doctor=doctor, clinic=clinic, status=status,
+                    service_type="consultation", date=BENCHMARK_DATE, time=datetime.time(9, 0),
+                )
+                for _ in range(total)
+            )
+            batches = [appointments[i::threads] for i in range(threads)]
+            errors = []
+
+            def checkout(batch):
+                try:
+                    for appointment in batch:
+                        Invoice.objects.create(
+                            appointment=appointment, total_price=100, status=status, invoice_date=BENCHMARK_DATE,
+                        )
+                except Exception as exc:
+                    errors.append(exc)
+                finally:
+                    connection.close()
+
+            workers = [threading.Thread(target=checkout, args=(batch,)) for batch in batches]
+            started = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - started
+
+            numbers = sorted(Invoice.objects.filter(invoice_date=BENCHMARK_DATE).values_list("invoice_number", flat=True))
+            self.stdout.write(
+                f"{len(numbers)} invoices from {threads} threads in {elapsed * 1e3:.1f} ms "
+                f"({len(numbers) / elapsed:.0f} invoices/s)"
+            )
+            if errors:
+                raise CommandError(f"{len(errors)} thread(s) failed: {errors[0]!r}")
+            if numbers != list(range(1, total + 1)):
+                raise CommandError("Invoice numbers are not unique and gap-free")
+            self.stdout.write(self.style.SUCCESS("Numbers are unique and gap-free"))
+        finally:
+            # Deleting the doctor cascades to the benchmark appointments and invoices.
+            doctor.delete()
+            for row in (patient, clinic, specialization):
+                row.delete()
+            InvoiceCounter.objects.filter(date=BENCHMARK_DATE).delete()
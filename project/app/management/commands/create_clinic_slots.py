@@ -1,34 +1,29 @@
-from django.core.management.base import BaseCommand
-from datetime import datetime, timedelta
-from app.models import Clinic, ClinicSlot  # 🔁 change 'app' to your actual app name
+from django.core.management.base import BaseCommand, CommandError
 
-class Command(BaseCommand):
-    help = "Generate 1-hour clinic slots based on each clinic's open and close times"
-
-    def handle(self, *args, **options):
-        clinics = Clinic.objects.filter(is_active=True)
+from app.models import Branch
+from app.slots import sync_all_slots, sync_branch_slots
 
-        for clinic in clinics:
-            self.stdout.write(self.style.WARNING(f"Creating slots for: {clinic.name}"))
 
-            # Delete old slots
-            ClinicSlot.objects.filter(clinic=clinic).delete()
+class Command(BaseCommand):
+    help = "Generate clinic slots from each clinic's open/close times and slot_duration_hours"
 
-            open_time = datetime.combine(datetime.today(), clinic.default_open_time)
-            close_time = datetime.combine(datetime.today(), clinic.default_close_time)
-            slot_duration = timedelta(hours=1)
+    def add_arguments(self, parser):
+        parser.add_argument('--branch', type=int, help='Only sync the clinics of this branch id')
+        parser.add_argument('--workers', type=int, default=1, help='Worker processes (one branch per task)')
+        parser.add_argument('--keep-extra', action='store_true', help='Keep slots outside the clinic hours')
 
-            created = 0
-            while open_time + slot_duration <= close_time:
-                ClinicSlot.objects.create(
-                    clinic=clinic,
-                    start_time=open_time.time(),
-                    end_time=(open_time + slot_duration).time(),
-                    is_active=True
-                )
-                created += 1
-                open_time += slot_duration
+    def handle(self, *args, **options):
+        remove_extra = not options['keep_extra']
+        if options['branch'] is not None:
+            if not Branch.objects.filter(id=options['branch']).exists():
+                raise CommandError(f"Branch {options['branch']} does not exist")
+            results = {options['branch']: sync_branch_slots(options['branch'], remove_extra)}
+        else:
+            results = sync_all_slots(workers=options['workers'], remove_extra=remove_extra)
 
-            self.stdout.write(self.style.SUCCESS(f"✅ Created {created} slots for {clinic.name}"))
-        
+        for branch_id, totals in results.items():
+            self.stdout.write(
+                f"Branch {branch_id}: {totals['clinics']} clinics, {totals['created']} created, "
+                f"{totals['revived']} revived, {totals['removed']} removed"
+            )
         self.stdout.write(self.style.SUCCESS("🎯 All clinic slots have been generated successfully."))
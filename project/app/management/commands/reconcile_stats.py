@@ -0,0 +1,40 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.helpers import get_local_date
+from app.models import Branch
+from app.stats import rebuild_stats
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise CommandError(f"Invalid date {value!r}, expected YYYY-MM-DD")
+
+
+class Command(BaseCommand):
+    help = 'Rebuild DailyStats and ScheduleStats from appointments for a date range'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', help='First date (YYYY-MM-DD), defaults to today')
+        parser.add_argument('--to', dest='end', help='Last date (YYYY-MM-DD), defaults to --from')
+        parser.add_argument('--branch', type=int, help='Only rebuild this branch id')
+
+    def handle(self, *args, **options):
+        start = parse_date(options['start']) if options['start'] else get_local_date()
+        end = parse_date(options['end']) if options['end'] else start
+        if end < start:
+            raise CommandError('--to must not be before --from')
+
+        branch = None
+        if options['branch'] is not None:
+            branch = Branch.objects.filter(id=options['branch']).first()
+            if branch is None:
+                raise CommandError(f"Branch {options['branch']} does not exist")
+
+        daily_rows, schedule_rows = rebuild_stats(start, end, branch)
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {daily_rows} DailyStats and {schedule_rows} ScheduleStats rows from {start} to {end}'
+        ))
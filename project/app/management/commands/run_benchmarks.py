@@ -0,0 +1,76 @@
+"""
+Request the front-desk views of a seeded branch and report p50/p95 latency,
+queries and database time per view as JSON (see ``app.loadbench``).
+"""
+import json
+import subprocess
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from app.loadbench import VIEWS, benchmark_branches, run_benchmarks
+from app.models import Appointment, Branch, Patient
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = "Benchmark the front-desk views through the test client and print the results as JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--branch", type=int, help="Branch id (default: the first seeded benchmark branch)")
+        parser.add_argument("--repeat", type=int, default=50, help="Measured requests per view")
+        parser.add_argument("--warmup", type=int, default=3, help="Unmeasured requests per view first")
+        parser.add_argument("--views", help=f"Comma separated subset of: {', '.join(VIEWS)}")
+        parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+
+    def handle(self, *args, **options):
+        if options["branch"] is not None:
+            branch = Branch.objects.filter(id=options["branch"]).first()
+            if branch is None:
+                raise CommandError(f"Branch {options['branch']} does not exist")
+        else:
+            branch = benchmark_branches().first()
+            if branch is None:
+                raise CommandError("No benchmark branch; run seed_benchmark_data or pass --branch")
+        views = options["views"].split(",") if options["views"] else list(VIEWS)
+        unknown = sorted(set(views) - set(VIEWS))
+        if unknown:
+            raise CommandError(f"Unknown views: {', '.join(unknown)}")
+        if options["repeat"] < 1 or options["warmup"] < 0:
+            raise CommandError("--repeat must be at least 1 and --warmup not negative")
+
+        started_at = timezone.now()
+        try:
+            results = run_benchmarks(branch, options["repeat"], options["warmup"], views)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        report = {
+            "commit": current_commit(),
+            "started_at": started_at.isoformat(),
+            "database": connection.vendor,
+            "branch": branch.id,
+            "dataset": {
+                "appointments": Appointment.objects.filter(branch=branch).count(),
+                "patients": Patient.objects.filter(branch=branch).count(),
+            },
+            "repeat": options["repeat"],
+            "warmup": options["warmup"],
+            "views": results,
+        }
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as handle:
+                handle.write(output + "\n")
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,51 @@
+"""
+Seed throwaway branches for the ``run_benchmarks`` load benchmark (see ``app.loadbench``).
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from app.loadbench import benchmark_branches, delete_dataset, seed_dataset
+
+
+class Command(BaseCommand):
+    help = "Seed load benchmark branches with clinics, slots, schedules, patients and appointments"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--branches", type=int, default=1)
+        parser.add_argument("--clinics", type=int, default=8, help="Clinics per branch")
+        parser.add_argument("--doctors", type=int, default=20, help="Doctors per branch")
+        parser.add_argument("--patients", type=int, default=10000, help="Patients per branch")
+        parser.add_argument("--appointments", type=int, default=100000, help="Appointments over all branches")
+        parser.add_argument("--days", type=int, default=365, help="Spread appointments over this many past days")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=42, help="Random seed, for reproducible datasets")
+        parser.add_argument("--clear", action="store_true", help="Delete the existing benchmark branches first")
+        parser.add_argument("--delete", action="store_true", help="Only delete the benchmark branches")
+
+    def handle(self, *args, **options):
+        if options["clear"] or options["delete"]:
+            removed = delete_dataset()
+            self.stdout.write(f"Deleted {removed} benchmark branches")
+            if options["delete"]:
+                return
+        elif benchmark_branches().exists():
+            raise CommandError("Benchmark branches already exist; pass --clear to replace them")
+
+        for name in ("branches", "clinics", "doctors", "batch_size"):
+            if options[name] < 1:
+                raise CommandError(f"--{name.replace('_', '-')} must be at least 1")
+        if min(options["patients"], options["appointments"], options["days"]) < 0:
+            raise CommandError("--patients, --appointments and --days must not be negative")
+
+        try:
+            counts = seed_dataset(
+                branches=options["branches"], clinics=options["clinics"], doctors=options["doctors"],
+                patients=options["patients"], appointments=options["appointments"], days=options["days"],
+                batch_size=options["batch_size"], seed=options["seed"],
+                log=self.stdout.write if options["verbosity"] > 1 else None,
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(
+            ", ".join(f"{count} {name}" for name, count in counts.items() if name != "seconds")
+            + f" seeded in {counts['seconds']:.1f} s"
+        ))
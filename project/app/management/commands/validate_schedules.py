@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.models import Branch
+from app.schedule_conflicts import describe_conflict, find_branch_conflicts
+
+
+class Command(BaseCommand):
+    help = 'Report overlapping doctor schedules (same clinic or same doctor at the same time)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--branch', type=int, help='Only check this branch id')
+
+    def handle(self, *args, **options):
+        branches = Branch.objects.order_by('id')
+        if options['branch'] is not None:
+            branches = branches.filter(id=options['branch'])
+            if not branches.exists():
+                raise CommandError(f"Branch {options['branch']} does not exist")
+
+        total = 0
+        for branch in branches:
+            conflicts = find_branch_conflicts(branch)
+            total += len(conflicts)
+            for conflict in conflicts:
+                self.stdout.write(
+                    f"Branch {branch.id}: schedule {conflict.slot.schedule_id} ({conflict.slot.doctor_name}, "
+                    f"{conflict.slot.clinic_name}, day {conflict.slot.day_id}) - {describe_conflict(conflict)}"
+                )
+        if total:
+            self.stdout.write(self.style.ERROR(f'{total} schedule conflicts found'))
+        else:
+            self.stdout.write(self.style.SUCCESS('No schedule conflicts found'))
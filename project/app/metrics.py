@@ -0,0 +1,214 @@
+"""Prometheus metrics shared by the web worker processes.
+
+Each process counts into a ``MetricStore``: request latency histograms by
+URL name and status, database queries and time, cache hits and misses and
+ticket assignment latency. The ``metrics`` view (``app.com.monitoring``)
+renders them in the Prometheus text format, followed by gauges read from the
+database at scrape time (print jobs per branch and state).
+
+With ``METRICS_DIR`` set, every process writes its counts to
+``<METRICS_DIR>/<pid>.json`` at most every ``METRICS_FLUSH_INTERVAL``
+seconds (a temporary file renamed over the old one, so readers never see a
+partial write), and a scrape sums the files of all workers. Files of exited
+workers are kept so counters never go backwards; empty the directory when
+the server restarts. Without ``METRICS_DIR`` a scrape sees only the process
+that answers it, which is enough for a single gunicorn worker.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Count
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TICKET_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+HISTOGRAMS = {
+    "clinic_http_request_duration_seconds": ("Request latency by URL name and status.", LATENCY_BUCKETS),
+    "clinic_ticket_assignment_seconds": ("Time to hand out a check-in ticket number.", TICKET_BUCKETS),
+}
+COUNTERS = {
+    "clinic_db_queries_total": "Database queries by URL name.",
+    "clinic_db_query_seconds_total": "Seconds spent in database queries by URL name.",
+    "clinic_cache_requests_total": "Cache lookups by cache and result.",
+}
+
+
+def _labels(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class MetricStore:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.counters = defaultdict(float)  # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> [count per bucket..., sum]
+        self.flushed_at = 0.0
+
+    def _check_fork(self):
+        # A forked worker starts from zero instead of counting the parent's requests again.
+        if os.getpid() != self.pid:
+            self.pid = os.getpid()
+            self.counters.clear()
+            self.histograms.clear()
+            self.flushed_at = 0.0
+
+    def inc(self, name, amount=1, **labels):
+        with self.lock:
+            self._check_fork()
+            self.counters[name, _labels(labels)] += amount
+
+    def observe(self, name, value, **labels):
+        buckets = HISTOGRAMS[name][1]
+        with self.lock:
+            self._check_fork()
+            key = (name, _labels(labels))
+            counts = self.histograms.get(key)
+            if counts is None:
+                counts = self.histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+            for position, bound in enumerate(buckets):
+                if value <= bound:
+                    counts[position] += 1
+                    break
+            else:
+                counts[len(buckets)] += 1
+            counts[-1] += value
+
+    def dump(self):
+        with self.lock:
+            self._check_fork()
+            return {
+                "counters": [[name, labels, value] for (name, labels), value in self.counters.items()],
+                "histograms": [[name, labels, counts] for (name, labels), counts in self.histograms.items()],
+            }
+
+    def flush(self, force=False):
+        """Write this process's counts to ``METRICS_DIR``, at most every ``METRICS_FLUSH_INTERVAL`` seconds."""
+        directory = getattr(settings, "METRICS_DIR", None)
+        now = time.monotonic()
+        if not directory or (not force and now - self.flushed_at < getattr(settings, "METRICS_FLUSH_INTERVAL", 5)):
+            return
+        self.flushed_at = now
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        handle, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(handle, "w") as output:
+            json.dump(self.dump(), output)
+        os.replace(temporary, os.path.join(directory, f"{os.getpid()}.json"))
+
+    def collect(self):
+        """Return the counts of every worker (or of this process alone) as ``(counters, histograms)``."""
+        directory = getattr(settings, "METRICS_DIR", None)
+        if directory:
+            self.flush(force=True)
+            dumps = []
+            for path in Path(directory).glob("*.json"):
+                try:
+                    dumps.append(json.loads(path.read_text()))
+                except (OSError, ValueError):
+                    continue  # replaced or removed while reading
+        else:
+            dumps = [self.dump()]
+        counters = defaultdict(float)
+        histograms = {}
+        for dump in dumps:
+            for name, labels, value in dump["counters"]:
+                counters[name, tuple(map(tuple, labels))] += value
+            for name, labels, counts in dump["histograms"]:
+                key = (name, tuple(map(tuple, labels)))
+                if key in histograms:
+                    histograms[key] = [total + count for total, count in zip(histograms[key], counts)]
+                else:
+                    histograms[key] = list(counts)
+        return counters, histograms
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+store = MetricStore()
+
+
+def count_cache(cache, hits=0, misses=0):
+    if hits:
+        store.inc("clinic_cache_requests_total", hits, cache=cache, result="hit")
+    if misses:
+        store.inc("clinic_cache_requests_total", misses, cache=cache, result="miss")
+
+
+def record_request(view, status, seconds, recorder):
+    store.observe("clinic_http_request_duration_seconds", seconds, view=view, status=status)
+    store.inc("clinic_db_queries_total", recorder.count, view=view)
+    store.inc("clinic_db_query_seconds_total", recorder.seconds, view=view)
+    store.flush()
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _sample(name, labels, value):
+    if labels:
+        name += "{" + ",".join(f'{key}="{_escape(str(label))}"' for key, label in labels) + "}"
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return f"{name} {value}"
+
+
+def _header(name, kind, help_text):
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+
+
+def print_queue_depth():
+    """Return ``{(branch_id, status): count}`` of the print jobs not done yet."""
+    from app.models import PrintJob  # app.models imports modules that count into this one
+    rows = (
+        PrintJob.objects.exclude(status=PrintJob.Status.DONE)
+        .values("appointment__branch_id", "status")
+        .annotate(jobs=Count("id"))
+        .order_by()
+    )
+    return {(row["appointment__branch_id"], row["status"]): row["jobs"] for row in rows}
+
+
+def render_metrics():
+    """Return every metric in the Prometheus text exposition format."""
+    counters, histograms = store.collect()
+    lines = []
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        lines += _header(name, "histogram", help_text)
+        for (metric, labels), counts in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(_sample(f"{name}_bucket", labels + (("le", str(bound)),), cumulative))
+            lines.append(_sample(f"{name}_sum", labels, counts[-1]))
+            lines.append(_sample(f"{name}_count", labels, cumulative))
+    for name, help_text in COUNTERS.items():
+        lines += _header(name, "counter", help_text)
+        lines += [_sample(name, labels, value) for (metric, labels), value in sorted(counters.items()) if metric == name]
+
+    lookups = defaultdict(lambda: {"hit": 0, "miss": 0})
+    for (metric, labels), value in counters.items():
+        if metric == "clinic_cache_requests_total":
+            labels = dict(labels)
+            lookups[labels["cache"]][labels["result"]] += value
+    lines += _header("clinic_cache_hit_ratio", "gauge", "Share of cache lookups that hit, since the workers started.")
+    for cache, results in sorted(lookups.items()):
+        lines.append(_sample("clinic_cache_hit_ratio", (("cache", cache),), results["hit"] / (results["hit"] + results["miss"])))
+
+    lines += _header("clinic_print_jobs", "gauge", "Print jobs not done yet by branch and state.")
+    for (branch_id, status), jobs in sorted(print_queue_depth().items(), key=lambda item: (str(item[0][0]), item[0][1])):
+        lines.append(_sample("clinic_print_jobs", (("branch", "" if branch_id is None else branch_id), ("state", status)), jobs))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,79 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+from app import metrics, profiling, slow_queries
+from app.query_monitor import QueryRecorder, record_request, view_label
+
+
+class MetricsMiddleware:
+    """Count every request into the Prometheus histograms of ``app.metrics``."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if not getattr(settings, "METRICS_ENABLED", True):
+            raise MiddlewareNotUsed
+
+    def __call__(self, request):
+        recorder = QueryRecorder(fingerprints=False)
+        started = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        metrics.record_request(view_label(request), response.status_code, time.perf_counter() - started, recorder)
+        return response
+
+
+class QueryMonitorMiddleware:
+    """Record queries, database time and N+1 patterns of sampled requests (see ``app.query_monitor``)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, "QUERY_MONITOR_SAMPLE_RATE", 0.1)
+        if self.sample_rate <= 0:
+            raise MiddlewareNotUsed
+
+    def __call__(self, request):
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return self.get_response(request)
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        record_request(view_label(request), time.perf_counter() - started, recorder)
+        return response
+
+
+class SlowQueryMiddleware:
+    """Record statements slower than ``SLOW_QUERY_THRESHOLD_MS`` (see ``app.slow_queries``)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        threshold = getattr(settings, "SLOW_QUERY_THRESHOLD_MS", None)
+        if threshold is None:
+            raise MiddlewareNotUsed
+        self.threshold = threshold / 1e3
+
+    def __call__(self, request):
+        collector = slow_queries.SlowQueryCollector(request, self.threshold)
+        with connection.execute_wrapper(collector):
+            response = self.get_response(request)
+        if collector.captured:
+            slow_queries.submit(collector.captured)
+        return response
+
+
+class ProfilingMiddleware:
+    """Profile the requests of managers that ask for it (see ``app.profiling``)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if not getattr(settings, "PROFILING_ENABLED", True):
+            raise MiddlewareNotUsed
+
+    def __call__(self, request):
+        if profiling.wants_profile(request) and profiling.may_profile(request.user):
+            return profiling.profile_request(request, self.get_response)
+        return self.get_response(request)
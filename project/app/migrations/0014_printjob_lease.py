@@ -0,0 +1,32 @@
+# Generated by Django 5.0.7 on 2026-10-18 19:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0013_merge_20260622_2216'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='printjob',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='printjob',
+            name='leased_by',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AlterField(
+            model_name='printjob',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('leased', 'Leased'), ('done', 'Done')], default='pending', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='printjob',
+            index=models.Index(fields=['status', 'created_at'], name='printjob_status_created_idx'),
+        ),
+    ]
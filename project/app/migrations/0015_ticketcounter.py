@@ -0,0 +1,64 @@
+# Generated by Django 5.0.7 on 2026-10-18 19:11
+
+from django.db import migrations, models
+from django.db.models import Max
+import django.db.models.deletion
+
+
+def forwards(apps, schema_editor):
+    """Seed counters from existing tickets and renumber duplicates.
+
+    The old COUNT(*)+1 numbering could hand out the same number twice; those
+    duplicates are moved past the group's current maximum so the unique
+    constraint below can be created.
+    """
+    Appointment = apps.get_model('app', 'Appointment')
+    TicketCounter = apps.get_model('app', 'TicketCounter')
+
+    group_fields = ('branch_id', 'doctor_id', 'clinic_id', 'date')
+    groups = (
+        Appointment.objects.filter(ticket_number__isnull=False)
+        .values(*group_fields)
+        .annotate(last_number=Max('ticket_number'))
+        .order_by()
+    )
+    for group in groups:
+        key = {field: group[field] for field in group_fields}
+        last_number = group['last_number']
+        seen = set()
+        for appointment in Appointment.objects.filter(ticket_number__isnull=False, **key).order_by('ticket_number', 'id'):
+            if appointment.ticket_number in seen:
+                last_number += 1
+                appointment.ticket_number = last_number
+                appointment.save(update_fields=['ticket_number'])
+            seen.add(appointment.ticket_number)
+        TicketCounter.objects.create(last_number=last_number, **key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_printjob_lease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('last_number', models.PositiveIntegerField(default=0)),
+                ('branch', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='app.branch')),
+                ('clinic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.clinic')),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.doctor')),
+            ],
+            options={
+                'unique_together': {('branch', 'doctor', 'clinic', 'date')},
+            },
+        ),
+        migrations.RunPython(forwards, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(condition=models.Q(('ticket_number__isnull', False)), fields=('branch', 'doctor', 'clinic', 'date', 'ticket_number'), name='appointment_unique_ticket_number'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.0.7 on 2026-10-18 19:14
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def forwards(apps, schema_editor):
+    """Number existing invoices per day in creation order and seed the counters."""
+    Invoice = apps.get_model('app', 'Invoice')
+    InvoiceCounter = apps.get_model('app', 'InvoiceCounter')
+
+    last_numbers = {}
+    for invoice in Invoice.objects.order_by('created_at', 'id'):
+        invoice_date = timezone.localdate(invoice.created_at)
+        last_numbers[invoice_date] = last_numbers.get(invoice_date, 0) + 1
+        Invoice.objects.filter(id=invoice.id).update(
+            invoice_date=invoice_date, invoice_number=last_numbers[invoice_date],
+        )
+    InvoiceCounter.objects.bulk_create(
+        InvoiceCounter(date=invoice_date, last_number=last_number)
+        for invoice_date, last_number in last_numbers.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0015_ticketcounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('last_number', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='invoice_date',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='invoice_number',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(forwards, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='invoice',
+            constraint=models.UniqueConstraint(fields=('invoice_date', 'invoice_number'), name='invoice_unique_daily_number'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.0.7 on 2026-10-18 19:40
+
+from django.db import migrations
+
+
+def forwards(apps, schema_editor):
+    """Drop stats rows written by the old page-view recomputation.
+
+    They only reflect the appointments as of the last page view (and DailyStats
+    held the filtered totals of that view). Incremental updates would build on
+    those stale values, so drop them; each row is re-seeded from an aggregate
+    on first use.
+    """
+    apps.get_model('app', 'DailyStats').objects.all().delete()
+    apps.get_model('app', 'ScheduleStats').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0016_invoice_number'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, migrations.RunPython.noop),
+    ]
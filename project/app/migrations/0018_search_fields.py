@@ -0,0 +1,126 @@
+# Generated by Django 5.0.7 on 2026-10-18 19:23
+
+import re
+
+from django.db import migrations, models
+
+# Frozen copies of app.search.normalize_text/normalize_phone as of this
+# migration, so later changes to the live normalizers cannot change it.
+ARABIC_DIACRITICS = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+ARABIC_LETTER_VARIANTS = str.maketrans({
+    '\u0623': '\u0627',
+    '\u0625': '\u0627',
+    '\u0622': '\u0627',
+    '\u0671': '\u0627',
+    '\u0649': '\u064a',
+    '\u0629': '\u0647',
+})
+ARABIC_DIGITS = str.maketrans(
+    '\u0660\u0661\u0662\u0663\u0664\u0665\u0666\u0667\u0668\u0669'
+    '\u06f0\u06f1\u06f2\u06f3\u06f4\u06f5\u06f6\u06f7\u06f8\u06f9',
+    '01234567890123456789',
+)
+NON_DIGITS = re.compile(r'\D')
+
+
+def normalize_text(value):
+    value = ARABIC_DIACRITICS.sub('', value or '')
+    return ' '.join(value.translate(ARABIC_LETTER_VARIANTS).casefold().split())
+
+
+def normalize_phone(value):
+    return NON_DIGITS.sub('', (value or '').translate(ARABIC_DIGITS))
+
+
+SEARCHABLE = (
+    ('Patient', ('name',)),
+    ('Doctor', ('full_name',)),
+    ('User', ('fullname', 'username')),
+)
+
+
+def backfill(apps, schema_editor):
+    for model_name, name_fields in SEARCHABLE:
+        model = apps.get_model('app', model_name)
+        batch = []
+        for row in model.objects.only('pk', 'phone_number', *name_fields).iterator(chunk_size=2000):
+            row.search_name = normalize_text(' '.join(filter(None, (getattr(row, f) for f in name_fields))))
+            row.search_phone = normalize_phone(row.phone_number)
+            batch.append(row)
+            if len(batch) == 2000:
+                model.objects.bulk_update(batch, ['search_name', 'search_phone'])
+                batch = []
+        model.objects.bulk_update(batch, ['search_name', 'search_phone'])
+
+
+def _search_indexes(apps):
+    for model_name, _ in SEARCHABLE:
+        model = apps.get_model('app', model_name)
+        yield model._meta.db_table, model_name.lower()
+
+
+def create_postgres_indexes(apps, schema_editor):
+    """pg_trgm GIN index for substring search, pattern_ops btree for phone prefixes."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    quote = schema_editor.quote_name
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table, prefix in _search_indexes(apps):
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {prefix}_search_name_trgm ON {quote(table)} '
+            f'USING gin (search_name gin_trgm_ops)'
+        )
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {prefix}_search_phone_prefix ON {quote(table)} '
+            f'(search_phone varchar_pattern_ops)'
+        )
+
+
+def drop_postgres_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for _, prefix in _search_indexes(apps):
+        schema_editor.execute(f'DROP INDEX IF EXISTS {prefix}_search_name_trgm')
+        schema_editor.execute(f'DROP INDEX IF EXISTS {prefix}_search_phone_prefix')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0017_reset_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctor',
+            name='search_name',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='doctor',
+            name='search_phone',
+            field=models.CharField(blank=True, default='', editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='search_name',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='search_phone',
+            field=models.CharField(blank=True, default='', editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='search_name',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='search_phone',
+            field=models.CharField(blank=True, default='', editable=False, max_length=20),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+        migrations.RunPython(create_postgres_indexes, drop_postgres_indexes),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.0.7 on 2026-10-18 19:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0018_search_fields'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('deleted_date__isnull', True)), fields=['branch', 'date', 'doctor', 'time'], name='appt_live_branch_date_doc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('deleted_date__isnull', True)), fields=['branch', 'doctor', '-date'], name='appt_live_branch_doc_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['branch', 'patient', '-date'], name='appt_branch_patient_date_idx'),
+        ),
+    ]
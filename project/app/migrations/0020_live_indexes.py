@@ -0,0 +1,57 @@
+# Generated by Django 5.0.7 on 2026-10-18 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0019_appointment_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('deleted_date__isnull', True)), fields=['id'], name='app_appointment_live_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='clinic',
+            index=models.Index(condition=models.Q(('deleted_date__isnull', True)), fields=['id'], name='app_clinic_live_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='clinicslot',
+            index=models.Index(condition=models.Q(('deleted_date__isnull', True)), fields=['id'], name='app_clinicslot_live_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='daysofweek',
+            index=models.Index(condition=models.Q(('deleted_date__isnull', True)), fields=['id'], name='app_daysofweek_live_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctor',
+            index=models.Index(condition=models.Q(('deleted_date__isnull', True)), fields=['id'], name='app_doctor_live_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctorbranch',
+            index=models.Index(condition=models.Q(('deleted_date__isnull', True)), fields=['id'], name='app_doctorbranch_live_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctorschedule',
+            index=models.Index(condition=models.Q(('deleted_date__isnull', True)), fields=['id'], name='app_doctorschedule_live_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(condition=models.Q(('deleted_date__isnull', True)), fields=['id'], name='app_invoice_live_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(condition=models.Q(('deleted_date__isnull', True)), fields=['id'], name='app_patient_live_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='specialization',
+            index=models.Index(condition=models.Q(('deleted_date__isnull', True)), fields=['id'], name='app_specialization_live_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='status',
+            index=models.Index(condition=models.Q(('deleted_date__isnull', True)), fields=['id'], name='app_status_live_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.7 on 2026-10-18 16:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0020_live_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clinicslot',
+            name='capacity',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='SlotBooking',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('booked', models.PositiveIntegerField(default=0)),
+                ('capacity', models.PositiveIntegerField(blank=True, null=True)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.doctor')),
+                ('slot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.clinicslot')),
+            ],
+            options={
+                'unique_together': {('doctor', 'slot', 'date')},
+            },
+        ),
+    ]
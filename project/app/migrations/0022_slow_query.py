@@ -0,0 +1,32 @@
+# Generated by Django 5.0.7 on 2026-10-18 19:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0021_slot_booking'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=40)),
+                ('sql', models.TextField()),
+                ('params', models.TextField(blank=True, default='')),
+                ('duration_ms', models.FloatField()),
+                ('view', models.CharField(blank=True, default='', max_length=200)),
+                ('caller', models.CharField(blank=True, default='', max_length=300)),
+                ('stack', models.TextField(blank=True, default='')),
+                ('plan', models.TextField(blank=True, null=True)),
+                ('captured_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-captured_at'],
+                'indexes': [models.Index(fields=['digest'], name='slowquery_digest_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.0.7 on 2026-10-18 21:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0022_slow_query'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='appointment',
+            name='app_appointment_live_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='clinic',
+            name='app_clinic_live_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='clinicslot',
+            name='app_clinicslot_live_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='daysofweek',
+            name='app_daysofweek_live_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='doctor',
+            name='app_doctor_live_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='doctorbranch',
+            name='app_doctorbranch_live_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='doctorschedule',
+            name='app_doctorschedule_live_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='invoice',
+            name='app_invoice_live_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='patient',
+            name='app_patient_live_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='specialization',
+            name='app_specialization_live_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='status',
+            name='app_status_live_idx',
+        ),
+        migrations.AddIndex(
+            model_name='doctorschedule',
+            index=models.Index(condition=models.Q(('deleted_date__isnull', True)), fields=['branch', 'day_of_week'], name='schedule_live_branch_day_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(condition=models.Q(('deleted_date__isnull', True)), fields=['branch', 'phone_number'], name='patient_live_branch_phone_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(condition=models.Q(('deleted_date__isnull', True)), fields=['branch', 'name'], name='patient_live_branch_name_idx'),
+        ),
+    ]
@@ -1,10 +1,12 @@
 import datetime
 import time
-from django.db import models  
+from collections import defaultdict
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.forms import ValidationError
 from django.utils import timezone
 
+from app.counters import bump_counter
 from app.templatetags.helpers import get_id_hashed_of_object
 
 
@@ -34,11 +36,38 @@ class User(AbstractUser):
     phone_number = models.CharField(max_length=15, blank=True, null=True)
     is_active = models.BooleanField(default=True)
     branch    = models.ForeignKey(Branch, on_delete=models.PROTECT, null=True, blank=True)
+    # Normalized copies for app.search, filled on save.
+    search_name  = models.CharField(max_length=255, blank=True, default='', editable=False)
+    search_phone = models.CharField(max_length=20, blank=True, default='', editable=False)
     REQUIRED_FIELDS = ['fullname']  # for createsuperuser
 
     def __str__(self):
         return f"{self.fullname or self.username} ({self.get_user_type_display()})"
 
+class SoftDeleteQuerySet(models.QuerySet):
+    def soft_delete(self, user=None):
+        """Mark the live rows of this queryset deleted in one UPDATE and return how many.
+
+        Sends ``app.signals.soft_deleted`` with a queryset of exactly those rows,
+        since the bulk update bypasses post_save.
+        """
+        deleted_ids = list(self.filter(deleted_date__isnull=True).values_list('pk', flat=True))
+        if not deleted_ids:
+            return 0
+        deleted = self.model.all_objects.filter(pk__in=deleted_ids)
+        count = deleted.update(deleted_date=timezone.now(), deleted_by=user)
+        from app.signals import soft_deleted
+        soft_deleted.send(sender=self.model, queryset=deleted)
+        return count
+
+
+class SoftDeleteManager(models.Manager.from_queryset(SoftDeleteQuerySet)):
+    """Default manager: hides soft-deleted rows."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_date__isnull=True)
+
+
 class BaseModel(models.Model):
     added_date   = models.DateTimeField(default=timezone.now, null=True, blank=True)
     deleted_date = models.DateTimeField(null=True, blank=True)
@@ -47,6 +76,9 @@ class BaseModel(models.Model):
     deleted_by   = models.ForeignKey(User, on_delete=models.PROTECT, related_name='%(class)s_deleted_by', null=True, blank=True)
     updated_by   = models.ForeignKey(User, on_delete=models.PROTECT, related_name='%(class)s_updated_by', null=True, blank=True)
 
+    objects     = SoftDeleteManager()
+    all_objects = models.Manager.from_queryset(SoftDeleteQuerySet)()  # includes soft-deleted rows
+
     class Meta:
         abstract = True
 
@@ -55,11 +87,9 @@ class Specialization(BaseModel):
     name = models.CharField(max_length=100, unique=True)
 
     def to_json(self):
-        return {
-            'id'        : self.id,
-            'hash_id'   : get_id_hashed_of_object(self.id),
-            'name'      : self.name,
-        }
+        # Imported here: app.serializers imports this module for PatientSerializer.
+        from app.serializers import SPECIALIZATION_JSON
+        return SPECIALIZATION_JSON.to_dict(self)
 
     def __str__(self):
         return self.name
@@ -74,19 +104,16 @@ class Doctor(BaseModel):
     consultation_price       = models.DecimalField(max_digits=10, decimal_places=2, default=0.0)
     is_active                = models.BooleanField(default=True)
     branch                  = models.ForeignKey(Branch, on_delete=models.PROTECT, null=True, blank=True)
+    # Normalized copies for app.search, filled on save.
+    search_name              = models.CharField(max_length=255, blank=True, default='', editable=False)
+    search_phone             = models.CharField(max_length=20, blank=True, default='', editable=False)
     
-    class Meta:
+    class Meta(BaseModel.Meta):
         unique_together = [['phone_number', 'branch']]
     
     def to_json(self):
-        return {
-            'id'            : self.id,
-            'hash_id'       : get_id_hashed_of_object(self.id),
-            'name'          : self.full_name,
-            'phone_number'  : self.phone_number,
-            'email'         : self.email,
-            'specialization': self.specialization.to_json()
-        }
+        from app.serializers import DOCTOR_JSON
+        return DOCTOR_JSON.to_dict(self)
     
     def __str__(self):
         return f"{self.full_name}"
@@ -99,7 +126,7 @@ class DoctorBranch(BaseModel):
     consultation_price = models.DecimalField(max_digits=10, decimal_places=2, default=0.0)
     is_active = models.BooleanField(default=True)
 
-    class Meta:
+    class Meta(BaseModel.Meta):
         unique_together = [['doctor', 'branch']]
 
     def __str__(self):
@@ -117,20 +144,30 @@ class Patient(BaseModel):
     ], blank=True, null=True)
     notes                = models.TextField(blank=True, null=True)
     branch = models.ForeignKey(Branch, on_delete=models.PROTECT, null=True, blank=True)
+    # Normalized copies for app.search, filled on save.
+    search_name          = models.CharField(max_length=255, blank=True, default='', editable=False)
+    search_phone         = models.CharField(max_length=20, blank=True, default='', editable=False)
     
-    class Meta:
+    class Meta(BaseModel.Meta):
         db_table = "Patient"
+        indexes = [
+            # Duplicate phone checks on add/quick create.
+            models.Index(
+                fields=['branch', 'phone_number'],
+                condition=models.Q(deleted_date__isnull=True),
+                name='patient_live_branch_phone_idx',
+            ),
+            # Patient list: total count and pages ordered by name.
+            models.Index(
+                fields=['branch', 'name'],
+                condition=models.Q(deleted_date__isnull=True),
+                name='patient_live_branch_name_idx',
+            ),
+        ]
 
     def to_json(self):
-        return {
-            'id'        : self.id,
-            'hash_id'   : get_id_hashed_of_object(self.id),
-            'name' : self.name,
-            'phone_number': self.phone_number,
-            'age'       : self.age,
-            'gender'    : self.gender,
-            'notes'     : self.notes,
-        }
+        from app.serializers import PATIENT_JSON
+        return PATIENT_JSON.to_dict(self)
     
     def __str__(self):
         return f"{self.name}"
@@ -160,7 +197,9 @@ class ClinicSlot(BaseModel):
     start_time = models.TimeField()
     end_time = models.TimeField()
     is_active = models.BooleanField(default=True)
-    class Meta:
+    # Appointments one doctor can take in this slot per day; empty means no limit.
+    capacity = models.PositiveIntegerField(null=True, blank=True)
+    class Meta(BaseModel.Meta):
         ordering = ['start_time']
     def __str__(self):
         return f"{self.clinic.name} Slot ({self.start_time}-{self.end_time})"
@@ -197,8 +236,16 @@ class DoctorSchedule(BaseModel):
     is_active              = models.BooleanField(default=True)
     branch                 = models.ForeignKey(Branch, on_delete=models.PROTECT, null=True, blank=True)
     
-    class Meta:
+    class Meta(BaseModel.Meta):
         ordering = ['day_of_week']
+        indexes = [
+            # Schedule board and today's appointments: one branch and weekday at a time.
+            models.Index(
+                fields=['branch', 'day_of_week'],
+                condition=models.Q(deleted_date__isnull=True),
+                name='schedule_live_branch_day_idx',
+            ),
+        ]
     
     def to_json(self):
         return {
@@ -218,7 +265,9 @@ class DoctorSchedule(BaseModel):
         if self.valid_to and self.valid_from > self.valid_to:
             raise ValidationError('valid_from must be before valid_to.')
     def save(self, *args, **kwargs):
-        self.full_clean()  # calls clean_fields(), clean(), and validate_unique()
+        # Foreign keys come from already-fetched rows; re-checking each one would cost a query per field.
+        # Overlaps with other schedules are checked by app.schedule_conflicts before saving.
+        self.full_clean(exclude=[field.name for field in self._meta.concrete_fields if field.is_relation], validate_unique=False)
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -240,42 +289,97 @@ class Appointment(BaseModel):
     branch   = models.ForeignKey(Branch, on_delete=models.PROTECT, null=True, blank=True)
     ticket_number = models.PositiveIntegerField(null=True, blank=True)
 
-    class Meta:
+    class Meta(BaseModel.Meta):
         ordering = ['date', 'time']
+        indexes = [
+            # today_appointments, quick create duplicate check, dashboard and stats seeding.
+            models.Index(
+                fields=['branch', 'date', 'doctor', 'time'],
+                condition=models.Q(deleted_date__isnull=True),
+                name='appt_live_branch_date_doc_idx',
+            ),
+            # doctor_details and the doctor's latest appointments.
+            models.Index(
+                fields=['branch', 'doctor', '-date'],
+                condition=models.Q(deleted_date__isnull=True),
+                name='appt_live_branch_doc_date_idx',
+            ),
+            # Patient details, latest appointments and patient deletion.
+            models.Index(fields=['branch', 'patient', '-date'], name='appt_branch_patient_date_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['branch', 'doctor', 'clinic', 'date', 'ticket_number'],
+                condition=models.Q(ticket_number__isnull=False),
+                name='appointment_unique_ticket_number',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.patient} with {self.doctor} at {self.time} on {self.date}"
     def tojson(self):
-        return {
-            'id'        : self.id,
-            'hash_id'   : get_id_hashed_of_object(self.id),
-            'patient'   : self.patient.to_json(),
-            'doctor'    : self.doctor.to_json(),
-            'clinic'    : self.clinic.name,
-            'status'    : self.status.name,
-            'date'      : self.date,
-            'time'      : self.time.strftime('%H:%M'),
-            'service_type'      : self.service_type,
-            'service_price'     : self.service_price,
-            'notes'     : self.notes,
-        }
+        # Use APPOINTMENT_JSON.serialize/prepare for querysets; this follows each relation.
+        from app.serializers import APPOINTMENT_JSON
+        return APPOINTMENT_JSON.to_dict(self)
 
 
 class PrintJob(models.Model):
     class Status(models.TextChoices):
         PENDING = "pending", "Pending"
+        LEASED = "leased", "Leased"
         DONE = "done", "Done"
     ticket_number = models.CharField(max_length=20)
     appointment = models.ForeignKey(Appointment, on_delete=models.CASCADE, related_name="print_jobs")
     status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
     created_at = models.DateTimeField(auto_now_add=True)
+    leased_by = models.CharField(max_length=100, blank=True, null=True)
+    lease_expires_at = models.DateTimeField(blank=True, null=True)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["status", "created_at"], name="printjob_status_created_idx"),
+        ]
 
     def __str__(self):
         return f"PrintJob #{self.id} for appointment {self.appointment_id} ({self.status})"
 
+class TicketCounter(models.Model):
+    """Last ticket number handed out per branch, doctor, clinic and day."""
+    branch = models.ForeignKey(Branch, on_delete=models.PROTECT, null=True, blank=True)
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE)
+    clinic = models.ForeignKey(Clinic, on_delete=models.CASCADE)
+    date = models.DateField()
+    last_number = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = [["branch", "doctor", "clinic", "date"]]
+
+    def __str__(self):
+        return f"TicketCounter {self.date} {self.doctor_id}@{self.clinic_id}: {self.last_number}"
+
+class SlotBooking(models.Model):
+    """Appointments booked per doctor, clinic slot and day, with the slot's capacity copied in."""
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE)
+    slot = models.ForeignKey(ClinicSlot, on_delete=models.CASCADE)
+    date = models.DateField()
+    booked = models.PositiveIntegerField(default=0)
+    capacity = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        unique_together = [["doctor", "slot", "date"]]
+
+    def __str__(self):
+        return f"SlotBooking {self.date} {self.doctor_id}@{self.slot_id}: {self.booked}/{self.capacity}"
+
+class InvoiceCounter(models.Model):
+    """Last invoice number handed out per day."""
+    date = models.DateField(unique=True)
+    last_number = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"InvoiceCounter {self.date}: {self.last_number}"
+
 class Invoice(BaseModel):
     """Clinic invoices"""
     
@@ -284,19 +388,43 @@ class Invoice(BaseModel):
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
     status      = models.ForeignKey(Status, on_delete=models.CASCADE, related_name='invoices')
     created_at  = models.DateTimeField(auto_now_add=True)
+    invoice_date   = models.DateField(null=True, blank=True, editable=False)
+    invoice_number = models.PositiveIntegerField(null=True, blank=True, editable=False)
 
-    class Meta:
+    class Meta(BaseModel.Meta):
         ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['invoice_date', 'invoice_number'], name='invoice_unique_daily_number'),
+        ]
 
     def save(self, *args, **kwargs):
         """Generate invoice number that resets daily"""
-        if not self.pk:  # Only on creation
-            today_invoices = Invoice.objects.filter(
-                created_at__date=self.created_at.date()
-            ).count()
-            self.invoice_number = today_invoices + 1
+        if self.pk is None and self.invoice_number is None:  # Only on creation
+            if self.invoice_date is None:
+                self.invoice_date = timezone.localdate(self.created_at) if self.created_at else timezone.localdate()
+            # The counter bump and the insert commit together, so numbers stay gap-free.
+            with transaction.atomic():
+                self.invoice_number = bump_counter(InvoiceCounter, date=self.invoice_date)
+                super().save(*args, **kwargs)
+            return
         super().save(*args, **kwargs)
 
+    @staticmethod
+    def number_in_bulk(invoices):
+        """Number unsaved ``invoices`` (with ``invoice_date`` set) for ``bulk_create``, which skips ``save``.
+
+        Reserves one block of numbers per date; call it inside the transaction
+        that inserts the invoices.
+        """
+        by_date = defaultdict(list)
+        for invoice in invoices:
+            by_date[invoice.invoice_date].append(invoice)
+        for invoice_date, dated in by_date.items():
+            last_number = bump_counter(InvoiceCounter, amount=len(dated), date=invoice_date)
+            for number, invoice in enumerate(dated, last_number - len(dated) + 1):
+                invoice.invoice_number = number
+        return invoices
+
     def __str__(self):
         return f"Invoice #{self.invoice_number} for {self.appointment.patient}"
 
@@ -330,4 +458,25 @@ class ScheduleStats(models.Model):
         unique_together = [["branch", "doctor", "clinic", "date", "start_time", "end_time"]]
 
     def __str__(self):
-        return f"ScheduleStats {self.date} {self.doctor_id}"
\ No newline at end of file
+        return f"ScheduleStats {self.date} {self.doctor_id}"
+
+class SlowQuery(models.Model):
+    """A statement slower than SLOW_QUERY_THRESHOLD_MS, with its plan when explained (see app.slow_queries)."""
+    digest = models.CharField(max_length=40)  # sha1 of the statement's fingerprint
+    sql = models.TextField()
+    params = models.TextField(blank=True, default="")
+    duration_ms = models.FloatField()
+    view = models.CharField(max_length=200, blank=True, default="")
+    caller = models.CharField(max_length=300, blank=True, default="")
+    stack = models.TextField(blank=True, default="")
+    plan = models.TextField(null=True, blank=True)
+    captured_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-captured_at"]
+        indexes = [
+            models.Index(fields=["digest"], name="slowquery_digest_idx"),
+        ]
+
+    def __str__(self):
+        return f"SlowQuery {self.duration_ms:.0f} ms in {self.view}"
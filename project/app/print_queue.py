@@ -0,0 +1,158 @@
+"""Print job claiming and wake-up plumbing.
+
+``claim_print_jobs`` leases up to N ready jobs to one worker with
+``SELECT ... FOR UPDATE SKIP LOCKED``, so several printers can drain the
+queue in parallel without printing a ticket twice. A job is ready when it is
+pending or its lease has expired (the worker died before acknowledging it).
+``acknowledge_print_jobs`` marks a batch done with a single ``UPDATE``.
+
+``wait_for_print_jobs`` blocks until at least one job can be claimed (or a
+timeout expires) and returns every claimed job in one batch. Enqueuers
+call ``notify_print_jobs`` (wired to ``PrintJob`` post_save in
+``app.signals``) so waiters wake up immediately:
+
+- on PostgreSQL with psycopg 3 the wake-up goes through ``LISTEN``/``NOTIFY``
+  and reaches waiters in every worker process;
+- otherwise an in-process condition variable wakes waiters in the same
+  process, and waiters re-check the database every
+  ``PRINT_JOBS_RECHECK_INTERVAL`` seconds to pick up jobs queued elsewhere.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from app.models import PrintJob
+
+NOTIFY_CHANNEL = "print_jobs"
+
+
+class _LocalNotifier:
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.version = 0
+
+    def notify(self):
+        with self.condition:
+            self.version += 1
+            self.condition.notify_all()
+
+    def wait(self, seen_version, timeout):
+        with self.condition:
+            return self.condition.wait_for(lambda: self.version != seen_version, timeout)
+
+
+local_notifier = _LocalNotifier()
+
+
+def _recheck_interval():
+    return getattr(settings, "PRINT_JOBS_RECHECK_INTERVAL", 2)
+
+
+def _supports_listen():
+    raw = connection.connection
+    return connection.vendor == "postgresql" and raw is not None and hasattr(raw, "notifies")
+
+
+def notify_print_jobs():
+    """Wake up every waiter; call after the job's transaction has committed."""
+    local_notifier.notify()
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, '')", [NOTIFY_CHANNEL])
+
+
+def _lease_seconds():
+    return getattr(settings, "PRINT_JOBS_LEASE_SECONDS", 60)
+
+
+def _with_ticket_relations(queryset):
+    return queryset.select_related("appointment__clinic", "appointment__doctor", "appointment__patient")
+
+
+def ready_print_jobs(now=None):
+    now = now or timezone.now()
+    return PrintJob.objects.filter(
+        Q(status=PrintJob.Status.PENDING)
+        | Q(status=PrintJob.Status.LEASED, lease_expires_at__lt=now)
+    )
+
+
+def claim_print_jobs(worker, limit, lease_seconds=None):
+    """Lease up to ``limit`` ready jobs to ``worker`` and return them, oldest first."""
+    now = timezone.now()
+    lease_expires_at = now + timedelta(seconds=lease_seconds or _lease_seconds())
+    with transaction.atomic():
+        job_ids = list(
+            ready_print_jobs(now)
+            .order_by("created_at", "id")
+            .select_for_update(skip_locked=True)
+            .values_list("id", flat=True)[:limit]
+        )
+        if not job_ids:
+            return []
+        PrintJob.objects.filter(id__in=job_ids).update(
+            status=PrintJob.Status.LEASED,
+            leased_by=worker,
+            lease_expires_at=lease_expires_at,
+        )
+    return list(_with_ticket_relations(PrintJob.objects.filter(id__in=job_ids)).order_by("created_at", "id"))
+
+
+def acknowledge_print_jobs(job_ids, worker=None):
+    """Mark jobs done in one UPDATE; with ``worker``, only jobs it still holds."""
+    jobs = PrintJob.objects.filter(id__in=job_ids).exclude(status=PrintJob.Status.DONE)
+    if worker:
+        jobs = jobs.filter(Q(leased_by=worker) | Q(status=PrintJob.Status.PENDING))
+    return jobs.update(status=PrintJob.Status.DONE, lease_expires_at=None)
+
+
+@contextmanager
+def _listener():
+    """Yield ``(mark, wait)``: call ``mark()`` before checking the queue and
+    ``wait(timeout)`` to sleep until something may have been enqueued since."""
+    connection.ensure_connection()
+    if _supports_listen():
+        with connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+        raw = connection.connection
+
+        def wait(timeout):
+            for _ in raw.notifies(timeout=timeout, stop_after=1):
+                return True
+            return False
+
+        try:
+            yield (lambda: None), wait
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute(f"UNLISTEN {NOTIFY_CHANNEL}")
+        return
+
+    seen = {"version": local_notifier.version}
+
+    def mark():
+        seen["version"] = local_notifier.version
+
+    def wait(timeout):
+        return local_notifier.wait(seen["version"], min(timeout, _recheck_interval()))
+
+    yield mark, wait
+
+
+def wait_for_print_jobs(worker, limit, timeout):
+    """Claim up to ``limit`` jobs for ``worker``, waiting at most ``timeout`` seconds for one."""
+    deadline = time.monotonic() + timeout
+    with _listener() as (mark, wait):
+        while True:
+            mark()
+            jobs = claim_print_jobs(worker, limit)
+            remaining = deadline - time.monotonic()
+            if jobs or remaining <= 0:
+                return jobs
+            wait(remaining)
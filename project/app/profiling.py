@@ -0,0 +1,154 @@
+"""On-demand profiling of single requests.
+
+A manager adds ``X-Profile: 1`` (or ``?_profile=1``) to a request and
+``ProfilingMiddleware`` (see ``app.middleware``) runs the rest of the
+request under a profiler: pyinstrument's sampling profiler when it is
+installed and ``PROFILE_SAMPLING`` is on, else ``cProfile``. The middleware
+sits after authentication, so the capture covers the view and its template
+rendering.
+
+Each capture is saved under ``PROFILE_DIR`` as a data file (a pstats
+``.prof`` dump, or speedscope JSON from pyinstrument; both load in
+flamegraph viewers such as snakeviz or speedscope) plus a ``.meta.json``
+with the request, status, duration and, for cProfile, the top functions.
+Only the newest ``PROFILE_MAX_FILES`` captures are kept. The response
+carries the capture name in ``X-Profile-Id``; managers list and download
+captures on the profiles page (``app.com.monitoring``).
+
+Requests without the flag only pay for a header and a query string lookup.
+"""
+import cProfile
+import json
+import pstats
+import re
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+from app.models import User
+from app.query_monitor import view_label
+
+try:
+    from pyinstrument import Profiler as SamplingProfiler
+    from pyinstrument.renderers import SpeedscopeRenderer
+    PYINSTRUMENT_AVAILABLE = True
+except Exception:
+    PYINSTRUMENT_AVAILABLE = False
+
+FLAG_HEADER = "X-Profile"
+FLAG_PARAM = "_profile"
+META_SUFFIX = ".meta.json"
+TOP_FUNCTIONS = 25
+CAPTURE_NAME = re.compile(r"^\d{8}-\d{6}-\d{6}-[A-Za-z0-9_-]+$")
+
+
+def wants_profile(request):
+    return request.headers.get(FLAG_HEADER) == "1" or request.GET.get(FLAG_PARAM) == "1"
+
+
+def may_profile(user):
+    return user.is_authenticated and user.user_type == User.UserType.MANAGER
+
+
+def profile_dir():
+    return Path(getattr(settings, "PROFILE_DIR", Path(settings.BASE_DIR) / "profiles"))
+
+
+def _top_functions(profiler):
+    stats = pstats.Stats(profiler).sort_stats("cumulative")
+    rows = []
+    for function in stats.fcn_list[:TOP_FUNCTIONS]:
+        calls, total_calls, own_time, cumulative_time, _ = stats.stats[function]
+        rows.append({
+            "function": pstats.func_std_string(function),
+            "calls": total_calls,
+            "own_ms": round(own_time * 1e3, 3),
+            "cumulative_ms": round(cumulative_time * 1e3, 3),
+        })
+    return rows
+
+
+def profile_request(request, get_response):
+    """Answer ``request`` with ``get_response`` under a profiler and save the capture."""
+    sampling = PYINSTRUMENT_AVAILABLE and getattr(settings, "PROFILE_SAMPLING", True)
+    started = time.perf_counter()
+    if sampling:
+        profiler = SamplingProfiler()
+        profiler.start()
+        try:
+            response = get_response(request)
+        finally:
+            profiler.stop()
+    else:
+        profiler = cProfile.Profile()
+        response = profiler.runcall(get_response, request)
+    seconds = time.perf_counter() - started
+
+    view = view_label(request)
+    name = f"{timezone.now():%Y%m%d-%H%M%S-%f}-{re.sub(r'[^A-Za-z0-9_-]+', '-', view)[:60]}"
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    if sampling:
+        data_file = f"{name}.speedscope.json"
+        (directory / data_file).write_text(profiler.output(renderer=SpeedscopeRenderer()))
+        top = []
+    else:
+        data_file = f"{name}.prof"
+        profiler.dump_stats(directory / data_file)
+        top = _top_functions(profiler)
+    meta = {
+        "name": name,
+        "file": data_file,
+        "profiler": "pyinstrument" if sampling else "cProfile",
+        "captured_at": timezone.now().isoformat(),
+        "method": request.method,
+        "path": request.get_full_path(),
+        "view": view,
+        "user": request.user.username,
+        "status": response.status_code,
+        "duration_ms": round(seconds * 1e3, 3),
+        "top": top,
+    }
+    (directory / f"{name}{META_SUFFIX}").write_text(json.dumps(meta, indent=2))
+    rotate_captures()
+    response["X-Profile-Id"] = name
+    return response
+
+
+def _meta_files():
+    # Names start with the capture time, so name order is age order.
+    return sorted(profile_dir().glob(f"*{META_SUFFIX}"), reverse=True)
+
+
+def rotate_captures():
+    """Delete all but the newest ``PROFILE_MAX_FILES`` captures."""
+    for meta_file in _meta_files()[getattr(settings, "PROFILE_MAX_FILES", 50):]:
+        name = meta_file.name[:-len(META_SUFFIX)]
+        for path in meta_file.parent.glob(f"{name}.*"):
+            path.unlink(missing_ok=True)
+
+
+def list_captures():
+    """Return the metadata of every saved capture, newest first."""
+    captures = []
+    for meta_file in _meta_files():
+        try:
+            captures.append(json.loads(meta_file.read_text()))
+        except (OSError, ValueError):
+            continue  # rotated away while listing
+    return captures
+
+
+def get_capture(name):
+    """Return ``(meta, data file path)`` of capture ``name``, or None."""
+    if not CAPTURE_NAME.match(name):
+        return None
+    meta_file = profile_dir() / f"{name}{META_SUFFIX}"
+    try:
+        meta = json.loads(meta_file.read_text())
+    except (OSError, ValueError):
+        return None
+    path = profile_dir() / meta["file"]
+    return (meta, path) if path.exists() else None
@@ -0,0 +1,146 @@
+"""Per-request query counts, database time and N+1 detection.
+
+``QueryMonitorMiddleware`` (see ``app.middleware``) wraps a sample of the
+requests (``QUERY_MONITOR_SAMPLE_RATE``) in ``connection.execute_wrapper``
+with a ``QueryRecorder``, which counts the queries, times them and groups
+them by *fingerprint*: the SQL with literals and ``IN`` lists collapsed, so
+the same statement run for every row of a loop shares one fingerprint.
+A request whose most repeated fingerprint runs more than
+``QUERY_MONITOR_N_PLUS_ONE_THRESHOLD`` times is logged as a likely N+1.
+
+Every recorded request is added to in-memory aggregates per resolved URL
+name: totals since the process started and a window of the last
+``QUERY_MONITOR_WINDOW`` requests. ``get_query_stats`` returns a snapshot.
+The aggregates are per process (one per gunicorn worker).
+"""
+import logging
+import re
+import threading
+import time
+from collections import Counter, deque
+from functools import lru_cache
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r"(?<![\w\"])-?\d+(?:\.\d+)?\b")
+IN_LIST = re.compile(r"\bIN \((?:\s*(?:%s|\?)\s*,?)+\)", re.IGNORECASE)
+WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql):
+    """Return ``sql`` with literals replaced by ``?`` and ``IN (...)`` lists collapsed."""
+    sql = STRING_LITERAL.sub("?", sql)
+    sql = NUMBER_LITERAL.sub("?", sql)
+    sql = sql.replace("%s", "?")
+    sql = IN_LIST.sub("IN (...)", sql)
+    return WHITESPACE.sub(" ", sql).strip()
+
+
+class QueryRecorder:
+    """``connection.execute_wrapper`` that counts, times and (optionally) fingerprints queries."""
+
+    def __init__(self, fingerprints=True):
+        self.count = 0
+        self.seconds = 0.0
+        self.fingerprints = Counter() if fingerprints else None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+            if self.fingerprints is not None:
+                self.fingerprints[fingerprint(sql)] += 1
+
+    def most_repeated(self):
+        """Return ``(fingerprint, count)`` of the most repeated statement, or ``(None, 0)``."""
+        top = self.fingerprints.most_common(1) if self.fingerprints else None
+        return top[0] if top else (None, 0)
+
+
+def view_label(request):
+    """Resolved URL name of ``request``, a bounded label for per-view aggregates."""
+    match = request.resolver_match
+    return match.view_name if match else "<unresolved>"
+
+
+def n_plus_one_threshold():
+    return getattr(settings, "QUERY_MONITOR_N_PLUS_ONE_THRESHOLD", 10)
+
+
+class ViewStats:
+    def __init__(self, window):
+        self.requests = 0
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.seconds = 0.0
+        self.flagged = 0
+        self.recent = deque(maxlen=window)  # (seconds, queries, db_seconds)
+        self.worst = (None, 0)  # most repeated fingerprint seen, with its count
+
+    def add(self, seconds, recorder, flagged):
+        self.requests += 1
+        self.queries += recorder.count
+        self.db_seconds += recorder.seconds
+        self.seconds += seconds
+        self.flagged += flagged
+        self.recent.append((seconds, recorder.count, recorder.seconds))
+        repeated = recorder.most_repeated()
+        if repeated[1] > self.worst[1]:
+            self.worst = repeated
+
+    def snapshot(self):
+        recent = sorted(self.recent)
+        return {
+            "requests": self.requests,
+            "queries": self.queries,
+            "db_seconds": round(self.db_seconds, 6),
+            "seconds": round(self.seconds, 6),
+            "n_plus_one": self.flagged,
+            "most_repeated_sql": self.worst[0],
+            "most_repeated_count": self.worst[1],
+            "window": {
+                "requests": len(recent),
+                "p50_ms": round(recent[len(recent) // 2][0] * 1e3, 3) if recent else None,
+                "p95_ms": round(recent[int(len(recent) * 0.95)][0] * 1e3, 3) if recent else None,
+                "mean_queries": round(sum(item[1] for item in recent) / len(recent), 2) if recent else None,
+                "mean_db_ms": round(sum(item[2] for item in recent) / len(recent) * 1e3, 3) if recent else None,
+            },
+        }
+
+
+_lock = threading.Lock()
+_stats = {}
+
+
+def record_request(url_name, seconds, recorder):
+    """Add one request to the aggregates of ``url_name``; return whether it looks like an N+1."""
+    fingerprint_sql, repeats = recorder.most_repeated()
+    flagged = repeats > n_plus_one_threshold()
+    with _lock:
+        stats = _stats.get(url_name)
+        if stats is None:
+            stats = _stats[url_name] = ViewStats(getattr(settings, "QUERY_MONITOR_WINDOW", 500))
+        stats.add(seconds, recorder, flagged)
+    if flagged:
+        logger.warning(
+            "Possible N+1 in %s: %d of %d queries are %s", url_name, repeats, recorder.count, fingerprint_sql,
+        )
+    return flagged
+
+
+def get_query_stats():
+    """Return ``{url name: aggregates}`` for this process."""
+    with _lock:
+        return {url_name: stats.snapshot() for url_name, stats in _stats.items()}
+
+
+def reset_query_stats():
+    with _lock:
+        _stats.clear()
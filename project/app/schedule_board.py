@@ -0,0 +1,150 @@
+"""Build doctor schedule boards with a fixed number of queries.
+
+A board is the list of merged slot ranges for a set of ``DoctorSchedule``
+rows, with doctor, specialization, clinic and branch pricing resolved. The
+schedules, their slots (read straight from the M2M through table) and the
+branch pricing are each loaded in one query, whatever the number of
+schedules; everything else is computed in memory.
+"""
+from collections import defaultdict
+
+from app.helpers import apply_doctor_branch_pricing_bulk
+from app.models import DaysOfWeek, DoctorSchedule
+from app.templatetags.helpers import merge_continuous_slots
+
+DAY_NAMES_AR = [
+    "الاثنين",
+    "الثلاثاء",
+    "الاربعاء",
+    "الخميس",
+    "الجمعة",
+    "السبت",
+    "الاحد",
+]
+DAY_NAMES_EN = [
+    "Monday",
+    "Tuesday",
+    "Wednesday",
+    "Thursday",
+    "Friday",
+    "Saturday",
+    "Sunday",
+]
+
+
+def get_day_of_week(date):
+    """Return the DaysOfWeek row for ``date`` (Arabic or English name)."""
+    weekday_index = date.weekday()
+    return DaysOfWeek.objects.filter(
+        name__in=[DAY_NAMES_AR[weekday_index], DAY_NAMES_EN[weekday_index]]
+    ).first()
+
+
+def get_schedule_slots(schedule_ids):
+    """Return {schedule_id: [ClinicSlot, ...]} ordered by start_time, in one query."""
+    slots_by_schedule = defaultdict(list)
+    if not schedule_ids:
+        return slots_by_schedule
+    links = (
+        DoctorSchedule.clinic_slot.through.objects
+        .filter(doctorschedule_id__in=schedule_ids)
+        .select_related("clinicslot")
+        .order_by("clinicslot__start_time")
+    )
+    for link in links:
+        slots_by_schedule[link.doctorschedule_id].append(link.clinicslot)
+    return slots_by_schedule
+
+
+def load_schedules(schedules, branch=None):
+    """Evaluate a DoctorSchedule queryset with its relations, slots and merged ranges.
+
+    Each returned schedule gets ``slots`` (ordered ClinicSlot list) and
+    ``merged_ranges`` (list of ``(start_time, end_time)`` tuples). When
+    ``branch`` is given, the doctors also get their branch pricing.
+    """
+    schedules = list(schedules.select_related("doctor__specialization", "clinic", "day_of_week"))
+    slots_by_schedule = get_schedule_slots([schedule.id for schedule in schedules])
+    for schedule in schedules:
+        schedule.slots = slots_by_schedule.get(schedule.id, [])
+        schedule.merged_ranges = merge_continuous_slots(schedule.slots)
+    if branch is not None:
+        apply_doctor_branch_pricing_bulk([schedule.doctor for schedule in schedules], branch)
+    return schedules
+
+
+def get_range_state(start_time, end_time, selected_date, local_now):
+    """Return ``(is_active, is_past, is_upcoming)`` for a range on ``selected_date``."""
+    today = local_now.date()
+    if selected_date < today:
+        return False, True, False
+    if selected_date > today:
+        return False, False, True
+    now_minutes = local_now.hour * 60 + local_now.minute
+    start_minutes = start_time.hour * 60 + start_time.minute
+    end_minutes = end_time.hour * 60 + end_time.minute
+    return (
+        start_minutes <= now_minutes <= end_minutes,
+        now_minutes > end_minutes,
+        now_minutes < start_minutes,
+    )
+
+
+def get_board_entry(schedule):
+    """Flatten a schedule returned by ``load_schedules`` into a plain, cacheable dict."""
+    doctor = schedule.doctor
+    specialization = doctor.specialization
+    return {
+        "schedule_id": schedule.id,
+        "doctor_id": schedule.doctor_id,
+        "doctor_name": doctor.full_name,
+        "doctor_deleted": doctor.deleted_date is not None,
+        "specialization_id": specialization.id if specialization else None,
+        "specialization_name": specialization.name if specialization else "",
+        "clinic_id": schedule.clinic_id,
+        "clinic_name": schedule.clinic.name,
+        "day_id": schedule.day_of_week_id,
+        "day_name": schedule.day_of_week.name,
+        "valid_from": schedule.valid_from,
+        "valid_to": schedule.valid_to,
+        "is_active": schedule.is_active,
+        "consultation_price": doctor.consultation_price,
+        "examination_price": doctor.examination_price,
+        "slots": [
+            (slot.start_time, slot.end_time)
+            for slot in schedule.slots
+            if slot.deleted_date is None
+        ],
+        "merged_ranges": schedule.merged_ranges,
+    }
+
+
+def get_board_rows(entries, selected_date, local_now):
+    """Expand board entries into one template-ready dict per merged range."""
+    board = []
+    for entry in entries:
+        for start_time, end_time in entry["merged_ranges"]:
+            is_active, is_past, is_upcoming = get_range_state(start_time, end_time, selected_date, local_now)
+            board.append(
+                {
+                    "doctor_id": entry["doctor_id"],
+                    "clinic_id": entry["clinic_id"],
+                    "doctor_name": entry["doctor_name"],
+                    "specialization_name": entry["specialization_name"],
+                    "clinic_name": entry["clinic_name"],
+                    "consultation_price": entry["consultation_price"],
+                    "examination_price": entry["examination_price"],
+                    "start_time": start_time,
+                    "end_time": end_time,
+                    "is_active": is_active,
+                    "is_past": is_past,
+                    "is_upcoming": is_upcoming,
+                }
+            )
+    return board
+
+
+def build_schedule_board(schedules, branch, selected_date, local_now):
+    """Return the merged slot ranges of ``schedules`` as template-ready dicts."""
+    entries = [get_board_entry(schedule) for schedule in load_schedules(schedules, branch)]
+    return get_board_rows(entries, selected_date, local_now)
@@ -0,0 +1,123 @@
+"""Cache of merged schedule boards per (branch, day of week).
+
+Each cache entry holds the board entries (see ``schedule_board.get_board_entry``)
+for every live ``DoctorSchedule`` of one branch on one weekday, including its
+``valid_from``/``valid_to`` window. Callers filter by date in memory with
+``entries_valid_on``, so a single entry serves every date in the window.
+
+Invalidation is generation based: keys embed a global and a per-branch
+generation number, and ``invalidate_schedule_board`` bumps one of them. This
+works with any Django cache backend since it never needs to enumerate keys.
+Receivers in ``app.signals`` call it when schedules, slots, doctor branch
+profiles or the names shown on the board change.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from app.metrics import count_cache
+from app.models import DaysOfWeek, DoctorSchedule
+from app.schedule_board import get_board_entry, load_schedules
+
+CACHE_PREFIX = "schedule-board"
+GLOBAL_GENERATION_KEY = f"{CACHE_PREFIX}:generation"
+
+
+def _cache():
+    return caches[getattr(settings, "SCHEDULE_BOARD_CACHE_ALIAS", "default")]
+
+
+def _timeout():
+    return getattr(settings, "SCHEDULE_BOARD_CACHE_TIMEOUT", 60 * 60)
+
+
+def _branch_generation_key(branch_id):
+    return f"{CACHE_PREFIX}:generation:{branch_id}"
+
+
+def _new_generation():
+    # Time based so a generation key that was evicted never restarts at a
+    # value older boards were stored under.
+    return time.time_ns() // 1000
+
+
+def _generations(branch_id):
+    cache = _cache()
+    keys = [GLOBAL_GENERATION_KEY, _branch_generation_key(branch_id)]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, _new_generation(), None)
+            found[key] = cache.get(key)
+    return tuple(found[key] for key in keys)
+
+
+def _board_key(generations, branch_id, day_id):
+    return f"{CACHE_PREFIX}:{generations[0]}:{generations[1]}:{branch_id}:{day_id}"
+
+
+def _build_day_board(branch, day_id):
+    schedules = DoctorSchedule.objects.filter(
+        branch=branch,
+        day_of_week_id=day_id,
+        deleted_date__isnull=True,
+    ).order_by("id")
+    return [get_board_entry(schedule) for schedule in load_schedules(schedules, branch)]
+
+
+def get_week_board(branch, day_ids=None):
+    """Return {day_id: [entry, ...]} for ``branch``, building missing days."""
+    if day_ids is None:
+        day_ids = list(DaysOfWeek.objects.values_list("id", flat=True))
+    generations = _generations(branch.id)
+    keys = {_board_key(generations, branch.id, day_id): day_id for day_id in day_ids}
+    cached = _cache().get_many(list(keys))
+    boards = {}
+    missing = {}
+    for key, day_id in keys.items():
+        if key in cached:
+            boards[day_id] = cached[key]
+        else:
+            boards[day_id] = missing[key] = _build_day_board(branch, day_id)
+    if missing:
+        _cache().set_many(missing, _timeout())
+    count_cache("schedule_board", hits=len(keys) - len(missing), misses=len(missing))
+    return boards
+
+
+def get_day_board(branch, day_id):
+    """Return the cached board entries for ``branch`` on one weekday."""
+    return get_week_board(branch, [day_id])[day_id]
+
+
+def entries_valid_on(entries, date):
+    """Keep entries whose ``valid_from``/``valid_to`` window contains ``date``."""
+    return [
+        entry for entry in entries
+        if entry["valid_from"] <= date and (entry["valid_to"] is None or entry["valid_to"] >= date)
+    ]
+
+
+def load_schedules_with_cached_ranges(schedules, branch):
+    """Evaluate a DoctorSchedule queryset of ``branch`` and attach ``merged_ranges`` from the cache."""
+    schedules = list(schedules.select_related("doctor", "clinic", "day_of_week"))
+    boards = get_week_board(branch, {schedule.day_of_week_id for schedule in schedules})
+    ranges = {
+        entry["schedule_id"]: entry["merged_ranges"]
+        for entries in boards.values()
+        for entry in entries
+    }
+    for schedule in schedules:
+        schedule.merged_ranges = ranges.get(schedule.id, [])
+    return schedules
+
+
+def invalidate_schedule_board(branch_id=None):
+    """Drop cached boards for one branch, or for every branch when ``branch_id`` is None."""
+    cache = _cache()
+    key = GLOBAL_GENERATION_KEY if branch_id is None else _branch_generation_key(branch_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _new_generation(), None)
@@ -0,0 +1,183 @@
+"""Overlap checks for doctor schedules.
+
+``ScheduleConflictIndex`` loads the active schedules of a branch (one query
+over the ``DoctorSchedule.clinic_slot`` through table). It keeps one
+``IntervalIndex`` per ``(clinic, day)`` and one per ``(doctor, day)``, so a
+proposed schedule is checked for both kinds of double booking. Each check
+costs O(log n + k) for the k overlapping slots:
+
+- another doctor in the same clinic at the same time;
+- the same doctor in another clinic at the same time.
+
+Two schedules only conflict when their ``valid_from``/``valid_to`` periods
+overlap as well. ``find_branch_conflicts`` checks a whole branch; see the
+``validate_schedules`` management command.
+"""
+from bisect import bisect_left
+from collections import defaultdict, namedtuple
+from datetime import date
+
+from app.models import DoctorSchedule
+
+MINUTES_PER_DAY = 24 * 60
+
+ScheduleSlot = namedtuple(
+    "ScheduleSlot", "schedule_id doctor_id doctor_name clinic_id clinic_name day_id start end valid_from valid_to",
+)
+Conflict = namedtuple("Conflict", "kind slot other")
+
+
+def to_minutes(start_time, end_time):
+    """Return ``(start, end)`` in minutes after midnight; an end at or before the start is on the next day."""
+    start = start_time.hour * 60 + start_time.minute
+    end = end_time.hour * 60 + end_time.minute
+    if end <= start:
+        end += MINUTES_PER_DAY
+    return start, end
+
+
+def format_minutes(minutes):
+    minutes %= MINUTES_PER_DAY
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def periods_overlap(first, second):
+    """Whether the validity periods of two ``ScheduleSlot`` overlap (no ``valid_to``: open ended)."""
+    first_to = first.valid_to or date.max
+    second_to = second.valid_to or date.max
+    return (first.valid_from or date.min) <= second_to and (second.valid_from or date.min) <= first_to
+
+
+class IntervalIndex:
+    """Static interval tree over half-open ``[start, end)`` intervals.
+
+    The intervals are sorted by start and the sorted list is used as an
+    implicit balanced tree (node = middle of a range), each node keeping the
+    largest end in its subtree so whole subtrees can be skipped.
+    """
+
+    def __init__(self, intervals):
+        self.intervals = sorted(intervals, key=lambda interval: (interval.start, interval.end))
+        self.starts = [interval.start for interval in self.intervals]
+        self.max_end = [0] * len(self.intervals)
+        self._build(0, len(self.intervals))
+
+    def _build(self, lo, hi):
+        if lo >= hi:
+            return -1
+        mid = (lo + hi) // 2
+        self.max_end[mid] = max(self.intervals[mid].end, self._build(lo, mid), self._build(mid + 1, hi))
+        return self.max_end[mid]
+
+    def overlapping(self, start, end):
+        """Return the intervals that overlap ``[start, end)``."""
+        found = []
+        self._collect(0, len(self.intervals), start, bisect_left(self.starts, end), found)
+        return found
+
+    def _collect(self, lo, hi, start, limit, found):
+        # Only intervals before ``limit`` start before ``end``.
+        if lo >= hi or lo >= limit:
+            return
+        mid = (lo + hi) // 2
+        if self.max_end[mid] <= start:
+            return
+        self._collect(lo, mid, start, limit, found)
+        if mid < limit and self.intervals[mid].end > start:
+            found.append(self.intervals[mid])
+        self._collect(mid + 1, hi, start, limit, found)
+
+
+def load_schedule_slots(schedules):
+    """Return one ``ScheduleSlot`` per (schedule, clinic slot) of a DoctorSchedule queryset."""
+    links = DoctorSchedule.clinic_slot.through.objects.filter(doctorschedule__in=schedules).values_list(
+        "doctorschedule_id", "doctorschedule__doctor_id", "doctorschedule__doctor__full_name",
+        "doctorschedule__clinic_id", "doctorschedule__clinic__name", "doctorschedule__day_of_week_id",
+        "clinicslot__start_time", "clinicslot__end_time",
+        "doctorschedule__valid_from", "doctorschedule__valid_to",
+    )
+    slots = []
+    for schedule_id, doctor_id, doctor_name, clinic_id, clinic_name, day_id, start_time, end_time, valid_from, valid_to in links:
+        start, end = to_minutes(start_time, end_time)
+        slots.append(ScheduleSlot(
+            schedule_id, doctor_id, doctor_name, clinic_id, clinic_name, day_id, start, end, valid_from, valid_to,
+        ))
+    return slots
+
+
+def active_schedules(branch):
+    return DoctorSchedule.objects.filter(
+        branch=branch, is_active=True, doctor__deleted_date__isnull=True, clinic__deleted_date__isnull=True,
+    )
+
+
+class ScheduleConflictIndex:
+    def __init__(self, slots):
+        self.slots = slots
+        by_clinic = defaultdict(list)
+        by_doctor = defaultdict(list)
+        for slot in slots:
+            by_clinic[slot.clinic_id, slot.day_id].append(slot)
+            by_doctor[slot.doctor_id, slot.day_id].append(slot)
+        self.by_clinic = {key: IntervalIndex(items) for key, items in by_clinic.items()}
+        self.by_doctor = {key: IntervalIndex(items) for key, items in by_doctor.items()}
+
+    @classmethod
+    def for_branch(cls, branch):
+        return cls(load_schedule_slots(active_schedules(branch)))
+
+    def conflicts(self, slots, exclude_schedule_id=None):
+        """Return a ``Conflict`` for every indexed slot that clashes with one of ``slots``.
+
+        ``kind`` is ``"clinic"`` (another doctor holds the clinic) or
+        ``"doctor"`` (the doctor is booked in another clinic).
+        """
+        found = []
+        for slot in slots:
+            checks = (
+                ("clinic", self.by_clinic.get((slot.clinic_id, slot.day_id)), lambda other: other.doctor_id != slot.doctor_id),
+                ("doctor", self.by_doctor.get((slot.doctor_id, slot.day_id)), lambda other: other.clinic_id != slot.clinic_id),
+            )
+            for kind, index, clashes in checks:
+                if index is None:
+                    continue
+                for other in index.overlapping(slot.start, slot.end):
+                    if other.schedule_id in (exclude_schedule_id, slot.schedule_id):
+                        continue
+                    if clashes(other) and periods_overlap(slot, other):
+                        found.append(Conflict(kind, slot, other))
+        return found
+
+    def proposed_conflicts(self, doctor, clinic, day_id, clinic_slots, valid_from, valid_to, schedule_id=None):
+        """Check a schedule that is about to be saved with ``clinic_slots``."""
+        slots = []
+        for clinic_slot in clinic_slots:
+            start, end = to_minutes(clinic_slot.start_time, clinic_slot.end_time)
+            slots.append(ScheduleSlot(
+                schedule_id, doctor.id, doctor.full_name, clinic.id, clinic.name, int(day_id), start, end,
+                valid_from, valid_to,
+            ))
+        return self.conflicts(slots, exclude_schedule_id=schedule_id)
+
+
+def describe_conflict(conflict):
+    other = conflict.other
+    when = f"{format_minutes(other.start)}-{format_minutes(other.end)}"
+    if conflict.kind == "clinic":
+        return f"{other.clinic_name} {when} is taken by {other.doctor_name}"
+    return f"{other.doctor_name} is already in {other.clinic_name} at {when}"
+
+
+def find_branch_conflicts(branch):
+    """Return every conflict between the active schedules of ``branch``, each pair once."""
+    index = ScheduleConflictIndex.for_branch(branch)
+    conflicts = []
+    seen = set()
+    for conflict in index.conflicts(index.slots):
+        pair = (conflict.kind, *sorted([
+            (conflict.slot.schedule_id, conflict.slot.start), (conflict.other.schedule_id, conflict.other.start),
+        ]))
+        if pair not in seen:
+            seen.add(pair)
+            conflicts.append(conflict)
+    return conflicts
@@ -0,0 +1,83 @@
+"""Name/phone search for patients, doctors and users.
+
+Each searchable model keeps two denormalized columns, filled by a pre_save
+receiver in ``app.signals``:
+
+- ``search_name``: the name fields run through ``normalize_text`` (case
+  folded, Arabic diacritics and tatweel removed, alef/ya/ta-marbuta variants
+  unified), so "أحمد" finds "احمد" and "فاطمة" finds "فاطمه";
+- ``search_phone``: the phone number reduced to ASCII digits.
+
+``search_queryset`` turns a search box value into an exact id lookup, a phone
+prefix match and a per-word substring match on ``search_name``. On PostgreSQL
+migration 0018 backs these with a ``pg_trgm`` GIN index on ``search_name``
+and a ``varchar_pattern_ops`` index on ``search_phone``. Other databases run
+the same queries without those indexes (the tests use SQLite).
+
+Rows written with ``bulk_create``/``update`` skip the receiver; pass them
+through ``update_search_fields`` first.
+"""
+import re
+
+from django.db.models import Q
+
+# Harakat, Quranic marks, superscript alef and tatweel.
+ARABIC_DIACRITICS = re.compile("[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]")
+ARABIC_LETTER_VARIANTS = str.maketrans({
+    "\u0623": "\u0627",  # alef with hamza above -> alef
+    "\u0625": "\u0627",  # alef with hamza below -> alef
+    "\u0622": "\u0627",  # alef with madda -> alef
+    "\u0671": "\u0627",  # alef wasla -> alef
+    "\u0649": "\u064a",  # alef maksura -> ya
+    "\u0629": "\u0647",  # ta marbuta -> ha
+})
+ARABIC_DIGITS = str.maketrans(
+    "\u0660\u0661\u0662\u0663\u0664\u0665\u0666\u0667\u0668\u0669"
+    "\u06f0\u06f1\u06f2\u06f3\u06f4\u06f5\u06f6\u06f7\u06f8\u06f9",
+    "01234567890123456789",
+)
+NUMBER = re.compile(r"\+?[\d\s-]+")
+NON_DIGITS = re.compile(r"\D")
+
+# Model label -> (name fields, phone field).
+SEARCH_FIELDS = {
+    "app.patient": (("name",), "phone_number"),
+    "app.doctor": (("full_name",), "phone_number"),
+    "app.user": (("fullname", "username"), "phone_number"),
+}
+
+
+def normalize_text(value):
+    """Fold ``value`` for matching: lowercase, no diacritics, one form per Arabic letter."""
+    value = ARABIC_DIACRITICS.sub("", value or "")
+    return " ".join(value.translate(ARABIC_LETTER_VARIANTS).casefold().split())
+
+
+def normalize_phone(value):
+    """Keep the digits of ``value``, converting Arabic-Indic digits to ASCII."""
+    return NON_DIGITS.sub("", (value or "").translate(ARABIC_DIGITS))
+
+
+def update_search_fields(instance):
+    """Fill ``search_name``/``search_phone`` of a searchable model instance."""
+    name_fields, phone_field = SEARCH_FIELDS[instance._meta.label_lower]
+    instance.search_name = normalize_text(" ".join(filter(None, (getattr(instance, f) for f in name_fields))))
+    instance.search_phone = normalize_phone(getattr(instance, phone_field))
+
+
+def search_queryset(queryset, value):
+    """Filter ``queryset`` of a searchable model by a search box ``value``."""
+    words = normalize_text(value).split()
+    if not words:
+        return queryset
+    condition = Q()
+    for word in words:
+        condition &= Q(search_name__contains=word)
+    number = (value or "").translate(ARABIC_DIGITS).strip()
+    digits = normalize_phone(number) if NUMBER.fullmatch(number) else ""
+    if digits:
+        # A number may also be an id or the start of a phone number.
+        condition |= Q(search_phone__startswith=digits)
+        if len(digits) <= 18:
+            condition |= Q(pk=int(digits))
+    return queryset.filter(condition)
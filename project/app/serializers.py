@@ -1,8 +1,185 @@
-from .models import Patient , Branch
+"""Declarative JSON serializers that know which columns and relations they read.
+
+A ``Serializer`` maps output keys to lookups (``"full_name"``,
+``"specialization__name"``), to ``(lookup, convert)`` pairs, or to ``Nested``
+serializers of a foreign key. From that declaration it can:
+
+- ``prepare`` a queryset with the matching ``select_related``/``only``, for
+  callers that need model instances;
+- ``serialize`` a queryset straight from ``values_list`` tuples in one query,
+  without creating model instances;
+- ``to_dict`` one instance, so model ``to_json`` methods and the bulk path
+  produce the same rows.
+
+``serialize_page`` adds ``limit``/``cursor`` keyset paging for the
+latest-appointments endpoints. ``PatientSerializer`` is the DRF serializer
+for patients.
+"""
+from django.conf import settings
 from rest_framework import serializers
+
+from app.datatables import decode_cursor, encode_cursor, seek
+from app.models import Branch, Patient
+from app.templatetags.helpers import get_id_hashed_of_object
+
+DEFAULT_PAGE_LIMIT = 20
+
+
+class Nested:
+    """Serialize the object behind foreign key ``relation`` with ``serializer``."""
+
+    def __init__(self, relation, serializer):
+        self.relation = relation
+        self.serializer = serializer
+
+
+class Serializer:
+    def __init__(self, fields):
+        self.fields = fields
+
+    def _specs(self):
+        for key, spec in self.fields.items():
+            if isinstance(spec, Nested):
+                yield key, spec, None
+            elif isinstance(spec, str):
+                yield key, spec, None
+            else:
+                yield key, spec[0], spec[1]
+
+    def lookups(self, prefix=""):
+        """Return the ``values_list`` lookups this serializer reads, in order."""
+        lookups = [f"{prefix}pk"]
+        for _, spec, _ in self._specs():
+            if isinstance(spec, Nested):
+                lookups.extend(spec.serializer.lookups(f"{prefix}{spec.relation}__"))
+            elif f"{prefix}{spec}" not in lookups:
+                lookups.append(f"{prefix}{spec}")
+        return lookups
+
+    def relations(self, prefix=""):
+        """Return the ``select_related`` paths this serializer follows."""
+        relations = []
+        for _, spec, _ in self._specs():
+            if isinstance(spec, Nested):
+                relations.append(f"{prefix}{spec.relation}")
+                relations.extend(spec.serializer.relations(f"{prefix}{spec.relation}__"))
+            elif "__" in spec:
+                relations.append(f"{prefix}{spec.rsplit('__', 1)[0]}")
+        return list(dict.fromkeys(relations))
+
+    def prepare(self, queryset):
+        """Return ``queryset`` with the joins and columns ``to_dict`` needs."""
+        only = [lookup for lookup in self.lookups() if not lookup.endswith("pk")]
+        return queryset.select_related(*self.relations()).only(*only)
+
+    def _build(self, values, prefix=""):
+        if values[f"{prefix}pk"] is None:
+            return None
+        row = {}
+        for key, spec, convert in self._specs():
+            if isinstance(spec, Nested):
+                row[key] = spec.serializer._build(values, f"{prefix}{spec.relation}__")
+                continue
+            value = values[f"{prefix}{spec}"]
+            row[key] = convert(value) if convert is not None and value is not None else value
+        return row
+
+    def serialize(self, queryset):
+        """Return the rows of ``queryset`` as dicts, read with a single ``values_list`` query."""
+        lookups = self.lookups()
+        return [self._build(dict(zip(lookups, values))) for values in queryset.values_list(*lookups)]
+
+    def to_dict(self, obj):
+        """Serialize one model instance (following foreign keys as attributes)."""
+        values = {}
+        for lookup in self.lookups():
+            value = obj
+            for name in lookup.split("__"):
+                value = getattr(value, name) if value is not None else None
+            values[lookup] = value
+        return self._build(values)
+
+
+def _time(value):
+    return value.strftime('%H:%M')
+
+
+SPECIALIZATION_JSON = Serializer({
+    'id': 'id',
+    'hash_id': ('id', get_id_hashed_of_object),
+    'name': 'name',
+})
+
+DOCTOR_JSON = Serializer({
+    'id': 'id',
+    'hash_id': ('id', get_id_hashed_of_object),
+    'name': 'full_name',
+    'phone_number': 'phone_number',
+    'email': 'email',
+    'specialization': Nested('specialization', SPECIALIZATION_JSON),
+})
+
+PATIENT_JSON = Serializer({
+    'id': 'id',
+    'hash_id': ('id', get_id_hashed_of_object),
+    'name': 'name',
+    'phone_number': 'phone_number',
+    'age': 'age',
+    'gender': 'gender',
+    'notes': 'notes',
+})
+
+APPOINTMENT_JSON = Serializer({
+    'id': 'id',
+    'hash_id': ('id', get_id_hashed_of_object),
+    'patient': Nested('patient', PATIENT_JSON),
+    'doctor': Nested('doctor', DOCTOR_JSON),
+    'clinic': 'clinic__name',
+    'status': 'status__name',
+    'date': 'date',
+    'time': ('time', _time),
+    'service_type': 'service_type',
+    'service_price': 'service_price',
+    'notes': 'notes',
+})
+
+
+def _limit(params):
+    try:
+        limit = int(params.get('limit', DEFAULT_PAGE_LIMIT))
+    except (TypeError, ValueError):
+        limit = DEFAULT_PAGE_LIMIT
+    if limit < 1:
+        limit = DEFAULT_PAGE_LIMIT
+    return min(limit, getattr(settings, 'DATATABLES_MAX_LENGTH', 500))
+
+
+def serialize_page(request, queryset, serializer, field='date'):
+    """Serialize one page of ``queryset`` newest first by ``(field, pk)``.
+
+    Reads ``limit`` and ``cursor`` from the query string and returns
+    ``(rows, next_cursor)``; ``next_cursor`` is None on the last page.
+    """
+    limit = _limit(request.GET)
+    queryset = queryset.order_by(f'-{field}', '-pk')
+    cursor = decode_cursor(request.GET['cursor']) if request.GET.get('cursor') else None
+    if cursor is not None and cursor[0] is not None:
+        queryset = seek(queryset, field, True, cursor)
+    lookups = serializer.lookups()
+    if field not in lookups:
+        lookups.append(field)
+    rows = [dict(zip(lookups, values)) for values in queryset.values_list(*lookups)[:limit + 1]]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][field], rows[-1]['pk'])
+    return [serializer._build(values) for values in rows], next_cursor
+
+
 class PatientSerializer(serializers.ModelSerializer):
-  branch = serializers.PrimaryKeyRelatedField(queryset=Branch.objects.all(), required=False, allow_null=True)
-  class Meta:
-    model = Patient
-    fields = '__all__'
-    read_only_fields = ['id','added_date', 'created_at', 'updated_at']
\ No newline at end of file
+    branch = serializers.PrimaryKeyRelatedField(queryset=Branch.objects.all(), required=False, allow_null=True)
+
+    class Meta:
+        model = Patient
+        fields = '__all__'
+        read_only_fields = ['id', 'added_date', 'created_at', 'updated_at']
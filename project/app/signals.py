@@ -0,0 +1,202 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import Signal, receiver
+
+from app.booking import (
+    BOOKING_FIELDS, adjust, booking_state, get_booking_key, get_instance_booking_key, get_instance_booking_values,
+)
+from app.dashboard_metrics import invalidate_dashboard_metrics
+from app.datatables import invalidate_total
+from app.helpers import get_local_date
+from app.models import (
+    Appointment, Clinic, ClinicSlot, Doctor, DoctorBranch, DoctorSchedule, Invoice, Patient, PrintJob, SlotBooking,
+    Specialization, User,
+)
+from app.print_queue import notify_print_jobs
+from app.schedule_cache import invalidate_schedule_board
+from app.search import update_search_fields
+from app.stats import CONTRIBUTION_FIELDS, StatsDelta, get_contribution, get_instance_contribution
+
+# Sent by soft-delete helpers after ``deleted_date`` is set with a bulk update,
+# which bypasses post_save. ``queryset`` matches the rows that were deleted.
+soft_deleted = Signal()
+
+
+def _branch_ids(model, queryset):
+    if model is ClinicSlot:
+        return set(queryset.values_list("clinic__branch_id", flat=True))
+    return set(queryset.values_list("branch_id", flat=True))
+
+
+def _invalidate_on_commit(branch_id=None):
+    # Invalidating before the commit would let a concurrent request rebuild the board
+    # from the old rows under the new generation and cache them for the whole TTL.
+    transaction.on_commit(lambda: invalidate_schedule_board(branch_id))
+
+
+@receiver(post_save, sender=DoctorSchedule)
+@receiver(post_delete, sender=DoctorSchedule)
+@receiver(post_save, sender=DoctorBranch)
+@receiver(post_delete, sender=DoctorBranch)
+@receiver(post_save, sender=Clinic)
+@receiver(post_delete, sender=Clinic)
+def invalidate_branch_board(sender, instance, **kwargs):
+    _invalidate_on_commit(instance.branch_id)
+
+
+@receiver(post_save, sender=ClinicSlot)
+@receiver(post_delete, sender=ClinicSlot)
+def invalidate_slot_board(sender, instance, **kwargs):
+    _invalidate_on_commit(Clinic.all_objects.filter(id=instance.clinic_id).values_list("branch_id", flat=True).first())
+
+
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+@receiver(post_save, sender=Specialization)
+@receiver(post_delete, sender=Specialization)
+def invalidate_all_boards(sender, instance, **kwargs):
+    # Doctors and specializations are shared by every branch.
+    _invalidate_on_commit()
+
+
+@receiver(m2m_changed, sender=DoctorSchedule.clinic_slot.through)
+def invalidate_schedule_slots_board(sender, instance, action, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if isinstance(instance, DoctorSchedule):
+        _invalidate_on_commit(instance.branch_id)
+    else:
+        _invalidate_on_commit()
+
+
+@receiver(soft_deleted)
+def invalidate_soft_deleted_board(sender, queryset, **kwargs):
+    if sender in (Doctor, Specialization):
+        _invalidate_on_commit()
+    elif sender in (DoctorSchedule, DoctorBranch, Clinic, ClinicSlot):
+        for branch_id in _branch_ids(sender, queryset):
+            _invalidate_on_commit(branch_id)
+
+
+@receiver(post_save, sender=PrintJob)
+def wake_print_job_waiters(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(notify_print_jobs)
+
+
+@receiver(pre_save, sender=Appointment)
+def remember_appointment_state(sender, instance, raw=False, **kwargs):
+    before = values = None
+    if instance.pk is not None and not raw:
+        # CONTRIBUTION_FIELDS include BOOKING_FIELDS, so one read serves both.
+        values = Appointment.all_objects.filter(pk=instance.pk).values(*CONTRIBUTION_FIELDS).first()
+        if values:
+            before = get_contribution(values)
+    instance._stats_contribution = before
+    # The slot is only looked up after the save, if the booking state changed.
+    instance._booking_values = values
+
+
+@receiver(post_save, sender=Appointment)
+def update_appointment_stats(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    delta = StatsDelta()
+    delta.add(getattr(instance, "_stats_contribution", None), -1)
+    delta.add(get_instance_contribution(instance))
+    delta.apply()
+    instance._stats_contribution = None
+
+
+@receiver(post_delete, sender=Appointment)
+def remove_appointment_stats(sender, instance, **kwargs):
+    delta = StatsDelta()
+    delta.add(get_instance_contribution(instance), -1)
+    delta.apply()
+
+
+@receiver(soft_deleted, sender=Appointment)
+def remove_soft_deleted_appointment_stats(sender, queryset, **kwargs):
+    # ``queryset`` holds the rows this call deleted; count them as they were just before.
+    delta = StatsDelta()
+    days = {}
+    for values in queryset.values(*CONTRIBUTION_FIELDS):
+        delta.add(get_contribution({**values, "deleted_date": None}, days), -1)
+    delta.apply()
+
+
+@receiver(post_save, sender=Appointment)
+def update_slot_bookings(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    before_values = getattr(instance, "_booking_values", None)
+    after_values = get_instance_booking_values(instance)
+    # Check-ins, ticket numbers and notes leave the booking alone; skip the slot lookups for them.
+    if before_values is None or booking_state(before_values) != booking_state(after_values):
+        before = get_booking_key(before_values) if before_values else None
+        after = get_booking_key(after_values)
+        reserved = getattr(instance, "_reserved_booking", None)
+        if before != after:
+            adjust(before, -1)
+            if reserved is None or reserved != after:
+                adjust(after, 1)
+    instance._booking_values = instance._reserved_booking = None
+
+
+@receiver(post_delete, sender=Appointment)
+def release_deleted_slot_booking(sender, instance, **kwargs):
+    adjust(get_instance_booking_key(instance), -1)
+
+
+@receiver(soft_deleted, sender=Appointment)
+def release_soft_deleted_slot_bookings(sender, queryset, **kwargs):
+    released = Counter()
+    slots = {}
+    for values in queryset.values(*BOOKING_FIELDS):
+        key = get_booking_key({**values, "deleted_date": None}, slots)
+        if key is not None:
+            released[key] += 1
+    for key, count in released.items():
+        adjust(key, -count)
+
+
+@receiver(post_save, sender=ClinicSlot)
+def update_slot_booking_capacity(sender, instance, raw=False, **kwargs):
+    if not raw:
+        SlotBooking.objects.filter(slot=instance, date__gte=get_local_date()).exclude(
+            capacity=instance.capacity,
+        ).update(capacity=instance.capacity)
+
+
+@receiver(post_save, sender=Invoice)
+@receiver(post_delete, sender=Invoice)
+def invalidate_invoice_dashboard(sender, instance, **kwargs):
+    branch_id = Appointment.all_objects.filter(id=instance.appointment_id).values_list("branch_id", flat=True).first()
+    if branch_id is not None:
+        invalidate_dashboard_metrics(branch_id)
+
+
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_list_totals(sender, instance, **kwargs):
+    invalidate_total(sender, instance.branch_id)
+
+
+@receiver(soft_deleted)
+def invalidate_soft_deleted_list_totals(sender, queryset, **kwargs):
+    if sender in (Patient, Doctor):
+        for branch_id in set(queryset.values_list("branch_id", flat=True)):
+            invalidate_total(sender, branch_id)
+
+
+@receiver(pre_save, sender=Patient)
+@receiver(pre_save, sender=Doctor)
+@receiver(pre_save, sender=User)
+def fill_search_fields(sender, instance, **kwargs):
+    update_search_fields(instance)
@@ -0,0 +1,120 @@
+"""Clinic slot generation.
+
+``sync_clinic_slots`` compares the slots a clinic should have (its opening
+hours cut into ``slot_duration_hours`` pieces, or explicit windows) with the
+rows it already has and applies only the difference, in one transaction:
+
+- missing slots are added with one ``bulk_create``;
+- soft-deleted slots that are wanted again are revived with one
+  ``bulk_update``, keeping their ids instead of piling up new rows;
+- live slots that are no longer wanted are soft-deleted and unlinked from
+  doctor schedules (``remove_extra=False`` keeps them). The links are not
+  restored when such a slot is revived later; schedules pick it again.
+
+Slots that are already there are left alone, so ``DoctorSchedule.clinic_slot``
+links to them survive a regeneration. ``sync_all_slots`` runs the clinics of
+every branch, optionally in parallel worker processes (one branch per task).
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+
+from django.db import connection, connections, transaction
+from django.db.models import F
+
+from app.models import Clinic, ClinicSlot, DoctorSchedule
+from app.schedule_cache import invalidate_schedule_board
+
+
+def desired_slots(clinic, windows=None):
+    """Return the ``(start_time, end_time)`` pairs ``clinic`` should have, in order.
+
+    ``windows`` defaults to the clinic's opening hours. A window whose end is
+    not after its start runs past midnight (``23:00``-``00:00``).
+    """
+    step = timedelta(hours=max(clinic.slot_duration_hours or 1, 1))
+    windows = windows or [(clinic.default_open_time, clinic.default_close_time)]
+    slots = []
+    for open_time, close_time in windows:
+        start = datetime.combine(date.min, open_time)
+        end = datetime.combine(date.min, close_time)
+        if end <= start:
+            end += timedelta(days=1)
+        while start + step <= end:
+            slots.append((start.time(), (start + step).time()))
+            start += step
+    return list(dict.fromkeys(slots))
+
+
+def sync_clinic_slots(clinic, windows=None, remove_extra=True):
+    """Bring ``clinic``'s slots in line with ``desired_slots``; return the change counts."""
+    wanted = desired_slots(clinic, windows)
+    with transaction.atomic():
+        existing = {}
+        for slot in ClinicSlot.all_objects.filter(clinic=clinic).order_by(F("deleted_date").asc(nulls_first=True), "id"):
+            # Prefer the live row when a slot was deleted and re-added by hand.
+            existing.setdefault((slot.start_time, slot.end_time), slot)
+
+        wanted_keys = set(wanted)
+        created = [
+            ClinicSlot(clinic=clinic, start_time=start_time, end_time=end_time, is_active=True)
+            for start_time, end_time in wanted if (start_time, end_time) not in existing
+        ]
+        revived = [slot for key, slot in existing.items() if key in wanted_keys and slot.deleted_date is not None]
+        extra_ids = [
+            slot.id for key, slot in existing.items() if key not in wanted_keys and slot.deleted_date is None
+        ] if remove_extra else []
+
+        ClinicSlot.objects.bulk_create(created)
+        for slot in revived:
+            slot.deleted_date = None
+            slot.deleted_by = None
+            slot.is_active = True
+        ClinicSlot.all_objects.bulk_update(revived, ["deleted_date", "deleted_by", "is_active"])
+        if extra_ids:
+            DoctorSchedule.clinic_slot.through.objects.filter(clinicslot_id__in=extra_ids).delete()
+            ClinicSlot.objects.filter(id__in=extra_ids).soft_delete()
+
+        if created or revived or extra_ids:
+            # bulk_create/bulk_update bypass the post_save receivers.
+            transaction.on_commit(lambda: invalidate_schedule_board(clinic.branch_id))
+    return {"created": len(created), "revived": len(revived), "removed": len(extra_ids)}
+
+
+def sync_branch_slots(branch_id, remove_extra=True):
+    """Sync every active clinic of one branch (``None``: clinics without a branch)."""
+    totals = {"clinics": 0, "created": 0, "revived": 0, "removed": 0}
+    for clinic in Clinic.objects.filter(branch_id=branch_id, is_active=True):
+        changes = sync_clinic_slots(clinic, remove_extra=remove_extra)
+        totals["clinics"] += 1
+        for key, count in changes.items():
+            totals[key] += count
+    return totals
+
+
+def _sync_branch_in_worker(branch_id, remove_extra):
+    try:
+        return branch_id, sync_branch_slots(branch_id, remove_extra)
+    finally:
+        connections.close_all()
+
+
+def sync_all_slots(workers=1, remove_extra=True):
+    """Sync the clinics of every branch; return ``{branch_id: totals}``.
+
+    With ``workers > 1`` branches run in forked worker processes, each with its
+    own database connection (on SQLite they always run in this process).
+    """
+    branch_ids = list(
+        Clinic.objects.filter(is_active=True).order_by("branch_id").values_list("branch_id", flat=True).distinct()
+    )
+    # SQLite allows a single writer, so workers would only wait on each other's locks.
+    if workers <= 1 or len(branch_ids) <= 1 or connection.vendor == "sqlite":
+        return {branch_id: sync_branch_slots(branch_id, remove_extra) for branch_id in branch_ids}
+
+    # Forked children must not share the parent's open connections.
+    connections.close_all()
+    context = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = [pool.submit(_sync_branch_in_worker, branch_id, remove_extra) for branch_id in branch_ids]
+        return dict(future.result() for future in futures)
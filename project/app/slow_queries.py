@@ -0,0 +1,180 @@
+"""Capture of slow SQL statements with their EXPLAIN plans.
+
+``SlowQueryMiddleware`` (see ``app.middleware``) times every statement of a
+request with a ``SlowQueryCollector``. Statements slower than
+``SLOW_QUERY_THRESHOLD_MS`` are kept with the URL name of the request and
+the innermost project stack frame that ran them. Bound parameters (patient
+names, phones, ...) are only kept with ``SLOW_QUERY_STORE_PARAMS``, and
+never for statements on ``SENSITIVE_TABLES``; when they are not kept, string
+literals are also masked in the stored plan.
+Once the response is built they are handed to a background thread, which:
+
+- explains a sample of them (``SLOW_QUERY_EXPLAIN_SAMPLE_RATE``, plus the
+  first capture of every statement);
+- stores them as ``SlowQuery`` rows;
+- trims the table to the newest ``SLOW_QUERY_MAX_ROWS``.
+
+Only SELECT statements are explained, and never with ANALYZE, so nothing
+runs twice: ``EXPLAIN (ANALYZE off, FORMAT JSON)`` on PostgreSQL and
+``EXPLAIN QUERY PLAN`` (as JSON rows) on SQLite. Superusers see the
+captures on the slow queries page (``app.com.monitoring``).
+"""
+import hashlib
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import traceback
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+
+from app.models import SlowQuery, User
+from app.query_monitor import STRING_LITERAL, fingerprint, view_label
+
+logger = logging.getLogger(__name__)
+
+CapturedQuery = namedtuple("CapturedQuery", "sql params many seconds view caller stack")
+
+STACK_DEPTH = 8
+# Statements on these tables carry session keys and password hashes.
+SENSITIVE_TABLES = ("django_session", User._meta.db_table)
+# Frames of these modules are the capture machinery, not the caller.
+SKIPPED_FILES = (__file__, os.path.join("app", "middleware.py"), os.path.join("app", "query_monitor.py"))
+
+
+def project_stack():
+    """Return the innermost ``STACK_DEPTH`` frames of the project's own code, innermost first."""
+    root = str(settings.BASE_DIR)
+    frames = []
+    for frame, line in traceback.walk_stack(None):
+        filename = frame.f_code.co_filename
+        if not filename.startswith(root) or filename.endswith(SKIPPED_FILES) or "site-packages" in filename:
+            continue
+        frames.append(f"{os.path.relpath(filename, root)}:{line} in {frame.f_code.co_name}")
+        if len(frames) == STACK_DEPTH:
+            break
+    return frames
+
+
+class SlowQueryCollector:
+    """``connection.execute_wrapper`` that keeps the statements slower than ``threshold`` seconds."""
+
+    def __init__(self, request, threshold):
+        self.request = request
+        self.threshold = threshold
+        self.captured = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            seconds = time.perf_counter() - started
+            if seconds >= self.threshold:
+                stack = project_stack()
+                self.captured.append(CapturedQuery(
+                    sql, params, many, seconds, view_label(self.request), stack[0] if stack else "", stack,
+                ))
+
+
+def is_explainable(query):
+    return not query.many and query.sql.lstrip().upper().startswith(("SELECT", "WITH"))
+
+
+def explain(sql, params):
+    """Return the plan of ``sql`` as JSON text, or None when the backend or statement can't be explained."""
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute("EXPLAIN (ANALYZE off, FORMAT JSON) " + sql, params)
+                plan = cursor.fetchone()[0]
+                return plan if isinstance(plan, str) else json.dumps(plan)
+            if connection.vendor == "sqlite":
+                cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+                return json.dumps([
+                    {"id": row[0], "parent": row[1], "detail": row[-1]} for row in cursor.fetchall()
+                ])
+    except DatabaseError as exc:
+        logger.info("Could not explain slow query: %s", exc)
+    return None
+
+
+def keeps_params(query):
+    if not getattr(settings, "SLOW_QUERY_STORE_PARAMS", False):
+        return False
+    sql = query.sql.lower()
+    return not any(table.lower() in sql for table in SENSITIVE_TABLES)
+
+
+def _trim():
+    max_rows = getattr(settings, "SLOW_QUERY_MAX_ROWS", 1000)
+    oldest_kept = list(SlowQuery.objects.order_by("-id").values_list("id", flat=True)[max_rows - 1:max_rows])
+    if oldest_kept:
+        SlowQuery.objects.filter(id__lt=oldest_kept[0]).delete()
+
+
+def store_slow_queries(captured):
+    """Explain a sample of ``captured``, store it and cap the table."""
+    sample_rate = getattr(settings, "SLOW_QUERY_EXPLAIN_SAMPLE_RATE", 0.2)
+    rows = []
+    explained = set()
+    for query in captured:
+        digest = hashlib.sha1(fingerprint(query.sql).encode()).hexdigest()
+        plan = None
+        if is_explainable(query) and digest not in explained and (
+            random.random() < sample_rate
+            or not SlowQuery.objects.filter(digest=digest, plan__isnull=False).exists()
+        ):
+            plan = explain(query.sql, query.params)
+            explained.add(digest)
+        params = ""
+        if keeps_params(query):
+            params = json.dumps(query.params, default=str)
+        elif plan:
+            # PostgreSQL plans repeat the parameter values as literals.
+            plan = STRING_LITERAL.sub("'?'", plan)
+        rows.append(SlowQuery(
+            digest=digest, sql=query.sql, params=params,
+            duration_ms=query.seconds * 1e3, view=query.view[:200], caller=query.caller[:300],
+            stack="\n".join(query.stack), plan=plan,
+        ))
+    SlowQuery.objects.bulk_create(rows)
+    _trim()
+
+
+_queue = queue.Queue(maxsize=1000)
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def _work():
+    while True:
+        captured = _queue.get()
+        try:
+            store_slow_queries(captured)
+        except Exception:
+            logger.exception("Could not store slow queries")
+        finally:
+            connection.close()
+
+
+def submit(captured):
+    """Store ``captured`` from the background thread (``SLOW_QUERY_BACKGROUND``) or right away."""
+    global _worker
+    if not getattr(settings, "SLOW_QUERY_BACKGROUND", True):
+        store_slow_queries(captured)
+        return
+    with _worker_lock:
+        # Also restarts the thread in a forked worker, where it does not exist.
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_work, name="slow-queries", daemon=True)
+            _worker.start()
+    try:
+        _queue.put_nowait(captured)
+    except queue.Full:
+        logger.warning("Slow query queue full; dropped %d captures", len(captured))
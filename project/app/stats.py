@@ -0,0 +1,215 @@
+"""Incrementally maintained DailyStats and ScheduleStats.
+
+An appointment counts towards the stats while it is not soft-deleted and its
+status is one of ``PAID_STATUSES``. Its *contribution* is the stats rows it
+belongs to and its price. Receivers in ``app.signals`` compare the
+contribution before and after every save, hard delete or soft delete, and
+apply the difference with ``F()`` updates. Pages then only read the rows.
+
+A stats row that does not exist yet is seeded from an aggregate over the
+appointments instead of from a delta, so days that were never counted (or
+rows dropped by ``rebuild_stats``) fill in correctly on first use.
+``rebuild_stats`` recomputes a date range from scratch; see the
+``reconcile_stats`` management command.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from app.dashboard_metrics import invalidate_dashboard_metrics
+from app.models import Appointment, Branch, DailyStats, ScheduleStats
+from app.schedule_board import get_day_of_week
+from app.schedule_cache import entries_valid_on, get_day_board
+
+PAID_STATUSES = ("ARRIVED", "COMPLETED")
+
+CONTRIBUTION_FIELDS = (
+    "branch_id", "doctor_id", "clinic_id", "date", "time", "service_price", "deleted_date", "status__name",
+)
+
+
+def _paid_appointments(**filters):
+    return Appointment.objects.filter(deleted_date__isnull=True, status__name__in=PAID_STATUSES, **filters)
+
+
+def _aggregate(queryset):
+    totals = queryset.aggregate(total=Sum("service_price"), patients=Count("id"))
+    return {"total_revenue": totals["total"] or 0, "total_patients": totals["patients"] or 0}
+
+
+def get_schedule_range(branch_id, doctor_id, clinic_id, date, time, days=None):
+    """Return the merged ``(start_time, end_time)`` range on the board containing ``time``, or None.
+
+    ``days`` optionally memoizes ``get_day_of_week`` across calls.
+    """
+    if days is None:
+        day = get_day_of_week(date)
+    else:
+        if date not in days:
+            days[date] = get_day_of_week(date)
+        day = days[date]
+    if day is None:
+        return None
+    for entry in entries_valid_on(get_day_board(Branch(id=branch_id), day.id), date):
+        if entry["doctor_id"] != doctor_id or entry["clinic_id"] != clinic_id:
+            continue
+        for start_time, end_time in entry["merged_ranges"]:
+            if start_time <= time < end_time:
+                return start_time, end_time
+    return None
+
+
+def get_contribution(values, days=None):
+    """Return ``(daily_key, schedule_key, price)`` for appointment ``values``, or None if it does not count.
+
+    ``values`` maps ``CONTRIBUTION_FIELDS`` to their values, as returned by
+    ``Appointment.objects.values(*CONTRIBUTION_FIELDS)``.
+    """
+    if values["deleted_date"] is not None or values["status__name"] not in PAID_STATUSES:
+        return None
+    if values["branch_id"] is None:
+        return None
+    daily_key = (values["branch_id"], values["date"])
+    schedule_range = get_schedule_range(
+        values["branch_id"], values["doctor_id"], values["clinic_id"], values["date"], values["time"], days,
+    )
+    schedule_key = None
+    if schedule_range:
+        schedule_key = (values["branch_id"], values["doctor_id"], values["clinic_id"], values["date"], *schedule_range)
+    return daily_key, schedule_key, Decimal(str(values["service_price"] or 0))
+
+
+def get_instance_contribution(appointment):
+    """``get_contribution`` for an Appointment instance."""
+    values = {field: getattr(appointment, field) for field in CONTRIBUTION_FIELDS if "__" not in field}
+    values["status__name"] = appointment.status.name if appointment.status_id else None
+    return get_contribution(values)
+
+
+class StatsDelta:
+    """Collects revenue/patient differences per stats row and applies them in one pass."""
+
+    def __init__(self):
+        self.daily = defaultdict(lambda: [Decimal(0), 0])
+        self.schedule = defaultdict(lambda: [Decimal(0), 0])
+
+    def add(self, contribution, sign=1):
+        if contribution is None:
+            return
+        daily_key, schedule_key, price = contribution
+        for rows, key in ((self.daily, daily_key), (self.schedule, schedule_key)):
+            if key is not None:
+                rows[key][0] += sign * price
+                rows[key][1] += sign
+
+    def apply(self):
+        for (branch_id, date), (revenue, patients) in self.daily.items():
+            if revenue or patients:
+                _apply_row(DailyStats, {"branch_id": branch_id, "date": date}, revenue, patients)
+                invalidate_dashboard_metrics(branch_id)
+        for key, (revenue, patients) in self.schedule.items():
+            if revenue or patients:
+                branch_id, doctor_id, clinic_id, date, start_time, end_time = key
+                _apply_row(
+                    ScheduleStats,
+                    {
+                        "branch_id": branch_id, "doctor_id": doctor_id, "clinic_id": clinic_id,
+                        "date": date, "start_time": start_time, "end_time": end_time,
+                    },
+                    revenue,
+                    patients,
+                )
+
+
+def _seed_values(model, key):
+    filters = {"branch_id": key["branch_id"], "date": key["date"]}
+    if model is ScheduleStats:
+        filters.update(
+            doctor_id=key["doctor_id"], clinic_id=key["clinic_id"],
+            time__gte=key["start_time"], time__lt=key["end_time"],
+        )
+    return _aggregate(_paid_appointments(**filters))
+
+
+def _apply_row(model, key, revenue, patients):
+    updated = model.objects.filter(**key).update(
+        total_revenue=F("total_revenue") + revenue,
+        total_patients=F("total_patients") + patients,
+    )
+    if not updated:
+        # The aggregate already includes this change, so it replaces the delta.
+        _, created = model.objects.get_or_create(**key, defaults=_seed_values(model, key))
+        if not created:
+            model.objects.filter(**key).update(
+                total_revenue=F("total_revenue") + revenue,
+                total_patients=F("total_patients") + patients,
+            )
+
+
+def _get_or_seed(model, key):
+    row = model.objects.filter(**key).first()
+    if row is None:
+        row, _ = model.objects.get_or_create(**key, defaults=_seed_values(model, key))
+    return row
+
+
+def get_daily_stats(branch, date):
+    """Return the DailyStats row of ``branch`` on ``date``, seeding it on first use."""
+    return _get_or_seed(DailyStats, {"branch_id": branch.id, "date": date})
+
+
+def get_schedule_stats(branch, doctor_id, clinic_id, date, start_time, end_time):
+    """Return the ScheduleStats row of one board range, seeding it on first use.
+
+    Only ranges that ``get_schedule_range`` resolves are kept up to date by
+    the receivers. For any other range (a schedule outside its
+    ``valid_from``/``valid_to`` window, or times typed into the URL) an
+    unsaved row with live totals is returned instead.
+    """
+    key = {
+        "branch_id": branch.id, "doctor_id": int(doctor_id), "clinic_id": int(clinic_id),
+        "date": date, "start_time": start_time, "end_time": end_time,
+    }
+    if get_schedule_range(branch.id, key["doctor_id"], key["clinic_id"], date, start_time) != (start_time, end_time):
+        return ScheduleStats(**key, **_seed_values(ScheduleStats, key))
+    return _get_or_seed(ScheduleStats, key)
+
+
+def rebuild_stats(start_date, end_date, branch=None):
+    """Recompute DailyStats and ScheduleStats between two dates (inclusive).
+
+    Returns ``(daily_rows, schedule_rows)`` written.
+    """
+    scope = {"date__gte": start_date, "date__lte": end_date}
+    if branch is not None:
+        scope["branch"] = branch
+    with transaction.atomic():
+        return _rebuild_stats(scope)
+
+
+def _rebuild_stats(scope):
+    DailyStats.objects.filter(**scope).delete()
+    ScheduleStats.objects.filter(**scope).delete()
+
+    appointments = _paid_appointments(branch__isnull=False, **scope)
+    daily_rows = [
+        DailyStats(branch_id=row["branch_id"], date=row["date"], total_revenue=row["total"], total_patients=row["patients"])
+        for row in appointments.values("branch_id", "date").annotate(total=Sum("service_price"), patients=Count("id")).order_by()
+    ]
+
+    delta = StatsDelta()
+    days = {}
+    for values in appointments.values(*CONTRIBUTION_FIELDS).iterator():
+        delta.add(get_contribution(values, days))
+    schedule_rows = [
+        ScheduleStats(
+            branch_id=branch_id, doctor_id=doctor_id, clinic_id=clinic_id, date=date,
+            start_time=start_time, end_time=end_time, total_revenue=revenue, total_patients=patients,
+        )
+        for (branch_id, doctor_id, clinic_id, date, start_time, end_time), (revenue, patients) in delta.schedule.items()
+    ]
+    DailyStats.objects.bulk_create(daily_rows)
+    ScheduleStats.objects.bulk_create(schedule_rows)
+    return len(daily_rows), len(schedule_rows)
@@ -1,7 +1,4 @@
 
-from django.http import JsonResponse
-from project.settings import key_hashing
-from cryptography.fernet import Fernet
 import uuid
 import datetime as dt
 import re
@@ -9,15 +6,12 @@ from project.settings import CHAR_05, CHAR_10, CHAR_15
 from django import template
 from datetime import datetime
 from django.utils import timezone
-from app.helpers import get_local_now
+from app.id_codec import decode_id, encode_id
 register = template.Library()
 
 @register.filter
 def get_id_hashed_of_object(object_id):
-    fernet = Fernet(key_hashing)
-    encMessage = fernet.encrypt(str(object_id).encode())
-    out = (encMessage).decode('ascii')
-    return str(out)
+    return encode_id(object_id)
 
 def check_if_post_input_valid(text, max_length): 
     if not isinstance(text, str) or text.strip() == '':
@@ -53,34 +47,9 @@ def check_valid_text(text):
         return ''
     
 def get_id_of_object(hash_used):
-    decMessage = None
-    try :
-        fernet = Fernet(key_hashing)
-        decMessage = fernet.decrypt(str(hash_used)).decode()
-    except Exception as err:
-        pass
+    return decode_id(str(hash_used))
 
-    return decMessage
 
-
-def delete(request, model_name, condition):
-    deleted_date            = get_local_now()
-    object                  = model_name.objects.filter(condition)
-
-    if not object.exists():
-        return JsonResponse({"Result": "Fail", "message": "Object not found"}, safe=False, status=404)
-
-    object.update(deleted_by=request.user, deleted_date = deleted_date)
-
-    allJson = {"Result": "Fail"}
-
-    allJson['Result'] = "Success"
-
-
-    if allJson != None:
-        return JsonResponse(allJson, safe=False)
-    else:
-        allJson['Result'] = "Fail"
 from itertools import groupby
 from operator import attrgetter
 @register.filter
@@ -1,3 +1,1197 @@
-from django.test import TestCase
+import base64
+import datetime
+import json
+import pstats
+import re
+import shutil
+import tempfile
+import threading
+from collections import namedtuple
+from io import StringIO
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from app.booking import SlotFull, book_appointment, rebook_appointment
+from app.com.appointment import SLOT_FULL_MESSAGE
+from app.dashboard_metrics import compute_dashboard_metrics, get_dashboard_metrics
+from app.helpers import apply_doctor_branch_pricing_bulk, get_local_now
+from app.id_codec import FernetIdCodec, SignedIdCodec
+from app import metrics
+from app.loadbench import VIEWS, benchmark_branches, delete_dataset, run_benchmarks, seed_dataset
+from app.models import (
+    Appointment, Branch, Clinic, ClinicSlot, DailyStats, DaysOfWeek, Doctor, DoctorBranch, DoctorSchedule, Invoice,
+    InvoiceCounter, Patient, PrintJob, ScheduleStats, SlotBooking, SlowQuery, Specialization, Status, TicketCounter,
+    User,
+)
+from app.print_queue import acknowledge_print_jobs, claim_print_jobs, local_notifier
+from app.profiling import list_captures
+from app.query_monitor import QueryRecorder, fingerprint, get_query_stats, record_request, reset_query_stats
+from app.schedule_board import DAY_NAMES_EN, build_schedule_board, get_range_state
+from app.schedule_cache import get_day_board, get_week_board
+from app.schedule_conflicts import IntervalIndex, ScheduleConflictIndex, find_branch_conflicts
+from app.search import normalize_text, search_queryset
+from app.serializers import APPOINTMENT_JSON
+from app.slots import desired_slots, sync_clinic_slots
+from app.stats import rebuild_stats
+from app.templatetags.helpers import get_id_hashed_of_object, get_id_of_object
+from app.tickets import assign_ticket_number
+
+
+class BranchPricingTests(TestCase):
+    def setUp(self):
+        self.branch = Branch.objects.create(address="Main Branch")
+        self.specialization = Specialization.objects.create(name="Cardiology")
+        self.user = User.objects.create_user(username="secretary", password="x", branch=self.branch)
+
+    def create_doctors(self, count):
+        doctors = []
+        for i in range(count):
+            doctor = Doctor.objects.create(
+                full_name=f"Doctor {i}",
+                specialization=self.specialization,
+                phone_number=f"0100{Doctor.objects.count():07d}",
+                consultation_price=100,
+                examination_price=200,
+            )
+            if i % 2 == 0:
+                DoctorBranch.objects.create(
+                    doctor=doctor,
+                    branch=self.branch,
+                    consultation_price=150,
+                    examination_price=250,
+                )
+            doctors.append(doctor)
+        return doctors
+
+    def test_bulk_pricing_attaches_branch_prices(self):
+        self.create_doctors(2)
+        priced = apply_doctor_branch_pricing_bulk(Doctor.objects.order_by("id"), self.branch)
+        self.assertEqual(priced[0].consultation_price, 150)
+        self.assertEqual(priced[0].global_consultation_price, 100)
+        self.assertIsNotNone(priced[0].branch_profile)
+        self.assertEqual(priced[1].consultation_price, 100)
+        self.assertIsNone(priced[1].branch_profile)
+
+    def test_bulk_pricing_uses_one_query(self):
+        doctors = self.create_doctors(25)
+        with self.assertNumQueries(1):
+            apply_doctor_branch_pricing_bulk(doctors, self.branch)
+
+    def test_doctors_by_specialization_query_count_is_constant(self):
+        self.client.force_login(self.user)
+        url = f"/api/get-doctors-by-specialization?specialization={self.specialization.id}"
+
+        self.create_doctors(2)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url, secure=True)
+
+        self.create_doctors(20)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(url, secure=True)
+
+        self.assertEqual(len(response.json()["doctors"]), 22)
+        self.assertEqual(len(few), len(many))
+
+
+class IdCodecTests(TestCase):
+    def test_hashed_ids_are_deterministic_and_round_trip(self):
+        token = get_id_hashed_of_object(42)
+        self.assertEqual(token, get_id_hashed_of_object(42))
+        self.assertEqual(get_id_of_object(token), "42")
+
+    def test_legacy_fernet_tokens_still_decode(self):
+        legacy_token = FernetIdCodec().encode(7)
+        self.assertEqual(get_id_of_object(legacy_token), "7")
+
+    def test_tampered_and_garbage_tokens_are_rejected(self):
+        raw = base64.urlsafe_b64decode(SignedIdCodec().encode(42) + "==")
+        tampered = base64.urlsafe_b64encode(raw.replace(b"42", b"43", 1)).decode().rstrip("=")
+        self.assertIsNone(get_id_of_object(tampered))
+        self.assertIsNone(get_id_of_object("not-a-token"))
+        self.assertIsNone(get_id_of_object(None))
+
+
+class ScheduleBoardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.branch = Branch.objects.create(address="Main Branch")
+        self.specialization = Specialization.objects.create(name="Cardiology")
+        self.user = User.objects.create_user(username="secretary", password="x", branch=self.branch)
+        self.clinic = Clinic.objects.create(name="Clinic 1", branch=self.branch)
+        self.slots = [
+            ClinicSlot.objects.create(clinic=self.clinic, start_time=datetime.time(hour, 0), end_time=datetime.time(hour + 1, 0))
+            for hour in range(13, 23)
+        ]
+        self.today = get_local_now().date()
+        self.day = DaysOfWeek.objects.create(name=DAY_NAMES_EN[self.today.weekday()])
+
+    def create_schedules(self, count):
+        for i in range(count):
+            doctor = Doctor.objects.create(
+                full_name=f"Doctor {i}",
+                specialization=self.specialization,
+                phone_number=f"0100{Doctor.objects.count():07d}",
+            )
+            schedule = DoctorSchedule.objects.create(
+                doctor=doctor, clinic=self.clinic, day_of_week=self.day, branch=self.branch,
+            )
+            # Two continuous slots plus one detached slot -> two merged ranges.
+            schedule.clinic_slot.set([self.slots[0], self.slots[1], self.slots[5]])
+
+    def test_board_merges_continuous_slots(self):
+        self.create_schedules(1)
+        board = build_schedule_board(
+            DoctorSchedule.objects.filter(branch=self.branch), self.branch, self.today, get_local_now(),
+        )
+        self.assertEqual(
+            [(entry["start_time"], entry["end_time"]) for entry in board],
+            [(datetime.time(13, 0), datetime.time(15, 0)), (datetime.time(18, 0), datetime.time(19, 0))],
+        )
+        self.assertEqual(board[0]["specialization_name"], "Cardiology")
+
+    def test_board_query_count_is_constant(self):
+        self.create_schedules(1)
+        with CaptureQueriesContext(connection) as few:
+            build_schedule_board(DoctorSchedule.objects.all(), self.branch, self.today, get_local_now())
+        self.create_schedules(10)
+        with CaptureQueriesContext(connection) as many:
+            board = build_schedule_board(DoctorSchedule.objects.all(), self.branch, self.today, get_local_now())
+        self.assertEqual(len(board), 22)
+        self.assertEqual(len(few), len(many))
+
+    def test_today_appointments_renders_board(self):
+        self.create_schedules(3)
+        self.client.force_login(self.user)
+        response = self.client.get("/appointments/today", secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["schedule_slots"]), 6)
+
+    def test_range_state(self):
+        now = get_local_now().replace(hour=14, minute=30)
+        start, end = datetime.time(14, 0), datetime.time(15, 0)
+        self.assertEqual(get_range_state(start, end, now.date(), now), (True, False, False))
+        self.assertEqual(get_range_state(start, end, now.date() - datetime.timedelta(days=1), now), (False, True, False))
+        self.assertEqual(get_range_state(start, end, now.date() + datetime.timedelta(days=1), now), (False, False, True))
+
+    def test_cached_board_is_served_without_queries(self):
+        self.create_schedules(2)
+        get_day_board(self.branch, self.day.id)
+        with self.assertNumQueries(0):
+            entries = get_day_board(self.branch, self.day.id)
+        self.assertEqual(len(entries), 2)
+
+    def test_board_is_invalidated_by_slot_and_schedule_writes(self):
+        self.create_schedules(1)
+        schedule = DoctorSchedule.objects.get()
+        self.assertEqual(len(get_day_board(self.branch, self.day.id)[0]["merged_ranges"]), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            schedule.clinic_slot.add(self.slots[2], self.slots[3], self.slots[4])
+            # Not before the commit, or a concurrent rebuild would cache the old rows.
+            self.assertEqual(len(get_day_board(self.branch, self.day.id)[0]["merged_ranges"]), 2)
+        self.assertEqual(
+            get_day_board(self.branch, self.day.id)[0]["merged_ranges"],
+            [(datetime.time(13, 0), datetime.time(19, 0))],
+        )
+
+        slot = self.slots[5]
+        slot.end_time = datetime.time(18, 30)
+        with self.captureOnCommitCallbacks(execute=True):
+            slot.save()
+        self.assertEqual(get_day_board(self.branch, self.day.id)[0]["merged_ranges"][-1][1], datetime.time(18, 30))
+
+    def test_board_is_invalidated_by_soft_delete(self):
+        self.create_schedules(2)
+        self.assertEqual(len(get_day_board(self.branch, self.day.id)), 2)
+        self.client.force_login(self.user)
+        schedule = DoctorSchedule.objects.order_by("id").first()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(f"/doctor-schedule/delete/{schedule.id}/", secure=True)
+        self.assertEqual(len(get_day_board(self.branch, self.day.id)), 1)
+
+
+class FrontDeskDataMixin:
+    """Branch, doctor, clinic and patient rows shared by the front-desk tests."""
+
+    def setUp(self):
+        cache.clear()
+        self.branch = Branch.objects.create(address="Main Branch")
+        self.specialization = Specialization.objects.create(name="Cardiology")
+        self.user = User.objects.create_user(
+            username="secretary", password="x", branch=self.branch, user_type=User.UserType.MANAGER,
+        )
+        self.doctor = Doctor.objects.create(full_name="Doctor", specialization=self.specialization, phone_number="0100")
+        self.clinic = Clinic.objects.create(name="Clinic 1", branch=self.branch)
+        self.patient = Patient.objects.create(name="Patient", phone_number="0111", branch=self.branch)
+        self.open_status = Status.objects.create(name="OPEN")
+        self.today = get_local_now().date()
+        self.client.force_login(self.user)
+
+    def create_appointment(self, **kwargs):
+        values = {
+            "patient": self.patient,
+            "doctor": self.doctor,
+            "clinic": self.clinic,
+            "status": self.open_status,
+            "service_type": "consultation",
+            "service_price": 100,
+            "date": self.today,
+            "time": datetime.time(14, 0),
+            "branch": self.branch,
+        }
+        values.update(kwargs)
+        return Appointment.objects.create(**values)
+
+
+class PrintQueueTests(FrontDeskDataMixin, TestCase):
+    def test_wait_returns_every_pending_job_in_one_batch(self):
+        for _ in range(3):
+            PrintJob.objects.create(appointment=self.create_appointment(), ticket_number="1")
+        response = self.client.get("/print-jobs/wait/?timeout=0", secure=True)
+        self.assertEqual(len(response.json()["jobs"]), 3)
+
+    def test_wait_times_out_with_empty_batch(self):
+        response = self.client.get("/print-jobs/wait/?timeout=0", secure=True)
+        self.assertEqual(response.json(), {"jobs": []})
+
+    def test_claims_do_not_hand_out_the_same_job_twice(self):
+        for _ in range(5):
+            PrintJob.objects.create(appointment=self.create_appointment(), ticket_number="1")
+        first = claim_print_jobs("printer-1", 3)
+        second = claim_print_jobs("printer-2", 3)
+        self.assertEqual(len(first), 3)
+        self.assertEqual(len(second), 2)
+        self.assertFalse({job.id for job in first} & {job.id for job in second})
+        self.assertEqual(claim_print_jobs("printer-3", 3), [])
+
+    def test_expired_leases_are_requeued(self):
+        job = PrintJob.objects.create(appointment=self.create_appointment(), ticket_number="1")
+        claim_print_jobs("printer-1", 1)
+        PrintJob.objects.filter(id=job.id).update(lease_expires_at=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertEqual([j.id for j in claim_print_jobs("printer-2", 1)], [job.id])
+        # The first printer lost the lease, so its late acknowledgement is ignored.
+        self.assertEqual(acknowledge_print_jobs([job.id], "printer-1"), 0)
+
+    @override_settings(PRINT_JOBS_MAX_LEASE_SECONDS=120)
+    def test_claim_caps_lease_seconds(self):
+        job = PrintJob.objects.create(appointment=self.create_appointment(), ticket_number="1")
+        response = self.client.post(
+            "/print-jobs/claim/", {"worker": "printer-1", "lease_seconds": 10 ** 30},
+            content_type="application/json", secure=True,
+        )
+        self.assertEqual(response.status_code, 200)
+        job.refresh_from_db()
+        self.assertLessEqual(job.lease_expires_at, timezone.now() + datetime.timedelta(seconds=120))
+
+    def test_bulk_acknowledge_uses_one_update(self):
+        jobs = [PrintJob.objects.create(appointment=self.create_appointment(), ticket_number="1") for _ in range(4)]
+        claim_print_jobs("printer-1", 4)
+        with self.assertNumQueries(1):
+            updated = acknowledge_print_jobs([job.id for job in jobs], "printer-1")
+        self.assertEqual(updated, 4)
+        response = self.client.post(
+            "/print-jobs/ack/", {"job_ids": [jobs[0].id]}, content_type="application/json", secure=True,
+        )
+        self.assertEqual(response.json(), {"success": True, "updated": 0})
+        self.assertFalse(PrintJob.objects.exclude(status=PrintJob.Status.DONE).exists())
+
+    def test_check_in_wakes_local_waiters(self):
+        seen = local_notifier.version
+        woke = []
+        waiter = threading.Thread(target=lambda: woke.append(local_notifier.wait(seen, 5)))
+        waiter.start()
+        appointment = self.create_appointment()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/appointments/check-in", {"id": appointment.id}, secure=True)
+        waiter.join(5)
+        self.assertEqual(woke, [True])
+
+
+class TicketNumberTests(FrontDeskDataMixin, TestCase):
+    def test_numbers_are_sequential_per_doctor_clinic_and_day(self):
+        numbers = [assign_ticket_number(self.create_appointment()) for _ in range(3)]
+        other_clinic = Clinic.objects.create(name="Clinic 2", branch=self.branch)
+        self.assertEqual(numbers, [1, 2, 3])
+        self.assertEqual(assign_ticket_number(self.create_appointment(clinic=other_clinic)), 1)
+        self.assertEqual(TicketCounter.objects.get(clinic=self.clinic).last_number, 3)
+
+    def test_numbers_are_not_reused_after_delete(self):
+        first = self.create_appointment()
+        assign_ticket_number(first)
+        first.delete()
+        self.assertEqual(assign_ticket_number(self.create_appointment()), 2)
+
+    def test_numbered_appointment_keeps_its_number(self):
+        appointment = self.create_appointment()
+        assign_ticket_number(appointment)
+        with self.assertNumQueries(0):
+            self.assertEqual(assign_ticket_number(appointment), 1)
+        stale = Appointment.objects.get(id=appointment.id)
+        stale.ticket_number = None
+        self.assertEqual(assign_ticket_number(stale), 1)
+
+    def test_branchless_appointment_is_not_numbered(self):
+        appointment = self.create_appointment(branch=None)
+        with self.assertRaises(ValueError):
+            assign_ticket_number(appointment)
+        self.assertFalse(TicketCounter.objects.exists())
+
+    def test_check_in_assigns_ticket_number(self):
+        first, second = self.create_appointment(), self.create_appointment()
+        for appointment in (second, first):
+            self.client.post("/appointments/check-in", {"id": appointment.id}, secure=True)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((second.ticket_number, first.ticket_number), (1, 2))
+
+    def test_moving_a_numbered_appointment_renumbers_it(self):
+        other_doctor = Doctor.objects.create(full_name="Doctor 2", specialization=self.specialization, phone_number="0101")
+        first, moved = self.create_appointment(), self.create_appointment(doctor=other_doctor)
+        assign_ticket_number(first)
+        assign_ticket_number(moved)
+        response = self.client.post("/appointments/update-today", {
+            "id": moved.id, "patient_name": "Patient", "patient_phone": "0111", "patient_id": self.patient.id,
+            "doctor": self.doctor.id, "clinic": self.clinic.id, "status": "OPEN",
+            "date": self.today.strftime("%Y-%m-%d"), "time": "15:00",
+        }, secure=True)
+        self.assertEqual(response.status_code, 302)
+        moved.refresh_from_db()
+        self.assertEqual((moved.doctor_id, moved.ticket_number), (self.doctor.id, 2))
+
+
+class InvoiceNumberTests(FrontDeskDataMixin, TestCase):
+    def create_invoice(self, **kwargs):
+        return Invoice.objects.create(
+            appointment=self.create_appointment(), total_price=100, status=self.open_status, **kwargs
+        )
+
+    def test_numbers_are_sequential_and_reset_daily(self):
+        numbers = [self.create_invoice().invoice_number for _ in range(3)]
+        tomorrow = self.create_invoice(invoice_date=self.today + datetime.timedelta(days=1))
+        self.assertEqual(numbers, [1, 2, 3])
+        self.assertEqual(tomorrow.invoice_number, 1)
+        self.assertEqual(InvoiceCounter.objects.get(date=self.today).last_number, 3)
+
+    def test_numbering_does_not_count_existing_invoices(self):
+        for _ in range(5):
+            self.create_invoice()
+        appointment = self.create_appointment()
+        with CaptureQueriesContext(connection) as queries:
+            invoice = Invoice.objects.create(appointment=appointment, total_price=100, status=self.open_status)
+        self.assertEqual(invoice.invoice_number, 6)
+        self.assertFalse([q for q in queries.captured_queries if "COUNT(" in q["sql"].upper()])
+        # Updating an invoice keeps its number.
+        invoice.total_price = 150
+        invoice.save()
+        self.assertEqual(Invoice.objects.get(id=invoice.id).invoice_number, 6)
+
+    def test_bulk_numbering_continues_the_daily_counter(self):
+        self.create_invoice()
+        tomorrow = self.today + datetime.timedelta(days=1)
+        invoices = Invoice.objects.bulk_create(Invoice.number_in_bulk([
+            Invoice(appointment=self.create_appointment(), total_price=100, status=self.open_status, invoice_date=date)
+            for date in (self.today, tomorrow, self.today)
+        ]))
+        self.assertEqual([invoice.invoice_number for invoice in invoices], [2, 1, 3])
+        self.assertEqual(self.create_invoice().invoice_number, 4)
+
+
+class IncrementalStatsTests(FrontDeskDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.arrived = Status.objects.create(name="ARRIVED")
+        day = DaysOfWeek.objects.create(name=DAY_NAMES_EN[self.today.weekday()])
+        self.schedule = schedule = DoctorSchedule.objects.create(
+            doctor=self.doctor, clinic=self.clinic, day_of_week=day, branch=self.branch,
+        )
+        schedule.clinic_slot.set([
+            ClinicSlot.objects.create(clinic=self.clinic, start_time=datetime.time(hour, 0), end_time=datetime.time(hour + 1, 0))
+            for hour in (13, 14)
+        ])
+        self.range_key = {
+            "branch": self.branch, "doctor": self.doctor, "clinic": self.clinic, "date": self.today,
+            "start_time": datetime.time(13, 0), "end_time": datetime.time(15, 0),
+        }
+
+    def assertStats(self, revenue, patients):
+        daily = DailyStats.objects.get(branch=self.branch, date=self.today)
+        schedule = ScheduleStats.objects.get(**self.range_key)
+        self.assertEqual((daily.total_revenue, daily.total_patients), (revenue, patients))
+        self.assertEqual((schedule.total_revenue, schedule.total_patients), (revenue, patients))
+
+    def test_status_price_and_soft_delete_apply_deltas(self):
+        first = self.create_appointment(status=self.arrived)
+        second = self.create_appointment()
+        self.assertStats(100, 1)
+
+        second.status = self.arrived
+        second.save()
+        second.service_price = 150
+        second.save()
+        self.assertStats(250, 2)
+
+        first.status = self.open_status
+        first.save()
+        self.assertStats(150, 1)
+
+        Appointment.objects.filter(id=second.id).soft_delete(self.user)
+        self.assertStats(0, 0)
+        # Deleting it again must not subtract twice.
+        Appointment.objects.filter(id=second.id).soft_delete(self.user)
+        self.assertStats(0, 0)
+
+    def test_rebuild_matches_incremental_rows(self):
+        for price in (100, 80):
+            self.create_appointment(status=self.arrived, service_price=price)
+        self.create_appointment(status=self.arrived, time=datetime.time(20, 0))
+        self.create_appointment()
+        incremental = list(DailyStats.objects.values_list("total_revenue", "total_patients"))
+        ScheduleStats.objects.update(total_revenue=0)
+
+        self.assertEqual(rebuild_stats(self.today, self.today), (1, 1))
+        self.assertEqual(list(DailyStats.objects.values_list("total_revenue", "total_patients")), incremental)
+        schedule = ScheduleStats.objects.get(**self.range_key)
+        self.assertEqual((schedule.total_revenue, schedule.total_patients), (180, 2))
+
+    def test_today_page_only_reads_stats(self):
+        self.create_appointment(status=self.arrived)
+        url = (
+            f"/appointments/today?doctor={self.doctor.id}&clinic={self.clinic.id}&start=13:00&end=15:00"
+        )
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, secure=True)
+        self.assertEqual((response.context["day_total_revenue"], response.context["schedule_revenue"]), (100, 100))
+        writes = [q["sql"] for q in queries.captured_queries if q["sql"].startswith(("INSERT", "UPDATE"))]
+        self.assertFalse([sql for sql in writes if "stats" in sql])
+
+    def test_today_page_counts_ranges_of_expired_schedules_live(self):
+        self.schedule.valid_from = self.today - datetime.timedelta(days=7)
+        self.schedule.valid_to = self.today - datetime.timedelta(days=1)
+        self.schedule.save()
+        url = f"/appointments/today?doctor={self.doctor.id}&clinic={self.clinic.id}&start=13:00&end=15:00"
+        self.assertEqual(self.client.get(url, secure=True).context["schedule_patients_count"], 0)
+        self.create_appointment(status=self.arrived, time=datetime.time(13, 30))
+        self.assertEqual(self.client.get(url, secure=True).context["schedule_patients_count"], 1)
+        self.assertFalse(ScheduleStats.objects.exists())
+
+
+class DashboardMetricsTests(FrontDeskDataMixin, TestCase):
+    def test_metrics_use_three_queries(self):
+        DoctorBranch.objects.create(doctor=self.doctor, branch=self.branch)
+        appointment = self.create_appointment()
+        self.create_appointment(date=self.today - datetime.timedelta(days=400))
+        Invoice.objects.create(appointment=appointment, total_price=120, status=self.open_status)
+        with self.assertNumQueries(3):
+            metrics = compute_dashboard_metrics(self.branch, self.today)
+        self.assertEqual(metrics["total_patients_count"], 1)
+        self.assertEqual(metrics["patients_this_month"], 1)
+        self.assertEqual(metrics["appointments_today"], 1)
+        self.assertEqual(metrics["appointments_this_week"], 1)
+        self.assertEqual(metrics["active_doctors_count"], 1)
+        self.assertEqual((metrics["total_income"], metrics["income_this_week"]), (120, 120))
+
+    def test_snapshot_is_cached_and_refreshed_by_stats(self):
+        get_dashboard_metrics(self.branch, self.today)
+        with self.assertNumQueries(0):
+            get_dashboard_metrics(self.branch, self.today)
+        self.create_appointment(status=Status.objects.create(name="ARRIVED"))
+        self.assertEqual(get_dashboard_metrics(self.branch, self.today)["appointments_today"], 1)
+        response = self.client.get("/", secure=True)
+        self.assertEqual(response.context["appointments_today"], 1)
+
+    def test_branchless_user_sees_an_empty_dashboard(self):
+        self.client.force_login(User.objects.create_superuser(username="admin", password="x"))
+        with self.assertNumQueries(0):
+            metrics = get_dashboard_metrics(None, self.today)
+        self.assertEqual(set(metrics.values()), {0})
+        self.assertEqual(set(metrics), set(compute_dashboard_metrics(self.branch, self.today)))
+        response = self.client.get("/", secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["appointments_today"], 0)
+
+
+class DataTablesKeysetTests(FrontDeskDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(24):
+            Patient.objects.create(name=f"Patient {i % 7}", phone_number=f"02{i:08d}", branch=self.branch)
+
+    def get_page(self, **params):
+        query = {"draw": 1, "start": 0, "length": 10, **params}
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get("/get-list-of-patients", query, secure=True).json()
+        counts = [q["sql"] for q in queries.captured_queries if "COUNT(" in q["sql"].upper()]
+        return data, counts, queries
+
+    def test_cursor_pages_match_offset_pages_without_offset(self):
+        order = {"order[0][column]": 1, "order[0][dir]": "desc", "columns[1][data]": "name"}
+        first, counts, _ = self.get_page(**order)
+        self.assertEqual(first["recordsTotal"], 25)
+        self.assertEqual(len(counts), 1)
+        by_offset, _, _ = self.get_page(start=10, **order)
+        by_cursor, counts, queries = self.get_page(start=10, cursor=first["cursor"], **order)
+        self.assertEqual([row["id"] for row in by_cursor["data"]], [row["id"] for row in by_offset["data"]])
+        self.assertFalse([q for q in queries.captured_queries if "OFFSET" in q["sql"].upper()])
+        # The unfiltered total is cached.
+        self.assertEqual(counts, [])
+
+    def test_search_runs_a_single_count(self):
+        self.get_page()
+        data, counts, _ = self.get_page(**{"search[value]": "Patient 3"})
+        self.assertEqual((data["recordsTotal"], data["recordsFiltered"]), (25, 3))
+        self.assertEqual(len(counts), 1)
+
+    def test_total_is_dropped_when_patients_change(self):
+        self.get_page()
+        Patient.objects.create(name="New", phone_number="0333", branch=self.branch)
+        data, _, _ = self.get_page()
+        self.assertEqual(data["recordsTotal"], 26)
+
+
+class SearchTests(FrontDeskDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.fatma = Patient.objects.create(name="فاطمة أحمد", phone_number="01012345678", branch=self.branch)
+        self.mona = Patient.objects.create(name="مُنى علي", phone_number="+20 122 555 0000", branch=self.branch)
+
+    def search(self, value):
+        return set(search_queryset(Patient.objects.filter(branch=self.branch), value))
+
+    def test_arabic_letter_variants_and_diacritics_match(self):
+        self.assertEqual(normalize_text("إِسْرَاء"), "اسراء")
+        self.assertEqual(self.search("فاطمه احمد"), {self.fatma})
+        self.assertEqual(self.search("مني"), {self.mona})
+
+    def test_numbers_match_phone_prefix_and_exact_id(self):
+        self.assertEqual(self.search("٠١٠١٢"), {self.fatma})
+        self.assertEqual(self.search("20122"), {self.mona})
+        self.assertEqual(self.search("12345"), set())
+        self.assertEqual(self.search(str(self.mona.id)), {self.mona})
+
+    def test_doctor_and_user_lists_use_the_engine(self):
+        response = self.client.get("/users/get-list-of-users", {"search[value]": "SECRET"}, secure=True)
+        self.assertEqual([row["username"] for row in response.json()["data"]], ["secretary"])
+        response = self.client.get("/get-list-of-doctors", {"search[value]": "0100"}, secure=True)
+        self.assertEqual(response.json()["recordsFiltered"], 1)
+
+
+class SoftDeleteTests(FrontDeskDataMixin, TestCase):
+    def test_default_manager_hides_soft_deleted_rows(self):
+        appointment = self.create_appointment()
+        self.assertEqual(Appointment.objects.filter(id=appointment.id).soft_delete(self.user), 1)
+        self.assertFalse(Appointment.objects.filter(id=appointment.id).exists())
+        deleted = Appointment.all_objects.get(id=appointment.id)
+        self.assertIsNotNone(deleted.deleted_date)
+        self.assertEqual(deleted.deleted_by, self.user)
+        # Already deleted rows are left alone.
+        self.assertEqual(Appointment.all_objects.filter(id=appointment.id).soft_delete(), 0)
+
+    def test_views_do_not_return_deleted_patients(self):
+        appointment = self.create_appointment()
+        self.client.force_login(self.user)
+        self.client.post("/delete-patient", {"id": self.patient.id}, secure=True)
+        self.assertFalse(Appointment.objects.filter(id=appointment.id).exists())
+
+        response = self.client.get(f"/patient-details?id={get_id_hashed_of_object(self.patient.id)}", secure=True)
+        self.assertEqual(response.status_code, 302)
+        response = self.client.get(f"/api/patients/{self.patient.id}/latest-appointments/", secure=True)
+        self.assertEqual(response.status_code, 404)
+
+    def test_live_branch_queries_use_partial_indexes(self):
+        queries = {
+            "patient_live_branch_phone_idx": Patient.objects.filter(branch=self.branch, phone_number="0111"),
+            "patient_live_branch_name_idx": Patient.objects.filter(branch=self.branch).order_by("name"),
+            "schedule_live_branch_day_idx": DoctorSchedule.objects.filter(branch=self.branch, day_of_week_id=1),
+            "appt_live_branch_date_doc_idx": Appointment.objects.filter(branch=self.branch, date=self.today),
+        }
+        for name, queryset in queries.items():
+            with self.subTest(index=name):
+                self.assertIn(name, queryset.explain())
+
+
+class SerializerTests(FrontDeskDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        for hour in (9, 10, 11):
+            self.create_appointment(time=datetime.time(hour, 0), date=self.today - datetime.timedelta(days=hour))
+
+    def test_bulk_rows_match_instance_rows(self):
+        queryset = Appointment.objects.order_by("id")
+        with self.assertNumQueries(1):
+            rows = APPOINTMENT_JSON.serialize(queryset)
+        self.assertEqual(rows, [appointment.tojson() for appointment in queryset])
+        with self.assertNumQueries(1):
+            prepared = [APPOINTMENT_JSON.to_dict(appointment) for appointment in APPOINTMENT_JSON.prepare(queryset)]
+        self.assertEqual(prepared, rows)
+
+    def test_latest_appointments_pages_with_cursor(self):
+        self.client.force_login(self.user)
+        url = f"/api/patients/{self.patient.id}/latest-appointments/"
+        first = self.client.get(url, {"limit": 2}, secure=True).json()
+        self.assertEqual([row["time"] for row in first["appointments"]], ["09:00", "10:00"])
+        second = self.client.get(url, {"limit": 2, "cursor": first["cursor"]}, secure=True).json()
+        self.assertEqual([row["time"] for row in second["appointments"]], ["11:00"])
+        self.assertIsNone(second["cursor"])
+
+        response = self.client.get(f"/api/doctors/{self.doctor.id}/latest-appointments/", secure=True)
+        self.assertEqual(len(response.json()["appointments"]), 3)
+
+
+class SlotSyncTests(FrontDeskDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.clinic.default_open_time = datetime.time(9, 0)
+        self.clinic.default_close_time = datetime.time(13, 0)
+        self.clinic.save()
+        self.kept = ClinicSlot.objects.create(clinic=self.clinic, start_time=datetime.time(9, 0), end_time=datetime.time(10, 0))
+        self.stray = ClinicSlot.objects.create(clinic=self.clinic, start_time=datetime.time(15, 0), end_time=datetime.time(16, 0))
+        self.schedule = DoctorSchedule.objects.create(
+            doctor=self.doctor, clinic=self.clinic, day_of_week=DaysOfWeek.objects.create(name="Monday"),
+            branch=self.branch,
+        )
+        self.schedule.clinic_slot.set([self.kept, self.stray])
+
+    def slot_times(self):
+        return [(slot.start_time.hour, slot.end_time.hour) for slot in ClinicSlot.objects.filter(clinic=self.clinic)]
+
+    def test_sync_applies_only_the_difference(self):
+        self.assertEqual(sync_clinic_slots(self.clinic), {"created": 3, "revived": 0, "removed": 1})
+        self.assertEqual(self.slot_times(), [(9, 10), (10, 11), (11, 12), (12, 13)])
+        self.assertEqual(list(self.schedule.clinic_slot.all()), [self.kept])
+        self.assertEqual(sync_clinic_slots(self.clinic), {"created": 0, "revived": 0, "removed": 0})
+
+        self.clinic.slot_duration_hours = 2
+        self.clinic.save()
+        self.assertEqual(sync_clinic_slots(self.clinic), {"created": 2, "revived": 0, "removed": 4})
+        self.assertEqual(self.slot_times(), [(9, 11), (11, 13)])
+        self.clinic.slot_duration_hours = 1
+        self.clinic.save()
+        self.assertEqual(sync_clinic_slots(self.clinic), {"created": 0, "revived": 4, "removed": 2})
+
+    def test_window_past_midnight(self):
+        windows = [(datetime.time(23, 0), datetime.time(0, 0))]
+        self.assertEqual(desired_slots(self.clinic, windows), [(datetime.time(23, 0), datetime.time(0, 0))])
+
+    def test_command_syncs_every_branch(self):
+        call_command("create_clinic_slots", stdout=StringIO())
+        self.assertEqual(len(self.slot_times()), 4)
+
+
+class SlotAvailabilityTests(FrontDeskDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.day = DaysOfWeek.objects.create(name="Monday")
+        self.slots = [
+            ClinicSlot.objects.create(clinic=self.clinic, start_time=datetime.time(hour, 0), end_time=datetime.time(hour + 1, 0))
+            for hour in range(9, 15)
+        ]
+        self.schedule = DoctorSchedule.objects.create(
+            doctor=self.doctor, clinic=self.clinic, day_of_week=self.day, branch=self.branch,
+        )
+        self.schedule.clinic_slot.set(self.slots[:2])
+
+    def get_slots(self):
+        return self.client.get(
+            "/api/time-slots/", {"clinic_id": self.clinic.id, "day_of_week_id": self.day.id}, secure=True,
+        ).json()["slots"]
+
+    def test_slots_are_answered_in_constant_queries(self):
+        with CaptureQueriesContext(connection) as few:
+            slots = self.get_slots()
+        self.assertEqual([slot["is_available"] for slot in slots], [False, False, True, True, True, True])
+        self.assertEqual(slots[0]["doctor_name"], "Doctor")
+        for hour in range(15, 22):
+            ClinicSlot.objects.create(clinic=self.clinic, start_time=datetime.time(hour, 0), end_time=datetime.time(hour + 1, 0))
+        with CaptureQueriesContext(connection) as many:
+            self.assertEqual(len(self.get_slots()), 13)
+        self.assertEqual(len(many), len(few))
+
+    def test_saving_a_schedule_rejects_taken_slots(self):
+        other = Doctor.objects.create(full_name="Other", specialization=self.specialization, phone_number="0200")
+        data = {
+            "doctor_id": other.id, "clinic": self.clinic.id, "day_of_week": self.day.id,
+            "valid_from": self.today.isoformat(), "clinic_slot_ids": f"[{self.slots[1].id}, {self.slots[2].id}]",
+        }
+        response = self.client.post("/doctor-schedule/add/", data, secure=True)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual([conflict["start"] for conflict in response.json()["conflicts"]], ["10:00"])
+
+        data["clinic_slot_ids"] = f"[{self.slots[2].id}]"
+        self.assertEqual(self.client.post("/doctor-schedule/add/", data, secure=True).status_code, 200)
+        # Editing a schedule does not conflict with its own slots.
+        data.update(doctor_id=self.doctor.id, clinic_slot_ids=f"[{self.slots[0].id}, {self.slots[1].id}]")
+        response = self.client.post(f"/doctor-schedule/update/{self.schedule.id}/", data, secure=True)
+        self.assertEqual(response.status_code, 200)
+
+
+class ScheduleConflictTests(FrontDeskDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.day = DaysOfWeek.objects.create(name="Monday")
+        self.other_clinic = Clinic.objects.create(name="Clinic 2", branch=self.branch)
+        self.other_doctor = Doctor.objects.create(full_name="Other", specialization=self.specialization, phone_number="0200")
+
+    def add_schedule(self, doctor, clinic, hours, **kwargs):
+        schedule = DoctorSchedule.objects.create(doctor=doctor, clinic=clinic, day_of_week=self.day, branch=self.branch, **kwargs)
+        schedule.clinic_slot.set([
+            ClinicSlot.objects.create(clinic=clinic, start_time=datetime.time(start, 0), end_time=datetime.time(end % 24, 0))
+            for start, end in hours
+        ])
+        return schedule
+
+    def test_interval_index_finds_every_overlap(self):
+        Interval = namedtuple("Interval", "start end")
+        intervals = [Interval(start, start + length) for start in range(0, 200, 7) for length in (3, 20)]
+        index = IntervalIndex(intervals)
+        for start, end in [(0, 1), (50, 60), (190, 400), (300, 310)]:
+            expected = sorted(i for i in intervals if i.start < end and i.end > start)
+            self.assertEqual(sorted(index.overlapping(start, end)), expected)
+
+    def test_doctor_and_clinic_double_booking(self):
+        self.add_schedule(self.doctor, self.clinic, [(9, 11)], valid_to=self.today + datetime.timedelta(days=10))
+        # Same doctor, other clinic, overlapping hours.
+        self.add_schedule(self.doctor, self.other_clinic, [(10, 12)])
+        # Other doctor, same clinic, but only valid after the first one ends.
+        self.add_schedule(self.other_doctor, self.clinic, [(9, 10)], valid_from=self.today + datetime.timedelta(days=30))
+        # Adjacent, past midnight: no conflict.
+        self.add_schedule(self.doctor, self.other_clinic, [(23, 24)])
+
+        conflicts = find_branch_conflicts(self.branch)
+        self.assertEqual([conflict.kind for conflict in conflicts], ["doctor"])
+
+        index = ScheduleConflictIndex.for_branch(self.branch)
+        slot = ClinicSlot.objects.create(clinic=self.clinic, start_time=datetime.time(10, 0), end_time=datetime.time(11, 0))
+        found = index.proposed_conflicts(self.other_doctor, self.clinic, self.day.id, [slot], self.today, self.today)
+        self.assertEqual([conflict.kind for conflict in found], ["clinic"])
+
+    def test_command_reports_conflicts(self):
+        self.add_schedule(self.doctor, self.clinic, [(9, 11)])
+        self.add_schedule(self.other_doctor, self.clinic, [(10, 11)])
+        out = StringIO()
+        call_command("validate_schedules", stdout=out)
+        self.assertIn("1 schedule conflicts found", out.getvalue())
+
+
+class SlotBookingTests(FrontDeskDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.slot = ClinicSlot.objects.create(
+            clinic=self.clinic, start_time=datetime.time(14, 0), end_time=datetime.time(15, 0), capacity=2,
+        )
+
+    def book(self, **kwargs):
+        values = {
+            "patient": self.patient, "doctor": self.doctor, "clinic": self.clinic, "status": self.open_status,
+            "service_type": "consultation", "date": self.today, "time": datetime.time(14, 30), "branch": self.branch,
+        }
+        values.update(kwargs)
+        return book_appointment(**values)
+
+    def booked(self):
+        return SlotBooking.objects.get(doctor=self.doctor, slot=self.slot, date=self.today).booked
+
+    def test_full_slot_is_rejected(self):
+        # Booked before the counter existed: the counter is seeded from it.
+        self.create_appointment()
+        self.book()
+        self.assertEqual(self.booked(), 2)
+        with self.assertRaises(SlotFull):
+            self.book()
+        self.assertEqual(Appointment.objects.count(), 2)
+        # Other times and doctors are not affected.
+        self.book(time=datetime.time(16, 0))
+        other = Doctor.objects.create(full_name="Other", specialization=self.specialization, phone_number="0200")
+        self.book(doctor=other)
+
+    def test_places_are_released(self):
+        first, second = self.book(), self.book()
+        first.status = Status.objects.create(name="CANCELLED")
+        first.save()
+        self.assertEqual(self.booked(), 1)
+        second.time = datetime.time(16, 0)
+        second.save()
+        self.assertEqual(self.booked(), 0)
+        second.time = datetime.time(14, 0)
+        second.save()
+        self.assertEqual(self.booked(), 1)
+        Appointment.objects.filter(id=second.id).soft_delete(self.user)
+        self.assertEqual(self.booked(), 0)
+        third = self.book()
+        third.delete()
+        self.assertEqual(self.booked(), 0)
+
+    def test_quick_create_reports_a_full_slot(self):
+        self.slot.capacity = 1
+        self.slot.save()
+        data = {
+            "patient_id": self.patient.id, "doctor_id": self.doctor.id, "clinic_id": self.clinic.id,
+            "date": self.today.isoformat(), "time": "14:15",
+        }
+        self.client.post("/appointments/quick-create", data, secure=True)
+        data.update(patient_id="", patient_phone="0222", patient_name="Second")
+        response = self.client.post("/appointments/quick-create", data, follow=True, secure=True)
+        self.assertEqual(Appointment.objects.count(), 1)
+        self.assertIn(SLOT_FULL_MESSAGE, [str(message) for message in response.context["messages"]])
+
+    def test_edits_cannot_overbook(self):
+        self.slot.capacity = 1
+        self.slot.save()
+        self.book()
+        moved = self.book(time=datetime.time(16, 0))
+        data = {
+            "id": moved.id, "patient_name": "Patient", "patient_phone": "0111", "patient_id": self.patient.id,
+            "doctor": self.doctor.id, "clinic": self.clinic.id, "status": "OPEN",
+            "date": self.today.strftime("%Y-%m-%d"), "time": "14:45",
+        }
+        response = self.client.post("/appointments/update-today", data, follow=True, secure=True)
+        self.assertIn(SLOT_FULL_MESSAGE, [str(message) for message in response.context["messages"]])
+        moved.refresh_from_db()
+        self.assertEqual((moved.time, self.booked()), (datetime.time(16, 0), 1))
+
+        cancelled = Status.objects.create(name="CANCELLED")
+        reopened = self.book(time=datetime.time(16, 0), status=cancelled)
+        reopened.time = datetime.time(14, 45)
+        reopened.save()
+        reopened.status = self.open_status
+        with self.assertRaises(SlotFull):
+            rebook_appointment(reopened)
+        self.assertEqual(self.booked(), 1)
+
+    def test_appointment_form_reports_a_full_slot(self):
+        self.slot.capacity = 1
+        self.slot.save()
+        self.book()
+        data = {
+            "patient": self.patient.id, "doctor": self.doctor.id, "clinic": self.clinic.id, "status": "OPEN",
+            "date": self.today.strftime("%Y-%m-%d"), "time": "14:45",
+        }
+        response = self.client.post("/add-appointment?type=new", data, follow=True, secure=True)
+        self.assertIn(SLOT_FULL_MESSAGE, [str(message) for message in response.context["messages"]])
+        self.assertEqual((Appointment.objects.count(), self.booked()), (1, 1))
+
+    def test_saves_that_keep_the_slot_do_not_look_it_up(self):
+        appointment = self.book()
+        appointment.ticket_number = 1
+        appointment.notes = "Checked in"
+        with CaptureQueriesContext(connection) as queries:
+            appointment.save()
+        self.assertFalse([q for q in queries.captured_queries if "clinicslot" in q["sql"].lower()])
+        self.assertEqual(self.booked(), 1)
+
+
+class BulkBookingTests(FrontDeskDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        day = DaysOfWeek.objects.create(name=DAY_NAMES_EN[self.today.weekday()])
+        self.slot = ClinicSlot.objects.create(
+            clinic=self.clinic, start_time=datetime.time(14, 0), end_time=datetime.time(15, 0), capacity=2,
+        )
+        schedule = DoctorSchedule.objects.create(
+            doctor=self.doctor, clinic=self.clinic, day_of_week=day, branch=self.branch, valid_from=self.today,
+        )
+        schedule.clinic_slot.set([self.slot])
+
+    def post(self, payload):
+        return self.client.post(
+            "/api/appointments/bulk", json.dumps(payload), content_type="application/json", secure=True,
+        ).json()
+
+    def recurrence(self, count):
+        return {
+            "template": {"patient_id": self.patient.id, "doctor_id": self.doctor.id, "clinic_id": self.clinic.id, "time": "14:00"},
+            "recurrence": {"start_date": self.today.isoformat(), "interval_days": 7, "count": count},
+        }
+
+    def test_recurring_series_in_constant_queries(self):
+        get_week_board(self.branch)
+        with CaptureQueriesContext(connection) as few:
+            response = self.post(self.recurrence(2))
+        self.assertEqual(response["booked"], 2)
+        Appointment.objects.all().delete()
+        SlotBooking.objects.all().delete()
+        with CaptureQueriesContext(connection) as many:
+            response = self.post(self.recurrence(12))
+        self.assertEqual(response["booked"], 12)
+        self.assertEqual(
+            [row.date for row in Appointment.objects.order_by("date")],
+            [self.today + datetime.timedelta(weeks=week) for week in range(12)],
+        )
+        # One conditional UPDATE per (doctor, slot, day) on top of a fixed number of reads and writes.
+        self.assertEqual(len(many) - len(few), 10)
+
+    def test_per_item_results(self):
+        other = Patient.objects.create(name="Other", phone_number="0222", branch=self.branch)
+        third = Patient.objects.create(name="Third", phone_number="0333", branch=self.branch)
+        item = {"doctor_id": self.doctor.id, "clinic_id": self.clinic.id, "date": self.today.isoformat(), "time": "14:30"}
+        response = self.post({"appointments": [
+            {**item, "patient_id": self.patient.id},
+            {**item, "patient_id": self.patient.id},
+            {**item, "patient_id": other.id, "time": "20:00"},
+            {**item, "patient_id": other.id},
+            {**item, "patient_id": third.id},
+            {**item, "patient_id": 0},
+            {**item, "patient_id": other.id, "date": "not a date"},
+        ]})
+        self.assertEqual(
+            [result.get("error") for result in response["results"]],
+            [None, "duplicate", "outside_schedule", None, "slot_full", "patient_not_found", "invalid"],
+        )
+        self.assertEqual(SlotBooking.objects.get(slot=self.slot, date=self.today).booked, 2)
+        self.assertEqual(Appointment.objects.count(), 2)
+
+
+class AppointmentIndexTests(FrontDeskDataMixin, TestCase):
+    """EXPLAIN the main Appointment query of each hot view on a seeded dataset."""
+
+    def setUp(self):
+        super().setUp()
+        other_branch = Branch.objects.create(address="Other Branch")
+        doctors = [self.doctor] + [
+            Doctor.objects.create(full_name=f"Doctor {i}", specialization=self.specialization, phone_number=f"020{i}")
+            for i in range(3)
+        ]
+        patients = [self.patient] + [
+            Patient.objects.create(name=f"Patient {i}", phone_number=f"030{i}", branch=self.branch) for i in range(5)
+        ]
+        Appointment.objects.bulk_create(
+            Appointment(
+                patient=patients[i % len(patients)], doctor=doctors[i % len(doctors)], clinic=self.clinic,
+                status=self.open_status, service_type="consultation", service_price=100,
+                date=self.today - datetime.timedelta(days=i % 60), time=datetime.time(9 + i % 12, 0),
+                branch=self.branch if i % 3 else other_branch,
+                deleted_date=timezone.now() if i % 5 == 0 else None,
+            )
+            for i in range(2000)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def assertUsesIndex(self, queryset):
+        plan = queryset.explain()
+        table = Appointment._meta.db_table
+        if connection.vendor == "postgresql":
+            self.assertNotIn(f"Seq Scan on {table}", plan)
+            self.assertIn("Index", plan)
+        else:
+            self.assertNotIn(f"SCAN {table}", plan)
+            self.assertRegex(plan, rf"SEARCH {table} USING (COVERING )?INDEX appt_")
+
+    def test_hot_view_queries_use_an_index(self):
+        live = Appointment.objects.filter(branch=self.branch, deleted_date__isnull=True)
+        week_start = self.today - datetime.timedelta(days=self.today.weekday())
+        queries = {
+            "today_appointments": live.filter(date=self.today).order_by("time"),
+            "dashboard": live.filter(date__gte=week_start, date__lte=week_start + datetime.timedelta(days=6)),
+            "quick_create_appointment": live.filter(
+                patient__phone_number=self.patient.phone_number, doctor=self.doctor, date=self.today,
+            ),
+            "doctor_details": live.filter(doctor=self.doctor).order_by("-date"),
+            "patient latest appointments": Appointment.objects.filter(
+                branch=self.branch, patient=self.patient,
+            ).order_by("-date"),
+        }
+        for view, queryset in queries.items():
+            with self.subTest(view=view):
+                self.assertUsesIndex(queryset)
+
+
+class LoadBenchmarkTests(TestCase):
+    def test_seeds_runs_every_view_and_deletes(self):
+        counts = seed_dataset(clinics=2, doctors=3, patients=20, appointments=150, days=0, batch_size=40)
+        self.assertEqual((counts["slots"], counts["schedules"], counts["appointments"]), (20, 21, 150))
+        branch = benchmark_branches().get()
+        self.assertEqual(find_branch_conflicts(branch), [])
+
+        due_today = Appointment.objects.filter(branch=branch, date=get_local_now().date()).count()
+        self.assertGreater(due_today, 0)
+        results = run_benchmarks(branch, repeat=2, warmup=1)
+        self.assertEqual(list(results), list(VIEWS))
+        for view, result in results.items():
+            with self.subTest(view=view):
+                self.assertLessEqual(result["p50_ms"], result["p95_ms"])
+                self.assertGreater(result["queries"], 0)
+                self.assertTrue(set(result["status_codes"]) <= {200, 302})
+        self.assertEqual(Appointment.objects.filter(branch=branch, status__name="ARRIVED").count(), min(due_today, 3))
+
+        self.assertEqual(delete_dataset(), 1)
+        self.assertFalse(Appointment.all_objects.exists())
+        self.assertFalse(benchmark_branches().exists())
+
+    def test_seeded_invoices_are_numbered_by_the_daily_counter(self):
+        seed_dataset(clinics=1, doctors=2, patients=10, appointments=60, days=5, batch_size=25)
+        counters = dict(InvoiceCounter.objects.values_list("date", "last_number"))
+        numbers = {}
+        for invoice_date, number in Invoice.objects.values_list("invoice_date", "invoice_number"):
+            numbers.setdefault(invoice_date, []).append(number)
+        self.assertTrue(numbers)
+        for invoice_date, dated in numbers.items():
+            self.assertEqual(sorted(dated), list(range(1, counters[invoice_date] + 1)))
+
+
+@override_settings(QUERY_MONITOR_SAMPLE_RATE=1, QUERY_MONITOR_N_PLUS_ONE_THRESHOLD=3)
+class QueryMonitorTests(FrontDeskDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        reset_query_stats()
+
+    def test_fingerprint_collapses_literals_and_in_lists(self):
+        self.assertEqual(
+            fingerprint('SELECT "a"."id" FROM "a" WHERE "a"."id" IN (%s, %s, %s) AND "a"."name" = \'x\' LIMIT 21'),
+            fingerprint('SELECT "a"."id" FROM "a" WHERE "a"."id" IN (%s) AND "a"."name" = \'y\'  LIMIT 5'),
+        )
+
+    def test_records_sampled_requests_per_url_name(self):
+        self.client.get("/appointments/today", secure=True)
+        self.client.get("/appointments/today", secure=True)
+        stats = get_query_stats()["appointments-today"]
+        self.assertEqual(stats["requests"], 2)
+        self.assertGreater(stats["queries"], 0)
+        self.assertEqual(stats["window"]["requests"], 2)
+
+    def test_flags_repeated_statements(self):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for patient_id in range(5):
+                Patient.objects.filter(id=patient_id).first()
+        self.assertEqual(recorder.most_repeated()[1], 5)
+        with self.assertLogs("app.query_monitor", "WARNING") as logs:
+            self.assertTrue(record_request("patient-details", 0.01, recorder))
+        self.assertIn("Possible N+1 in patient-details: 5 of 5 queries", logs.output[0])
+        self.assertEqual(get_query_stats()["patient-details"]["n_plus_one"], 1)
+
+
+class MetricsTests(FrontDeskDataMixin, TestCase):
+    SAMPLE = re.compile(
+        r'^[a-zA-Z_:][a-zA-Z0-9_:]*'
+        r'(\{[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\\n]|\\.)*"(,[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\\n]|\\.)*")*\})?'
+        r' -?[0-9.e+-]+$'
+    )
+
+    def setUp(self):
+        super().setUp()
+        metrics.store.reset()
+
+    def scrape(self, **headers):
+        headers.setdefault("HTTP_AUTHORIZATION", "Bearer secret")
+        with self.settings(METRICS_TOKEN="secret"):
+            return self.client.get("/metrics", secure=True, **headers)
+
+    def test_scrape_is_valid_exposition_format(self):
+        PrintJob.objects.create(appointment=self.create_appointment(), ticket_number="1")
+        self.client.get("/appointments/today", secure=True)
+        self.client.get("/", secure=True)
+        response = self.scrape()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+
+        body = response.content.decode()
+        buckets = {}
+        for line in body.splitlines():
+            if line.startswith("#"):
+                self.assertRegex(line, r"^# (HELP|TYPE) [a-zA-Z_:][a-zA-Z0-9_:]* .+$")
+                continue
+            self.assertRegex(line, self.SAMPLE)
+            if "_bucket{" in line:
+                series = re.sub(r',?le="[^"]*"', "", line.rsplit(" ", 1)[0])
+                count = float(line.rsplit(" ", 1)[1])
+                self.assertGreaterEqual(count, buckets.get(series, 0))  # cumulative
+                buckets[series] = count
+        self.assertIn(
+            'clinic_http_request_duration_seconds_count{status="200",view="appointments-today"} 1', body,
+        )
+        self.assertIn(f'clinic_print_jobs{{branch="{self.branch.id}",state="pending"}} 1', body)
+        self.assertIn('clinic_cache_hit_ratio{cache="dashboard_metrics"} 0', body)
+        self.assertRegex(body, r'clinic_db_queries_total\{view="appointments-today"\} [1-9]')
+
+    def test_token_guards_the_endpoint(self):
+        self.assertEqual(self.scrape().status_code, 200)
+        self.assertEqual(self.scrape(HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+        # Without a token the endpoint is closed, even to local clients.
+        with self.settings(METRICS_TOKEN=None):
+            self.assertEqual(self.client.get("/metrics", secure=True, REMOTE_ADDR="127.0.0.1").status_code, 403)
+
+    def test_sums_the_files_of_every_worker(self):
+        with tempfile.TemporaryDirectory() as directory, self.settings(METRICS_DIR=directory):
+            metrics.store.inc("clinic_db_queries_total", 3, view="dashboard")
+            with open(f"{directory}/1.json", "w") as other_worker:
+                json.dump({"counters": [["clinic_db_queries_total", [["view", "dashboard"]], 4]], "histograms": []},
+                          other_worker)
+            self.assertIn('clinic_db_queries_total{view="dashboard"} 7', metrics.render_metrics())
+
+
+@override_settings(
+    SLOW_QUERY_THRESHOLD_MS=0, SLOW_QUERY_BACKGROUND=False, SLOW_QUERY_MAX_ROWS=5, SLOW_QUERY_EXPLAIN_SAMPLE_RATE=0,
+)
+class SlowQueryTests(FrontDeskDataMixin, TestCase):
+    def test_captures_statements_with_caller_and_plan(self):
+        self.create_appointment()
+        self.client.get("/appointments/today", secure=True)
+        captures = list(SlowQuery.objects.all())
+        self.assertEqual(len(captures), 5)  # capped
+        today = [capture for capture in captures if capture.view == "appointments-today"]
+        self.assertTrue(today)
+        self.assertTrue(all(capture.caller.startswith("app") for capture in today))
+        explained = [capture for capture in today if capture.plan]
+        self.assertTrue(explained)
+        self.assertTrue(all(capture.sql.startswith("SELECT") for capture in explained))
+        self.assertIsInstance(json.loads(explained[0].plan), list)
+
+    def test_parameters_are_kept_only_when_enabled_and_never_for_sessions(self):
+        self.create_appointment()
+        self.client.get("/appointments/today", secure=True)
+        self.assertFalse(SlowQuery.objects.exclude(params="").exists())
+
+        SlowQuery.objects.all().delete()
+        with self.settings(SLOW_QUERY_STORE_PARAMS=True):
+            self.client.get("/appointments/today", secure=True)
+        self.assertTrue(SlowQuery.objects.exclude(params="").exists())
+        self.assertFalse(SlowQuery.objects.filter(sql__contains="django_session").exclude(params="").exists())
+
+    def test_page_is_superuser_only(self):
+        SlowQuery.objects.create(digest="x", sql="SELECT 'marker'", duration_ms=900, view="dashboard")
+        self.assertEqual(self.client.get("/monitoring/slow-queries", secure=True).status_code, 403)
+
+        admin = User.objects.create_superuser(username="admin", password="x", branch=self.branch)
+        self.client.force_login(admin)
+        response = self.client.get("/monitoring/slow-queries", secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "SELECT &#x27;marker&#x27;")
+
+
+class ProfilingTests(FrontDeskDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.enterContext(self.settings(PROFILE_DIR=directory, PROFILE_MAX_FILES=2, PROFILE_SAMPLING=False))
+
+    def test_manager_flag_saves_a_pstats_capture(self):
+        response = self.client.get("/appointments/today?_profile=1", secure=True)
+        self.assertEqual(response.status_code, 200)
+        [capture] = list_captures()
+        self.assertEqual(response["X-Profile-Id"], capture["name"])
+        self.assertEqual((capture["view"], capture["user"], capture["profiler"]), ("appointments-today", "secretary", "cProfile"))
+        self.assertTrue(any("today_appointments" in row["function"] for row in capture["top"]))
+
+        download = self.client.get(f"/monitoring/profiles/{capture['name']}", secure=True)
+        with tempfile.NamedTemporaryFile(suffix=".prof") as output:
+            output.write(b"".join(download.streaming_content))
+            output.flush()
+            self.assertGreater(pstats.Stats(output.name).total_calls, 0)
+        self.assertContains(self.client.get("/monitoring/profiles", secure=True), capture["name"])
+
+    def test_keeps_the_newest_captures(self):
+        names = [self.client.get("/", secure=True, HTTP_X_PROFILE="1")["X-Profile-Id"] for _ in range(3)]
+        self.assertEqual([capture["name"] for capture in list_captures()], names[:0:-1])
+
+    def test_ignored_without_flag_or_for_other_users(self):
+        self.assertNotIn("X-Profile-Id", self.client.get("/", secure=True))
+        self.client.force_login(User.objects.create_user(username="desk", password="x", branch=self.branch))
+        self.assertNotIn("X-Profile-Id", self.client.get("/?_profile=1", secure=True))
+        self.assertEqual(list_captures(), [])
+        self.assertEqual(self.client.get("/monitoring/profiles", secure=True).status_code, 403)
@@ -1,6 +1,6 @@
 from django.urls import path, include
 
-from .com import auth, dashboard ,patient ,appointment,doctors,users,printing
+from .com import auth, dashboard ,patient ,appointment,doctors,users,printing,monitoring
 from rest_framework.routers import DefaultRouter
 
 urlpatterns = [
@@ -49,6 +49,7 @@ urlpatterns = [
     path('appointments/delete-today', appointment.delete_today_appointment, name='appointments-delete-today'),
     path('appointments/quick-create', appointment.quick_create_appointment, name='appointments-quick-create'),
     path('api-/new-appointment', appointment.new_appointment_api, name='api_new_appointment'),
+    path('api/appointments/bulk', appointment.bulk_appointments_api, name='api_bulk_appointments'),
     path('api/clinics/<int:clinic_id>/time-slots/', appointment.get_clinic_time_slots, name='get_clinic_time_slots'),
     path('api/clinics/<int:clinic_id>/schedule/', appointment.get_clinic_schedule, name='get_clinic_schedule'),
     path('api/get-doctors-by-specialization', appointment.api_get_doctors_by_specialization, name='api_get_doctors_by_specialization'),
@@ -57,5 +58,13 @@ urlpatterns = [
     
     path('print-display/', printing.print_display, name='print_display'),
     path('print-jobs/pending/', printing.print_jobs_pending, name='print_jobs_pending'),
+    path('print-jobs/wait/', printing.print_jobs_wait, name='print_jobs_wait'),
+    path('print-jobs/claim/', printing.claim_print_jobs_view, name='print_jobs_claim'),
+    path('print-jobs/ack/', printing.acknowledge_print_jobs_view, name='print_jobs_ack'),
     path('print-jobs/<int:job_id>/complete/', printing.mark_print_job_done, name='print_job_complete'),
+
+    path('metrics', monitoring.metrics, name='metrics'),
+    path('monitoring/slow-queries', monitoring.slow_queries, name='slow-queries'),
+    path('monitoring/profiles', monitoring.profiles, name='profiles'),
+    path('monitoring/profiles/<str:name>', monitoring.download_profile, name='download-profile'),
 ]
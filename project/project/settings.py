@@ -44,6 +44,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'app.middleware.MetricsMiddleware',
+    'app.middleware.QueryMonitorMiddleware',
+    'app.middleware.SlowQueryMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -51,6 +54,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     "whitenoise.middleware.WhiteNoiseMiddleware",
+    'app.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'project.urls'
@@ -102,6 +106,46 @@ else:  # running locally
     }
 print("DEBUG DATABASE URL:", DATABASES["default"])
 
+# Cache
+# Any backend works for the schedule board cache (app.schedule_cache). The
+# local-memory backend is per process: when running several gunicorn workers,
+# point CACHES at a shared backend (Redis, Memcached, database) so that
+# invalidations reach every worker.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    }
+}
+SCHEDULE_BOARD_CACHE_ALIAS = 'default'
+SCHEDULE_BOARD_CACHE_TIMEOUT = 5 * 60
+DASHBOARD_METRICS_CACHE_ALIAS = 'default'
+DASHBOARD_METRICS_CACHE_TIMEOUT = 60     # dropped early when stats or invoices change
+DATATABLES_TOTAL_CACHE_TIMEOUT = 5 * 60   # unfiltered list totals; dropped on add/delete
+DATATABLES_ESTIMATE_THRESHOLD = 100000    # PostgreSQL: use the planner estimate above this many rows
+DATATABLES_MAX_LENGTH = 500
+BULK_APPOINTMENTS_MAX = 200               # items per bulk booking request
+QUERY_MONITOR_SAMPLE_RATE = 0.1           # share of requests app.query_monitor records; 0 disables it
+QUERY_MONITOR_N_PLUS_ONE_THRESHOLD = 10   # repeats of one statement that flag a request as N+1
+QUERY_MONITOR_WINDOW = 500                # recent requests kept per URL name
+
+# Metrics (app.metrics, scraped at /metrics). With several gunicorn workers
+# (WEB_CONCURRENCY > 1) set METRICS_DIR to a directory every worker can write
+# and empty it when the server restarts; unset, each worker reports only itself.
+METRICS_ENABLED = True
+METRICS_DIR = os.getenv('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = 5                # seconds between a worker's metric file writes
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')  # bearer token for /metrics; unset: endpoint disabled
+SLOW_QUERY_THRESHOLD_MS = 500             # statements slower than this are recorded; None disables it
+SLOW_QUERY_EXPLAIN_SAMPLE_RATE = 0.2      # share explained, besides the first capture of each statement
+SLOW_QUERY_MAX_ROWS = 1000                # SlowQuery rows kept, newest first
+SLOW_QUERY_BACKGROUND = True              # explain and store from a background thread
+SLOW_QUERY_STORE_PARAMS = False           # keep bound parameters (never for session and user tables)
+PROFILING_ENABLED = True                  # managers profile a request with X-Profile: 1 or ?_profile=1
+PROFILE_SAMPLING = True                   # use pyinstrument instead of cProfile when it is installed
+PROFILE_DIR = os.getenv('PROFILE_DIR', str(BASE_DIR / 'profiles'))
+PROFILE_MAX_FILES = 50                    # newest captures kept in PROFILE_DIR
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -158,6 +202,8 @@ CHAR_50   = 50
 CHAR_100  = 100
 
 key_hashing = b'53P8Le_9WLNK2d6ezPPL9xMvM7dLEcGyk54wuWRjzZw='
+HASH_ID_CODEC = 'signed'          # 'signed' (deterministic) or 'fernet' (randomized, legacy)
+HASH_ID_CACHE_SIZE = 65536
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
@@ -184,6 +230,14 @@ PRINTER_CONFIG = {
     'usb_interface': 0,
 }
 
+# Print job long-polling (app.print_queue). Each waiting print display holds a
+# worker thread for up to PRINT_JOBS_WAIT_TIMEOUT seconds.
+PRINT_JOBS_WAIT_TIMEOUT = 25
+PRINT_JOBS_BATCH_LIMIT = 50
+PRINT_JOBS_RECHECK_INTERVAL = 2
+PRINT_JOBS_LEASE_SECONDS = 60          # unacknowledged leased jobs are re-queued after this
+PRINT_JOBS_MAX_LEASE_SECONDS = 3600    # upper bound for lease_seconds asked by print agents
+
 # Add this to your settings.py
 CSRF_TRUSTED_ORIGINS = [
     'https://cms-production-6742.up.railway.app',